@@ -0,0 +1,111 @@
+# JSONC CST editor and config loader: edits must leave every untouched byte alone
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from waybar_core import ConfigLoader, parse_jsonc
+
+CONFIG = """{
+    "layer": "top",
+    "modules-left": [
+        "clock", // hora
+        // "cpu", // carga
+        "memory" // ram
+    ],
+    "clock": {"format": "{:%H}"}
+}
+"""
+
+def set_zone(src, key, entries, bar=0):
+    ed = parse_jsonc(src).edit()
+    ed.set_zone(key, entries, bar)
+    return ed.text()
+
+class JsoncDocumentTest(unittest.TestCase):
+    def test_zone_index_sees_commented_entries(self):
+        doc = parse_jsonc(CONFIG)
+        self.assertEqual(doc.zone("modules-left"),
+                         [("clock", True), ("cpu", False), ("memory", True)])
+        self.assertIsNone(doc.zone("modules-right"))
+        self.assertEqual(list(doc.definitions()), ["clock"])
+
+    def test_unchanged_zone_is_a_noop(self):
+        ed = parse_jsonc(CONFIG).edit()
+        ed.set_zone("modules-left", [("clock", True), ("cpu", False), ("memory", True)])
+        self.assertFalse(ed.changed())
+        self.assertEqual(ed.text(), CONFIG)
+
+class SetZoneTest(unittest.TestCase):
+    def test_enable_keeps_trailing_comments(self):
+        out = set_zone(CONFIG, "modules-left", [("clock", True), ("cpu", True), ("memory", True)])
+        self.assertEqual(out, CONFIG.replace('// "cpu", // carga', '"cpu", // carga'))
+
+    def test_disable_keeps_trailing_comments(self):
+        out = set_zone(CONFIG, "modules-left", [("clock", True), ("cpu", False), ("memory", False)])
+        self.assertEqual(out, CONFIG.replace('"clock", // hora', '"clock" // hora')
+                                    .replace('"memory" // ram', '// "memory", // ram'))
+
+    def test_reorder_moves_comments_with_their_entry(self):
+        out = set_zone(CONFIG, "modules-left", [("memory", True), ("clock", True), ("cpu", False)])
+        self.assertEqual(out, CONFIG.replace(
+            '        "clock", // hora\n        // "cpu", // carga\n        "memory" // ram\n',
+            '        "memory", // ram\n        "clock" // hora\n        // "cpu", // carga\n'))
+
+    def test_inline_array_becomes_multiline_at_key_indent(self):
+        src = '{\n    "layer": "top",\n    "modules-left": ["clock", "cpu"]\n}\n'
+        out = set_zone(src, "modules-left", [("clock", True), ("cpu", False)])
+        self.assertEqual(out, '{\n    "layer": "top",\n    "modules-left": [\n'
+                              '        "clock"\n        // "cpu",\n    ]\n}\n')
+
+    def test_new_zone_in_inline_object_stays_inline(self):
+        out = set_zone('{"output": "DP-1", "layer": "top"}\n', "modules-left", [("clock", True)])
+        self.assertEqual(out, '{"modules-left": ["clock"], "output": "DP-1", "layer": "top"}\n')
+
+    def test_new_zone_in_multiline_object_uses_sibling_indent(self):
+        out = set_zone('{\n\t"layer": "top"\n}\n', "modules-right", [("clock", True)])
+        self.assertEqual(out, '{\n\t"modules-right": ["clock"],\n\t"layer": "top"\n}\n')
+
+    def test_set_value_touches_only_the_value(self):
+        ed = parse_jsonc(CONFIG).edit()
+        ed.set_value("layer", "bottom")
+        self.assertEqual(ed.text(), CONFIG.replace('"top"', '"bottom"'))
+
+class ConfigLoaderTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name, text):
+        path = self.dir / name
+        path.write_text(text)
+        return path
+
+    def test_bars_merge_includes_with_main_file_winning(self):
+        self.write("common.jsonc", '{"position": "bottom", "height": 30, "include": "config"}')
+        main = self.write("config", '[{"include": "common.jsonc", "position": "top"},'
+                                    ' {"output": "HDMI-A-1"}]')
+        bars = ConfigLoader().load(main)
+        self.assertEqual(len(bars), 2)
+        self.assertEqual(bars[0].config, {"position": "top", "height": 30})
+        self.assertEqual(bars[0].sources["height"][0], (self.dir / "common.jsonc").resolve())
+        self.assertEqual(bars[1].config, {"output": "HDMI-A-1"})
+
+    def test_merged_bars_are_reused_until_a_file_changes(self):
+        inc = self.write("common.jsonc", '{"height": 30}')
+        main = self.write("config", '{"include": ["common.jsonc"]}')
+        loader = ConfigLoader()
+        first = loader.load(main)
+        self.assertIs(loader.load(main), first)
+        inc.write_text('{"height": 40}')
+        st = inc.stat()
+        os.utime(inc, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        self.assertEqual(loader.load(main)[0].config["height"], 40)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+# Waybar reload engine against a stand-in bar (no compositor needed)
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from waybar_core import WaybarReloader
+
+# Recarga "de verdad": trabaja un rato (R) y recién después deja el log
+STAND_IN = """#!/bin/bash
+trap 'i=0; while ((i < 60000)); do ((i++)); done; echo reload >> "$0.log"' USR2
+trap 'exit 0' TERM
+while :; do sleep 1000 & wait $!; done
+"""
+
+def fake_proc_entry(root: Path, pid: int, comm: str, argv, state="S", switches=0):
+    d = root / str(pid)
+    d.mkdir(exist_ok=True)
+    (d / "comm").write_text(comm + "\n")
+    (d / "cmdline").write_bytes(b"\0".join(a.encode() for a in argv) + b"\0")
+    (d / "stat").write_text(f"{pid} ({comm}) {state} 1 {pid} {pid} 0 -1\n")
+    (d / "status").write_text(f"Name:\t{comm}\nvoluntary_ctxt_switches:\t{switches}\n"
+                              "nonvoluntary_ctxt_switches:\t0\n")
+
+@unittest.skipUnless(Path("/proc/self/status").exists(), "needs Linux /proc")
+class WaybarReloaderTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.name = f"fakebar{os.getpid()}"[:15]     # comm se trunca a 15
+        self.script = self.tmp / self.name
+        self.script.write_text(STAND_IN)
+        self.script.chmod(0o755)
+        self.log = Path(f"{self.script}.log")
+        self.procs = []
+        self.reloaders = []
+
+    def tearDown(self):
+        self.procs += [r.child for r in self.reloaders if r.child and r.child not in self.procs]
+        for p in self.procs:
+            try:
+                os.killpg(p.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            p.wait()
+
+    def start_stand_in(self):
+        p = subprocess.Popen([str(self.script)], start_new_session=True)
+        self.procs.append(p)
+        return p
+
+    def reloader(self, **kw):
+        kw.setdefault("timeout", 5.0)
+        r = WaybarReloader(name=self.name, command=[str(self.script)], **kw)
+        self.reloaders.append(r)
+        return r
+
+    def test_pids_from_fake_proc(self):
+        proc = self.tmp / "proc"
+        proc.mkdir()
+        fake_proc_entry(proc, 100, "waybar", ["/usr/bin/waybar", "-c", "x"])
+        fake_proc_entry(proc, 101, "python3", ["python3", "/opt/waybar"])
+        fake_proc_entry(proc, 102, "waybar", ["waybar"], state="Z")
+        fake_proc_entry(proc, 103, "vim", ["vim", "waybar"])
+        (proc / "self").mkdir()
+        self.assertEqual(WaybarReloader(proc=proc).pids(), [100, 101])
+
+    def test_sleeping_bar_is_not_ready_until_it_wakes_up(self):
+        # Tras SIGUSR2 la barra sigue "S" hasta que el kernel la despierta
+        proc = self.tmp / "proc"
+        proc.mkdir()
+        fake_proc_entry(proc, 200, "waybar", ["waybar"], switches=5)
+        r = WaybarReloader(proc=proc, timeout=2.0, settle=0.05)
+        wake = threading.Timer(0.3, fake_proc_entry, (proc, 200, "waybar", ["waybar"], "S", 9))
+        t0 = time.monotonic()
+        wake.start()
+        self.assertTrue(r._ready(200, since=5))
+        self.assertGreaterEqual(time.monotonic() - t0, 0.3)
+        r.timeout = 0.2
+        self.assertFalse(r._ready(200, since=9))     # nunca despertó: no está listo
+
+    def test_nothing_changed_is_noop_even_without_a_bar(self):
+        r = self.reloader()
+        self.assertEqual(r.pids(), [])
+        self.assertEqual(r.reload(config_changed=False, style_changed=False), "noop")
+        self.assertEqual(r.reload(False, True, style_autoreload=True), "noop")
+        self.assertEqual(r.pids(), [])
+
+    def test_signal_waits_until_reload_is_done(self):
+        p = self.start_stand_in()
+        r = self.reloader()
+        self.assertTrue(r._wait(lambda: r.pids() == [p.pid]))
+        self.assertTrue(r._ready(p.pid))
+        self.assertEqual(r.reload(config_changed=True), "signaled")
+        self.assertEqual(self.log.read_text().split(), ["reload"])
+        self.assertEqual(r.pids(), [p.pid])     # la misma barra, sin respawn
+
+    def test_respawn_when_no_bar_is_running(self):
+        r = self.reloader()
+        self.assertEqual(r.reload(config_changed=True), "respawned")
+        self.assertEqual(r.pids(), [r.child.pid])
+
+    def test_busy_bar_is_signalled_not_respawned(self):
+        # Hilos que nunca se quedan quietos: la señal llegó, no se reinicia
+        p = self.start_stand_in()
+        self.assertTrue(self.reloader()._ready(p.pid))     # trap ya instalado
+        proc = self.tmp / "proc"
+        proc.mkdir()
+        fake_proc_entry(proc, p.pid, self.name, [str(self.script)], state="R")
+        r = self.reloader(proc=proc, timeout=0.3)
+        self.assertEqual(r.reload(config_changed=True), "unconfirmed")
+        self.assertIsNone(r.child)
+        r.timeout = 5.0
+        self.assertTrue(r._wait(lambda: self.log.exists()))
+        self.assertIsNone(p.poll())
+
+    def test_respawned_bar_that_never_settles_is_not_a_failure(self):
+        self.script.write_text("#!/bin/bash\nwhile :; do :; done\n")
+        r = self.reloader(timeout=0.3)
+        self.assertEqual(r.reload(config_changed=True), "respawned")
+        self.assertIsNone(r.child.poll())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+# Stylesheet model: parse/serialize round-trip and in-place edits
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from waybar_core import BUILTIN_THEMES, Stylesheet, StylesheetCache, factor_palette, recolor
+
+CSS = """/* tema */
+@define-color accent #ff0000;
+#clock, #cpu { color: @accent; padding: 0 4px; }
+#clock {
+    background-color: #000000; /* fondo */
+}
+"""
+
+class StylesheetTest(unittest.TestCase):
+    def test_round_trip_is_byte_for_byte(self):
+        for text in (CSS, "", "#a{color:red}", "@import 'colors.css';\r\n#a { }\n"):
+            self.assertEqual(Stylesheet(text).serialize(), text)
+
+    def test_cascade_and_defines(self):
+        sheet = Stylesheet(CSS)
+        self.assertEqual(sheet.get("#cpu", "color"), "@accent")
+        self.assertEqual(sheet.get("#clock", "background-color"), "#000000")
+        self.assertEqual(sheet.define("accent"), "#ff0000")
+
+    def test_setting_the_resolved_value_is_a_noop(self):
+        sheet = Stylesheet(CSS)
+        self.assertFalse(sheet.set("#cpu", "color", "#f00"))
+        self.assertFalse(sheet.set("#clock", "color", "red"))
+        self.assertFalse(sheet.set("#clock", "padding", "0  4px"))
+        self.assertFalse(sheet.set(None, "@accent", "rgb(255, 0, 0)"))
+        self.assertFalse(sheet.modified)
+        self.assertEqual(sheet.serialize(), CSS)
+
+    def test_set_edits_values_in_place(self):
+        sheet = Stylesheet(CSS)
+        self.assertTrue(sheet.set("#clock", "background-color", "#111111"))
+        self.assertTrue(sheet.set(None, "@accent", "#00ff00"))
+        self.assertEqual(sheet.serialize(), CSS.replace("#000000", "#111111")
+                                               .replace("#ff0000", "#00ff00"))
+
+    def test_new_properties_and_rules_are_appended(self):
+        sheet = Stylesheet(CSS)
+        sheet.set("#clock", "color", "#ffffff")
+        sheet.set("#battery", "color", "#fff")
+        self.assertEqual(sheet.serialize(), CSS.replace(
+            "/* fondo */\n", "/* fondo */\n  color: #ffffff;\n") + "\n#battery {\n  color: #fff;\n}\n")
+
+    def test_set_writes_to_the_imported_file_that_owns_the_value(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            colors = Path(tmp) / "colors.css"
+            colors.write_text("@define-color bg #000000;\n#clock { color: #ffffff; }\n")
+            sheet = Stylesheet('@import "colors.css";\n#cpu { color: @bg; }\n')
+            sheet.attach_imports(Path(tmp) / "style.css", StylesheetCache())
+            child = sheet.imported[0][1]
+            self.assertTrue(sheet.set(None, "@bg", "#222222"))
+            self.assertTrue(sheet.set("#clock", "color", "#eeeeee"))
+            self.assertFalse(sheet.modified)
+            self.assertEqual(child.serialize(), "@define-color bg #222222;\n#clock { color: #eeeeee; }\n")
+
+class PaletteTest(unittest.TestCase):
+    def test_new_defines_go_on_their_own_lines(self):
+        sheet = Stylesheet("/* theme */\n#a { color: red; }\n")
+        sheet.set_define("accent", "#f00")
+        self.assertEqual(sheet.serialize(), "@define-color accent #f00;\n/* theme */\n#a { color: red; }\n")
+        sheet = Stylesheet('@import "colors.css";\n#a { color: red; }\n')
+        sheet.set_define("accent", "#f00")
+        sheet.set_define("bg", "#000")
+        self.assertEqual(sheet.serialize(), '@import "colors.css";\n@define-color accent #f00;\n'
+                                            '@define-color bg #000;\n\n#a { color: red; }\n')
+
+    def test_factor_palette_on_a_sheet_starting_with_a_rule(self):
+        sheet = Stylesheet("#clock { color: #025939; }\n#cpu { color: #025939; }\n")
+        self.assertEqual(factor_palette(sheet), {"fg": "#025939"})
+        self.assertEqual(sheet.serialize(), "@define-color fg #025939;\n"
+                                            "#clock { color: @fg; }\n#cpu { color: @fg; }\n")
+
+    def test_alpha_reaches_defines_used_as_backgrounds(self):
+        sheet = Stylesheet("@define-color base #000000;\n@define-color bg @base;\n"
+                           "@define-color fg #ffffff;\n"
+                           "#clock { background-color: @bg; color: @fg; }\n")
+        self.assertEqual(recolor(sheet, alpha=0.5), 1)
+        self.assertEqual(sheet.define("base"), "rgba(0, 0, 0, 0.50)")
+        self.assertEqual(sheet.define("fg"), "#ffffff")
+        for css in BUILTIN_THEMES.values():
+            self.assertGreater(recolor(Stylesheet(css), alpha=0.4), 0)
+
+if __name__ == "__main__":
+    unittest.main()
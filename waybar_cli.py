@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# Waybar Configurator – headless CLI
+# Author: veitorman
+# Same core as the GUI (waybar_core) but never imports GTK, so it starts in
+# tens of milliseconds and works from keybinds, scripts and SSH sessions.
+#
+#   waybar-configurator theme list
+#   waybar-configurator theme apply "Dark Emerald" --reload
+#   waybar-configurator style clock --bg "#1f2937" --alpha 0.8 --radius 12 --text "#ffffff"
+#   waybar-configurator style hyprland/workspaces --target active --bg "#10b981"
+#   waybar-configurator module disable custom/spotify
+#   waybar-configurator module enable tray --zone right
+#   waybar-configurator recolor --hue 30 --lightness -0.1 --alpha 0.8 | contrast
+#   waybar-configurator palette convert | palette set accent "#10b981" | palette list
+#   waybar-configurator export [out.zip] | import theme.zip | reload
+
+import argparse
+import sys
+from pathlib import Path
+
+import waybar_core as core
+
+def _fail(msg: str) -> int:
+    print(f"waybar-configurator: {msg}", file=sys.stderr)
+    return 1
+
+def _bar(args):
+    bars = core.CONFIG_LOADER.load(core.CONFIG_JSONC)
+    if args.bar >= len(bars):
+        return None, bars
+    return bars[args.bar], bars
+
+def _reload(args, config_changed: bool, style_changed: bool) -> int:
+    if not args.reload:
+        return 0
+    bar, _bars = _bar(args)
+    result = core.restart_waybar(config_changed, style_changed, bar.config if bar else None)
+    print(f"waybar: {result}")
+    return 1 if result == "failed" else 0
+
+def _report(changed) -> None:
+    if changed:
+        print("saved: " + ", ".join(Path(p).name for p in changed))
+    else:
+        print("nothing changed")
+
+def _saved(args, changed) -> None:
+    """Report a mutating command's writes; main() snapshots only when there are any."""
+    args.changed = changed
+    _report(changed)
+
+# ----- theme -----
+def cmd_theme_list(args) -> int:
+    for name, kind in core.list_themes():
+        print(f"{kind:8} {name}")
+    return 0
+
+def cmd_theme_apply(args) -> int:
+    css = core.find_theme(args.name)
+    if css is None:
+        return _fail(f"theme not found: {args.name}")
+    core.ensure_backup()
+    changed = [core.STYLE_CSS] if core.write_text(core.STYLE_CSS, css) else []
+    _saved(args, changed)
+    return _reload(args, False, bool(changed))
+
+# ----- style -----
+def cmd_style(args) -> int:
+    sheet = core.STYLESHEETS.load(core.STYLE_CSS)
+    try:
+        edits = core.module_style_edits(sheet, args.module, args.target, args.bg,
+                                        args.alpha, args.radius, args.text)
+    except ValueError as e:
+        return _fail(f"invalid color: {e}")
+    if not edits:
+        return _fail("nothing to set (use --bg, --alpha, --radius or --text)")
+    core.ensure_backup()
+    sheet.update(edits)
+    changed = core.STYLESHEETS.save_graph(core.STYLE_CSS, sheet)
+    _saved(args, changed)
+    return _reload(args, False, bool(changed))
+
+# ----- colors -----
+def _theme_modules(args, sheet) -> list:
+    bar, _bars = _bar(args)
+    zones = core.current_zones(bar) if bar else {}
+    names = [n for zone in zones.values() for n, active in zone if active]
+    return list(dict.fromkeys(names + core.extract_css_ids(sheet)))
+
+def cmd_recolor(args) -> int:
+    if not (args.hue or args.saturation or args.lightness or args.alpha is not None):
+        return _fail("nothing to do (use --hue, --saturation, --lightness or --alpha)")
+    sheet = core.STYLESHEETS.load(core.STYLE_CSS)
+    core.ensure_backup()
+    core.recolor(sheet, args.hue, args.saturation, args.lightness, args.alpha)
+    changed = core.STYLESHEETS.save_graph(core.STYLE_CSS, sheet)
+    _saved(args, changed)
+    return _reload(args, False, bool(changed))
+
+def cmd_contrast(args) -> int:
+    sheet = core.STYLESHEETS.load(core.STYLE_CSS)
+    report = core.contrast_report(sheet, _theme_modules(args, sheet))
+    for r in report:
+        name = r["module"] + (f" ({r['target']})" if r["target"] else "")
+        print(f"{'ok ' if r['ok'] else 'LOW'} {r['ratio']:5.2f}  {r['fg']} on {r['bg']}  {name}")
+    return 0 if all(r["ok"] for r in report) else 1
+
+def cmd_palette_list(args) -> int:
+    sheet = core.STYLESHEETS.load(core.STYLE_CSS)
+    for name, owner in sheet.symbols().items():
+        where = next((p.name for p, imp in sheet.imported if imp is owner), core.STYLE_CSS.name)
+        print(f"@{name:16} {sheet.define(name):28} {where}")
+    return 0
+
+def cmd_palette_set(args) -> int:
+    if core.parse_css_color(args.color) is None:
+        return _fail(f"invalid color: {args.color}")
+    sheet = core.STYLESHEETS.load(core.STYLE_CSS)
+    name = args.name.lstrip("@")
+    if name not in sheet.symbols():
+        return _fail(f"no @define-color {name} (try: palette convert)")
+    core.ensure_backup()
+    sheet.set_define(name, args.color)
+    changed = core.STYLESHEETS.save_graph(core.STYLE_CSS, sheet)
+    _saved(args, changed)
+    return _reload(args, False, bool(changed))
+
+def cmd_palette_convert(args) -> int:
+    sheet = core.STYLESHEETS.load(core.STYLE_CSS)
+    core.ensure_backup()
+    added = core.factor_palette(sheet, args.min_uses)
+    for name, value in added.items():
+        print(f"@{name} {value}")
+    changed = core.STYLESHEETS.save_graph(core.STYLE_CSS, sheet)
+    _saved(args, changed)
+    return _reload(args, False, bool(changed))
+
+# ----- module -----
+def cmd_module(args) -> int:
+    bar, bars = _bar(args)
+    if bar is None and bars:
+        return _fail(f"no bar #{args.bar}")
+    zones = core.current_zones(bar)
+    if not core.toggle_module(zones, args.name, args.action == "enable", args.zone):
+        print("nothing changed")
+        return 0
+    core.ensure_backup()
+    changed = core.write_zones(bar, zones)
+    if changed is None:
+        return _fail("config.jsonc could not be parsed; modules not saved")
+    _saved(args, changed)
+    return _reload(args, bool(changed), False)
+
+# ----- history -----
+def cmd_history_list(args) -> int:
+    from datetime import datetime
+    for snap in core.HISTORY.timeline()[:args.limit]:
+        when = datetime.fromtimestamp(snap["ts"]).strftime("%Y-%m-%d %H:%M:%S")
+        print(f"{snap['id']}  {when}  {snap['label']}  ({', '.join(snap['files'])})")
+    return 0
+
+def cmd_history_restore(args) -> int:
+    if core.HISTORY.get(args.id) is None:
+        return _fail(f"no snapshot {args.id}")
+    changed = core.HISTORY.restore(args.id)
+    _report(changed)
+    style_changed = core.STYLE_CSS in changed
+    return _reload(args, any(p != core.STYLE_CSS for p in changed), style_changed) if changed else 0
+
+def cmd_history_prune(args) -> int:
+    print(f"dropped {core.HISTORY.prune()} snapshots, {core.HISTORY.disk_usage() // 1024} KiB used")
+    return 0
+
+# ----- zip -----
+def cmd_export(args) -> int:
+    out = core.export_theme_zip(Path(args.path) if args.path else None)
+    print(out)
+    return 0
+
+def cmd_import(args) -> int:
+    core.ensure_backup()
+    changed = core.import_theme_zip(args.zip)
+    _saved(args, changed)
+    style_changed = core.STYLE_CSS in changed
+    return _reload(args, any(p != core.STYLE_CSS for p in changed), style_changed) if changed else 0
+
+def cmd_reload(args) -> int:
+    args.reload = True
+    return _reload(args, True, True)
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(prog="waybar-configurator",
+                                 description="Headless Waybar Configurator (no GTK).")
+    ap.add_argument("--bar", type=int, default=0, help="bar index for multi-bar configs (default 0)")
+    ap.add_argument("--reload", action="store_true", help="reload Waybar after a change")
+    # Los mismos flags también después del subcomando (`theme apply X --reload`);
+    # SUPPRESS para que el default del subparser no pise el ya dado antes
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--bar", type=int, default=argparse.SUPPRESS, help="bar index for multi-bar configs")
+    common.add_argument("--reload", action="store_true", default=argparse.SUPPRESS, help="reload Waybar after a change")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    theme = sub.add_parser("theme", parents=[common], help="list or apply themes").add_subparsers(dest="action", required=True)
+    theme.add_parser("list", parents=[common]).set_defaults(func=cmd_theme_list)
+    p = theme.add_parser("apply", parents=[common]); p.add_argument("name"); p.set_defaults(func=cmd_theme_apply)
+
+    p = sub.add_parser("style", parents=[common], help="set a module's background, opacity, radius or text color")
+    p.add_argument("module")
+    p.add_argument("--bg", help="background color (#rrggbb)")
+    p.add_argument("--alpha", type=float, help="background opacity 0..1")
+    p.add_argument("--radius", type=int, help="border radius in px")
+    p.add_argument("--text", help="text color (#rrggbb)")
+    p.add_argument("--target", choices=tuple(core.WS_SELECTORS), help="hyprland/workspaces part")
+    p.set_defaults(func=cmd_style)
+
+    p = sub.add_parser("module", parents=[common], help="enable or disable a module")
+    p.add_argument("action", choices=("enable", "disable"))
+    p.add_argument("name")
+    p.add_argument("--zone", choices=("left", "center", "right"))
+    p.set_defaults(func=cmd_module)
+
+    p = sub.add_parser("recolor", parents=[common], help="shift hue/saturation/lightness of every color in style.css")
+    p.add_argument("--hue", type=float, default=0.0, help="hue shift in degrees")
+    p.add_argument("--saturation", type=float, default=0.0, help="saturation change, -1..1")
+    p.add_argument("--lightness", type=float, default=0.0, help="lightness change, -1..1 (negative darkens)")
+    p.add_argument("--alpha", type=float, help="opacity 0..1 for every (non-transparent) background")
+    p.set_defaults(func=cmd_recolor)
+    sub.add_parser("contrast", parents=[common], help="WCAG contrast of each module's text (exit 1 if any is below 4.5)"
+                   ).set_defaults(func=cmd_contrast)
+
+    pal = sub.add_parser("palette", parents=[common], help="@define-color variables shared by the modules").add_subparsers(dest="action", required=True)
+    pal.add_parser("list", parents=[common]).set_defaults(func=cmd_palette_list)
+    p = pal.add_parser("set", parents=[common]); p.add_argument("name"); p.add_argument("color"); p.set_defaults(func=cmd_palette_set)
+    p = pal.add_parser("convert", parents=[common], help="turn repeated color literals into palette variables")
+    p.add_argument("--min-uses", type=int, default=2, help="uses needed to become a variable (default 2)")
+    p.set_defaults(func=cmd_palette_convert)
+
+    p = sub.add_parser("export", parents=[common], help="export config.jsonc + style.css as a zip")
+    p.add_argument("path", nargs="?"); p.set_defaults(func=cmd_export)
+    p = sub.add_parser("import", parents=[common], help="import a theme zip")
+    p.add_argument("zip"); p.set_defaults(func=cmd_import)
+    sub.add_parser("reload", parents=[common], help="reload (or restart) Waybar").set_defaults(func=cmd_reload)
+
+    hist = sub.add_parser("history", parents=[common], help="snapshots taken on every change").add_subparsers(dest="action", required=True)
+    p = hist.add_parser("list", parents=[common]); p.add_argument("-n", "--limit", type=int, default=20); p.set_defaults(func=cmd_history_list)
+    p = hist.add_parser("restore", parents=[common]); p.add_argument("id", type=int); p.set_defaults(func=cmd_history_restore)
+    hist.add_parser("prune", parents=[common]).set_defaults(func=cmd_history_prune)
+    return ap
+
+def main(argv=None, parser=None) -> int:
+    args = (parser or build_parser()).parse_args(argv)
+    core.ensure_storage_dirs()
+    try:
+        rc = args.func(args)
+        if rc == 0 and getattr(args, "changed", None):
+            core.HISTORY.record(f"cli: {args.cmd} {getattr(args, 'name', None) or getattr(args, 'module', None) or ''}".rstrip())
+        return rc
+    except (OSError, core.ZipError) as e:
+        return _fail(str(e))
+    except (KeyboardInterrupt, core.JobCancelled):
+        return _fail("cancelled")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,42 +10,34 @@
 #  - NEW: 🧩 Modules Editor popup (add/remove/zone assign)
 #  - NEW: i18n (EN/ES) via ~/.config/waybar-configurator/lang/*.json + settings.json
 
+import time
+_T_START = time.perf_counter()  # para medir time-to-first-frame
+
 import re
-import shutil
-import subprocess
 import json
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-import json5
+
+# Todo lo que no necesita GTK vive en waybar_core (lo comparte el CLI)
+from waybar_core import (
+    LANG_DIR, SETTINGS_JSON, CONFIG_JSONC, STYLE_CSS,
+    STORAGE_DIR, USER_THEMES_DIR, DEFAULT_THEME_FILE, ensure_storage_dirs,
+    PROFILER, BUILTIN_THEMES, read_text, write_text,
+    JsoncDocument, ensure_backup, restore_defaults, restart_waybar,
+    Stylesheet, style_edits, module_to_selector, extract_css_ids,
+    read_bg_radius, read_text_hex, write_zones,
+    export_theme_zip, import_theme_zip, THUMB_H, css_hash, thumbnail_for_hash,
+    theme_thumbnail, ThemeIndex, JobCancelled, HISTORY, EditJournal, apply_delta,
+    load_waybar_files, color_hex, recolor, contrast_report, selectors_at, WS_SELECTORS,
+    absolute_imports, palette, factor_palette, refines_selector,
+)
 
 import gi
 gi.require_version("Gtk", "4.0")
 gi.require_version("Adw", "1")
-from gi.repository import Gtk, Adw, Gio, Gdk
-
-# ===== Theme preference (dark) =====
-Adw.StyleManager.get_default().set_color_scheme(Adw.ColorScheme.PREFER_DARK)
-
-# ===== Paths =====
-HOME          = Path.home()
-CFG_DIR       = HOME / ".config" / "waybar-configurator"
-LANG_DIR      = CFG_DIR / "lang"
-SETTINGS_JSON = CFG_DIR / "settings.json"
-
-WAYBAR_DIR    = HOME / ".config" / "waybar"
-CONFIG_JSONC  = WAYBAR_DIR / "config.jsonc"
-STYLE_CSS     = WAYBAR_DIR / "style.css"
-BACKUP_CONFIG = WAYBAR_DIR / "config.jsonc.backup"
-BACKUP_CSS    = WAYBAR_DIR / "style.css.backup"
-META_FILE     = WAYBAR_DIR / ".waybar-configurator.meta"
-
-STORAGE_DIR        = HOME / ".local" / "share" / "waybar-configurator"
-THEMES_DIR         = STORAGE_DIR / "themes"
-USER_THEMES_DIR    = STORAGE_DIR / "user_themes"
-DEFAULT_THEME_FILE = STORAGE_DIR / "default_theme.css"
-
-for d in (CFG_DIR, LANG_DIR, STORAGE_DIR, THEMES_DIR, USER_THEMES_DIR):
-    d.mkdir(parents=True, exist_ok=True)
+from gi.repository import Gtk, Adw, Gio, Gdk, GLib, GObject, Pango
 
 # ===== URLs =====
 GITHUB_URL = "https://github.com/veitorman/Waybar-Configurator-GUI"
@@ -60,55 +52,6 @@ ICON_HINTS = {
     "custom/storage": "", "mpd": "", "hyprland/window": "",
 }
 
-# ===== Built-in themes (embedded CSS) =====
-BUILTIN_THEMES = {
-    "🌑 Dark Emerald": """
-#waybar { background-color: rgba(0,0,0,0.0); color: #e0e0e0; }
-#workspaces { background-color: rgba(17,24,39,0.85); border-radius: 14px; }
-#workspaces button { background-color: rgba(17,24,39,0.85); border-radius: 6px; color: #e8e8e8; }
-#workspaces button.active { background-color: rgba(2,89,57,0.95); border-radius: 6px; color: #ffffff; }
-#clock,#battery,#cpu,#memory,#disk,#temperature,#backlight,#network,#pulseaudio,#wireplumber,#custom-media,#mode,#idle_inhibitor,#mpd,#bluetooth,#custom-spotify,#custom-weather,#custom-screenshot_t,#custom-power,#tray,#custom-storage {
-  background-color: rgba(17,24,39,0.85); border-radius: 14px; color: #e0e0e0;
-}
-""",
-    "🌅 Sunrise Blue": """
-#waybar { background-color: rgba(0,0,0,0.0); color: #ffffff; }
-#workspaces { background-color: rgba(10,25,47,0.85); border-radius: 14px; }
-#workspaces button { background-color: rgba(10,25,47,0.85); border-radius: 6px; color: #ffffff; }
-#workspaces button.active { background-color: rgba(255,179,71,0.95); border-radius: 6px; color: #1a1a1a; }
-#clock,#battery,#cpu,#memory,#disk,#temperature,#backlight,#network,#pulseaudio,#wireplumber,#custom-media,#mode,#idle_inhibitor,#mpd,#bluetooth,#custom-spotify,#custom-weather,#custom-screenshot_t,#custom-power,#tray,#custom-storage {
-  background-color: rgba(10,25,47,0.78); border-radius: 14px; color: #ffffff;
-}
-""",
-    "🌆 Sunset Orange": """
-#waybar { background-color: rgba(0,0,0,0.0); color: #f5f5f5; }
-#workspaces { background-color: rgba(28,27,26,0.85); border-radius: 14px; }
-#workspaces button { background-color: rgba(28,27,26,0.85); border-radius: 6px; color: #f5f5f5; }
-#workspaces button.active { background-color: rgba(255,112,67,0.95); border-radius: 6px; color: #1a1a1a; }
-#clock,#battery,#cpu,#memory,#disk,#temperature,#backlight,#network,#pulseaudio,#wireplumber,#custom-media,#mode,#idle_inhibitor,#mpd,#bluetooth,#custom-spotify,#custom-weather,#custom-screenshot_t,#custom-power,#tray,#custom-storage {
-  background-color: rgba(28,27,26,0.80); border-radius: 14px; color: #f5f5f5;
-}
-""",
-    "🌸 Sakura Light": """
-#waybar { background-color: rgba(0,0,0,0.0); color: #2e2e2e; }
-#workspaces { background-color: rgba(248,241,241,0.68); border-radius: 14px; }
-#workspaces button { background-color: rgba(255,183,197,0.82); border-radius: 6px; color: #2e2e2e; }
-#workspaces button.active { background-color: rgba(255,183,197,0.95); border-radius: 6px; color: #1a1a1a; }
-#clock,#battery,#cpu,#memory,#disk,#temperature,#backlight,#network,#pulseaudio,#wireplumber,#custom-media,#mode,#idle_inhibitor,#mpd,#bluetooth,#custom-spotify,#custom-weather,#custom-screenshot_t,#custom-power,#tray,#custom-storage {
-  background-color: rgba(248,241,241,0.72); border-radius: 14px; color: #2e2e2e;
-}
-""",
-    "🧊 Glacier Minimal": """
-#waybar { background-color: rgba(0,0,0,0.0); color: #1e1e1e; }
-#workspaces { background-color: rgba(232,240,248,0.80); border-radius: 14px; }
-#workspaces button { background-color: rgba(232,240,248,0.80); border-radius: 6px; color: #1e1e1e; }
-#workspaces button.active { background-color: rgba(0,122,204,0.92); border-radius: 6px; color: #ffffff; }
-#clock,#battery,#cpu,#memory,#disk,#temperature,#backlight,#network,#pulseaudio,#wireplumber,#custom-media,#mode,#idle_inhibitor,#mpd,#bluetooth,#custom-spotify,#custom-weather,#custom-screenshot_t,#custom-power,#tray,#custom-storage {
-  background-color: rgba(255,255,255,0.80); border-radius: 14px; color: #1e1e1e;
-}
-""",
-}
-
 # ===== i18n =====
 I18N = {}
 def i18n_load(lang_code: str):
@@ -138,37 +81,6 @@ def settings_save(data: dict):
 SET = settings_load()
 i18n_load(SET.get("language","en"))
 
-# ===== File helpers =====
-def read_text(p: Path) -> str:
-    return p.read_text("utf-8") if p.exists() else ""
-
-def write_text(p: Path, s: str):
-    p.write_text(s, "utf-8")
-
-def read_jsonc(p: Path) -> dict:
-    try:
-        return json5.loads(read_text(p)) if p.exists() else {}
-    except Exception:
-        return {}
-
-def ensure_backup():
-    if META_FILE.exists():
-        return
-    if CONFIG_JSONC.exists():
-        shutil.copy2(CONFIG_JSONC, BACKUP_CONFIG)
-    if STYLE_CSS.exists():
-        shutil.copy2(STYLE_CSS, BACKUP_CSS)
-    META_FILE.write_text("backup_done\n")
-
-def restore_defaults():
-    if BACKUP_CONFIG.exists():
-        shutil.copy2(BACKUP_CONFIG, CONFIG_JSONC)
-    if BACKUP_CSS.exists():
-        shutil.copy2(BACKUP_CSS, STYLE_CSS)
-
-def restart_waybar():
-    subprocess.Popen(["bash", "-c", "pkill waybar; sleep 1; waybar & disown"])
-
 # ===== CSS helpers =====
 def rgba_from_hex(hx: str):
     rgba = Gdk.RGBA()
@@ -180,67 +92,552 @@ def rgba_from_hex(hx: str):
     return None
 
 def hex_from_rgba(rgba: Gdk.RGBA) -> str:
-    r = int(rgba.red * 255); g = int(rgba.green * 255); b = int(rgba.blue * 255)
-    return f"#{r:02x}{g:02x}{b:02x}"
-
-def hex_to_rgb_tuple(hx: str):
-    hx = hx.strip().lstrip("#")
-    if len(hx) == 3:
-        hx = "".join(ch*2 for ch in hx)
-    return tuple(int(hx[i:i+2], 16) for i in (0, 2, 4))
-
-def rgba_css(hex_color: str, alpha: float) -> str:
-    r, g, b = hex_to_rgb_tuple(hex_color)
-    a = max(0.0, min(1.0, float(alpha)))
-    return f"rgba({r}, {g}, {b}, {a:.2f})"
-
-def css_find_block(css: str, selector: str):
-    pat = rf"(^|\n)\s*{re.escape(selector)}\s*\{{(.*?)\}}"
-    m = re.search(pat, css, flags=re.S | re.M)
-    if not m:
-        return None, None, None
-    return m.start(2), m.end(2), m.group(2)
-
-def css_get_property(css: str, selector: str, prop: str):
-    s, e, inner = css_find_block(css, selector)
-    if inner is None:
-        return None
-    pm = re.search(rf"(^|\n)\s*{re.escape(prop)}\s*:\s*([^;]+);", inner, flags=re.S | re.M)
-    return pm.group(2).strip() if pm else None
-
-def css_set_property(css: str, selector: str, prop: str, value: str):
-    s, e, inner = css_find_block(css, selector)
-    if inner is None:
-        block = f"\n{selector} {{\n  {prop}: {value};\n}}\n"
-        return css + ("" if css.endswith("\n") else "\n") + block
-    pat = rf"(^|\n)\s*{re.escape(prop)}\s*:\s*([^;]+);"
-    if re.search(pat, inner, flags=re.S | re.M):
-        inner2 = re.sub(pat, rf"\1{prop}: {value};", inner, flags=re.S | re.M)
-    else:
-        inner2 = inner.rstrip() + f"\n  {prop}: {value};\n"
-    return css[:s] + inner2 + css[e:]
-
-def module_to_selector(mod: str) -> str:
-    base = mod.split("#", 1)[0]
-    if base.startswith("custom/"):
-        return "#" + base.replace("/", "-")
-    if base.startswith("hyprland/"):
-        return "#" + base.split("/", 1)[1]
-    return "#" + base
-
-def extract_css_ids(css_text: str) -> list[str]:
-    ids = set()
-    for m in re.finditer(r"\n\s*#([a-zA-Z0-9_\-]+)\s*\{", css_text):
-        ids.add(m.group(1))
-    mods = []
-    for idname in sorted(ids):
-        if idname.startswith("custom-"):
-            mods.append("custom/" + idname.split("custom-")[1])
-        elif idname in ("workspaces", "window"):
-            mods.append("hyprland/" + idname)
+    return color_hex([round(c * 255) for c in (rgba.red, rgba.green, rgba.blue)])
+
+# ===== Live preview scheduler =====
+class PreviewScheduler:
+    """Coalesces style edits and hands them to `apply_cb` once per frame.
+
+    Widgets call queue() as often as they like (every keystroke, spin tick or
+    notify::rgba); pending edits are keyed by (selector, prop) so only the last
+    value survives, and the flush runs on the next frame-clock tick of the
+    attached widget (or the next idle when it is not mapped yet).
+    """
+    def __init__(self, apply_cb):
+        self.apply_cb = apply_cb
+        self.widget = None
+        self._pending = {}      # (selector, prop) -> value
+        self._tick_id = None
+        self._idle_id = None
+        self.queued = 0         # queue() calls
+        self.flushes = 0        # apply_cb calls
+        self._batch_depth = 0
+
+    def attach(self, widget: Gtk.Widget):
+        self.widget = widget
+
+    @property
+    def coalesced(self) -> int:
+        return self.queued - self.flushes
+
+    def stats(self) -> dict:
+        return {"queued": self.queued, "flushes": self.flushes,
+                "coalesced": self.coalesced, "pending": len(self._pending)}
+
+    def queue(self, edits):
+        for sel, prop, val in edits:
+            self._pending[(sel, prop)] = val
+        self.queued += 1
+        if self._batch_depth or self._tick_id is not None or self._idle_id is not None:
+            return
+        if self.widget is not None and self.widget.get_mapped():
+            self._tick_id = self.widget.add_tick_callback(self._on_tick)
+        else:
+            self._idle_id = GLib.idle_add(self._on_idle)
+
+    def _on_tick(self, _widget, _clock):
+        self._tick_id = None
+        self.flush()
+        return GLib.SOURCE_REMOVE
+
+    def _on_idle(self):
+        self._idle_id = None
+        self.flush()
+        return GLib.SOURCE_REMOVE
+
+    def cancel(self):
+        if self._tick_id is not None and self.widget is not None:
+            self.widget.remove_tick_callback(self._tick_id)
+        if self._idle_id is not None:
+            GLib.source_remove(self._idle_id)
+        self._tick_id = self._idle_id = None
+
+    @contextmanager
+    def batch(self):
+        """Collect every edit queued inside the block and apply them as one update."""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self.flush()
+
+    def discard(self):
+        """Drop pending edits (their rows are about to be rebuilt)."""
+        self.cancel()
+        self._pending = {}
+
+    def flush(self):
+        """Apply whatever is pending right now (also used before saving)."""
+        self.cancel()
+        if not self._pending:
+            return
+        edits = [(sel, prop, val) for (sel, prop), val in self._pending.items()]
+        self._pending = {}
+        self.flushes += 1
+        self.apply_cb(edits)
+
+class PreviewProviders:
+    """Base provider with the user's CSS plus one small provider per edited selector.
+
+    Editing #clock only re-parses the few declarations of the #clock overlay;
+    the base stylesheet is parsed once per load_all / theme switch. Providers
+    are added to the mock bar's widgets only (see scope()), never to the
+    display, so Waybar rules cannot restyle the configurator itself.
+
+    GTK settles a property in the highest-priority provider that sets it,
+    whatever the specificity, so an overlay also re-emits the rules that
+    refine its selector (`#workspaces button.active` and `:hover` for
+    `#workspaces button`, from `dependents`) after its own rule.
+    """
+    BASE_PRIORITY    = Gtk.STYLE_PROVIDER_PRIORITY_USER
+    OVERLAY_PRIORITY = Gtk.STYLE_PROVIDER_PRIORITY_USER + 1
+
+    def __init__(self, on_errors=None, dependents=None):
+        self.base = None
+        self.overlays = {}      # selector -> (Gtk.CssProvider, {prop: value})
+        self.reloads = 0
+        # callback(key, [(line, col, msg)]) tras cada carga; key = selector del
+        # overlay o None para el CSS base. Así cada edición solo re-valida su regla.
+        self.on_errors = on_errors
+        self.dependents = dependents    # callback(selector, props) -> [(selector, {prop: value})]
+        self._errors = {}
+        self.widgets = []       # widgets de la barra simulada (los únicos estilizados)
+
+    def _providers(self):
+        out = [(self.base, self.BASE_PRIORITY)] if self.base is not None else []
+        return out + [(prov, self.OVERLAY_PRIORITY) for prov, _ in self.overlays.values()]
+
+    def _attach(self, provider, priority):
+        for w in self.widgets:
+            w.get_style_context().add_provider(provider, priority)
+
+    def scope(self, widgets):
+        """Style exactly `widgets` from now on (GTK4 widget providers do not
+        cascade, so the mock bar hands over every widget of its tree)."""
+        for w in self.widgets:
+            for provider, _prio in self._providers():
+                w.get_style_context().remove_provider(provider)
+        self.widgets = list(widgets)
+        for provider, prio in self._providers():
+            self._attach(provider, prio)
+
+    def _new_provider(self, key) -> Gtk.CssProvider:
+        provider = Gtk.CssProvider()
+        provider.connect("parsing-error", lambda _p, section, error:
+                         self._errors.setdefault(key, []).append(css_error(section, error)))
+        return provider
+
+    def _load(self, provider: Gtk.CssProvider, css: str, key=None):
+        self._errors[key] = []
+        load_css(provider, css)
+        self.reloads += 1
+        PROFILER.count("css provider reloads")
+        if self.on_errors:
+            self.on_errors(key, [e for e in self._errors.pop(key) if e is not None])
+
+    def teardown(self):
+        for w in self.widgets:
+            for provider, _prio in self._providers():
+                w.get_style_context().remove_provider(provider)
+        if self.on_errors:
+            for key in [None] + list(self.overlays):
+                self.on_errors(key, [])
+        self.base = None
+        self.overlays = {}
+
+    def reset(self, base_css: str):
+        self.teardown()
+        self.base = self._new_provider(None)
+        self._load(self.base, mock_bar_css(absolute_imports(base_css, STYLE_CSS.parent)))
+        self._attach(self.base, self.BASE_PRIORITY)
+
+    def reload_base(self, base_css: str):
+        """Re-parse only the base (a @define-color changed); overlays stay, but
+        the rules they re-emit carry inlined colors, so those are refreshed."""
+        if self.base is None:
+            return self.reset(base_css)
+        self._load(self.base, mock_bar_css(absolute_imports(base_css, STYLE_CSS.parent)))
+        for selector in self.overlays:
+            self._reload_overlay(selector)
+
+    def update(self, selector: str, props: dict):
+        entry = self.overlays.get(selector)
+        if entry is None:
+            entry = (self._new_provider(selector), {})
+            self.overlays[selector] = entry
+            self._attach(entry[0], self.OVERLAY_PRIORITY)
+        entry[1].update(props)
+        self._reload_overlay(selector)
+        # Overlays que re-emiten esta regla (button -> button.active) quedan viejos
+        for other in self.overlays:
+            if refines_selector(selector, other):
+                self._reload_overlay(other)
+
+    def _reload_overlay(self, selector: str):
+        provider, current = self.overlays[selector]
+        rules = [(selector, current)]
+        if self.dependents:
+            rules += self.dependents(selector, list(current))
+        css = "".join(f"{mock_bar_css(sel)} {{ {' '.join(f'{p}: {v};' for p, v in props.items())} }}\n"
+                      for sel, props in rules)
+        self._load(provider, css, selector)
+
+# ===== Mock bar preview =====
+_WINDOW_WAYBAR_RE = re.compile(r"(?<![\w-])window(?=#waybar(?![\w-]))")
+_FORMAT_FIELD_RE = re.compile(r"\{([^{}]*)\}")
+_SAMPLE_FIELDS = {"capacity": "87", "percentage": "60", "volume": "60", "usage": "12",
+                  "load": "0.4", "temperatureC": "48", "essid": "home", "ifname": "wlan0",
+                  "signalStrength": "70", "title": "Waybar Configurator", "class": "app",
+                  "artist": "Artist", "text": "♪ Song"}
+_SAMPLE_TEXT = {"clock": None, "cpu": " 12%", "memory": " 41%", "battery": " 87%",
+                "network": " home", "pulseaudio": " 60%", "wireplumber": " 60%",
+                "backlight": "☀ 80%", "temperature": " 48°C", "disk": " 63%"}
+_WORKSPACE_MODULES = ("hyprland/workspaces", "sway/workspaces", "wlr/workspaces",
+                      "niri/workspaces", "river/tags", "dwl/tags")
+
+def mock_bar_css(css: str) -> str:
+    """Waybar CSS for the mock bar: `window#waybar` becomes `#waybar` (the mock
+    root is a box). Padded with spaces so parser error columns still match."""
+    return _WINDOW_WAYBAR_RE.sub("      ", css)
+
+def _sample_text(name: str, conf: dict) -> str:
+    base = name.split("#", 1)[0]
+    fmt = conf.get("format") if isinstance(conf, dict) else None
+    if isinstance(fmt, str) and fmt:
+        def field(m):
+            key = m.group(1)
+            if key.startswith(":"):
+                return datetime.now().strftime(key[1:] or "%H:%M")
+            return _SAMPLE_FIELDS.get(key.split(":", 1)[0], "42")
+        return _FORMAT_FIELD_RE.sub(field, fmt)
+    if base == "clock":
+        return datetime.now().strftime("%H:%M")
+    return _SAMPLE_TEXT.get(base) or base.split("/")[-1]
+
+class MockBar(Gtk.Box):
+    """In-app stand-in for the Waybar window, built from modules-left/center/right
+    with the widget names and classes Waybar uses (#clock, #custom-spotify,
+    #workspaces button.active, .modules-left, …). Only these widgets receive
+    the preview providers."""
+    def __init__(self, providers: PreviewProviders):
+        super().__init__(orientation=Gtk.Orientation.HORIZONTAL, name="waybar")
+        self.providers = providers
+        self.center = Gtk.CenterBox(hexpand=True)
+        self.append(self.center)
+        self._idle_id = None
+        self._args = None
+
+    def queue_build(self, zones: dict, cfg: dict):
+        """Coalesce rebuilds (a module toggle storm rebuilds once)."""
+        self._args = (zones, cfg)
+        if self._idle_id is None:
+            self._idle_id = GLib.idle_add(self._on_idle)
+
+    def _on_idle(self):
+        self._idle_id = None
+        self.build(*self._args)
+        return GLib.SOURCE_REMOVE
+
+    def build(self, zones: dict, cfg: dict):
+        """zones: key -> [(name, active)] as in the config; cfg: the bar's config."""
+        for cls in self.get_css_classes():
+            self.remove_css_class(cls)
+        self.add_css_class(cfg.get("position", "top"))
+        if isinstance(cfg.get("name"), str):
+            self.add_css_class(cfg["name"])
+        spacing = cfg.get("spacing", 4)
+        height = cfg.get("height")
+        self.set_size_request(-1, height if isinstance(height, int) else 30)
+        for key, setter in (("modules-left", self.center.set_start_widget),
+                            ("modules-center", self.center.set_center_widget),
+                            ("modules-right", self.center.set_end_widget)):
+            box = Gtk.Box(spacing=spacing if isinstance(spacing, int) else 4)
+            box.add_css_class(key)
+            for name, active in zones.get(key, []):
+                if active:
+                    box.append(self._module(name, cfg.get(name, {})))
+            setter(box)
+        self.providers.scope(self._tree(self))
+
+    def _module(self, name: str, conf) -> Gtk.Widget:
+        base, _, suffix = name.partition("#")
+        if base in _WORKSPACE_MODULES:
+            w = Gtk.Box(name="workspaces" if base.endswith("workspaces") else "tags")
+            for i in range(1, 5):
+                b = Gtk.Button(label=str(i))
+                if i == 2:
+                    b.add_css_class("active"); b.add_css_class("focused")
+                w.append(b)
+        elif base == "tray":
+            w = Gtk.Box(name="tray", spacing=conf.get("spacing", 4) if isinstance(conf, dict) else 4)
+            for icon in ("network-wireless-symbolic", "audio-volume-high-symbolic"):
+                w.append(Gtk.Image(icon_name=icon))
         else:
-            mods.append(idname)
-    return mods
+            w = Gtk.Label(label=_sample_text(name, conf), name=module_to_selector(base)[1:])
+        w.add_css_class("module")
+        if suffix:
+            w.add_css_class(suffix)
+        return w
+
+    @staticmethod
+    def _tree(widget):
+        out, stack = [], [widget]
+        while stack:
+            w = stack.pop()
+            out.append(w)
+            child = w.get_first_child()
+            while child is not None:
+                stack.append(child)
+                child = child.get_next_sibling()
+        return out
+
+# ===== CSS validation =====
+# Waybar usa GTK3; estas propiedades no existen en el parser de GTK4 pero son
+# válidas para la barra, así que no cuentan como error.
+GTK3_ONLY_PROPS = {
+    "-gtk-outline-radius", "-gtk-outline-top-left-radius", "-gtk-outline-top-right-radius",
+    "-gtk-outline-bottom-left-radius", "-gtk-outline-bottom-right-radius",
+    "-gtk-icon-effect", "-gtk-key-bindings",
+}
+
+def load_css(provider: Gtk.CssProvider, css: str):
+    if hasattr(provider, "load_from_string"):       # GTK >= 4.12
+        provider.load_from_string(css)
+    else:
+        provider.load_from_data(css.encode("utf-8"))
+
+def css_error(section, error):
+    """(line, column, message) of a `parsing-error`, 1-based; None if ignored."""
+    m = re.search(r'"([^"]+)"', error.message)
+    if m and m.group(1) in GTK3_ONLY_PROPS:
+        return None
+    loc = section.get_start_location()
+    gfile = section.get_file()
+    if gfile is not None and gfile.get_path():      # error dentro de un @import
+        return (0, 0, f"{Path(gfile.get_path()).name}:{loc.lines + 1}:{loc.line_chars + 1}: {error.message}")
+    return (loc.lines + 1, loc.line_chars + 1, error.message)
+
+class CssValidator:
+    """Runs a whole stylesheet through GTK's own CSS parser without applying it
+    anywhere (the provider is never added to a display)."""
+    def __init__(self):
+        self.provider = Gtk.CssProvider()
+        self._errors = None
+        self.provider.connect("parsing-error", self._on_error)
+
+    def _on_error(self, _provider, section, error):
+        if self._errors is not None:
+            err = css_error(section, error)
+            if err is not None:
+                self._errors.append(err)
+
+    def check(self, css: str) -> list:
+        self._errors = []
+        try:
+            load_css(self.provider, css)
+            return self._errors
+        finally:
+            self._errors = None
+
+# ===== File watching =====
+class WaybarWatcher:
+    """Debounced Gio directory monitors for the config, its includes and style imports.
+
+    Directories are watched (not single files) so atomic rename saves from
+    editors keep being seen; events for files outside `paths` are ignored.
+    """
+    def __init__(self, on_change, delay_ms: int = 300):
+        self.on_change = on_change      # callback(set[Path])
+        self.delay_ms = delay_ms
+        self.paths = set()
+        self.trees = set()
+        self._monitors = {}             # dir -> Gio.FileMonitor
+        self._pending = set()
+        self._timer = None
+
+    def watch(self, paths, trees=()):
+        """Watch the files `paths` and any file directly inside the folders `trees`."""
+        self.paths = {Path(p) for p in paths}
+        self.trees = {Path(d) for d in trees}
+        dirs = {p.parent for p in self.paths} | self.trees
+        for d in list(self._monitors):
+            if d not in dirs:
+                self._monitors.pop(d).cancel()
+        for d in dirs:
+            if d in self._monitors or not d.is_dir():
+                continue
+            try:
+                mon = Gio.File.new_for_path(str(d)).monitor_directory(Gio.FileMonitorFlags.WATCH_MOVES, None)
+            except GLib.Error:
+                continue
+            mon.connect("changed", self._on_event)
+            self._monitors[d] = mon
+
+    def stop(self):
+        for mon in self._monitors.values():
+            mon.cancel()
+        self._monitors = {}
+        if self._timer is not None:
+            GLib.source_remove(self._timer); self._timer = None
+
+    def _on_event(self, _mon, gfile, other, _event):
+        hit = False
+        for f in (gfile, other):
+            path = Path(f.get_path()) if f is not None and f.get_path() else None
+            if path is not None and (path in self.paths or path.parent in self.trees):
+                self._pending.add(path); hit = True
+        if not hit:
+            return
+        if self._timer is not None:
+            GLib.source_remove(self._timer)
+        self._timer = GLib.timeout_add(self.delay_ms, self._fire)
+
+    def _fire(self):
+        self._timer = None
+        changed, self._pending = self._pending, set()
+        if changed:
+            self.on_change(changed)
+        return GLib.SOURCE_REMOVE
+
+# ===== Theme thumbnails =====
+class ThumbnailLoader:
+    """Fills Gtk.Pictures with cached theme thumbnails; missing ones are rendered
+    in a worker thread and delivered on the main loop, so the gallery never waits."""
+    def __init__(self):
+        self._pool = None
+        self._wanted = {}   # picture -> key: las filas de ListView se reciclan
+        self.rendered = 0
+
+    def load(self, picture: Gtk.Picture, css: str = None, path: Path = None, digest: str = None):
+        """Thumbnail for `css`, or for the file `path` (`digest` = its css_hash if known)."""
+        if css is not None:
+            digest = css_hash(css)
+        key = digest or str(path)
+        self._wanted[picture] = key
+        if digest and thumbnail_for_hash(digest).exists():
+            picture.set_filename(str(thumbnail_for_hash(digest)))
+            return
+        picture.set_paintable(None)
+        if self._pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="thumbs")
+        fut = self._pool.submit(self._render, css, path)
+        fut.add_done_callback(lambda f: GLib.idle_add(self._deliver, picture, key, f))
+
+    def _render(self, css, path):
+        out = theme_thumbnail(css if css is not None else read_text(path))
+        self.rendered += 1
+        return out
+
+    def _deliver(self, picture, key, fut):
+        if self._wanted.get(picture) != key:
+            return GLib.SOURCE_REMOVE      # la fila ya muestra otro tema
+        try:
+            picture.set_filename(str(fut.result()))
+        except Exception:           # sin miniatura: queda solo el nombre
+            pass
+        return GLib.SOURCE_REMOVE
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+# ===== Background jobs =====
+class IoWorker:
+    """One thread for disk I/O and parsing: jobs run in order (a save never
+    interleaves with a load) and on_done(result, error) runs on the main loop."""
+    def __init__(self, on_busy=None):
+        self.on_busy = on_busy      # callback(bool) para el estado "ocupado"
+        self.pending = 0
+        self._pool = None
+
+    def submit(self, fn, on_done=None):
+        if self._pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="io")
+        self.pending += 1
+        if self.pending == 1 and self.on_busy:
+            self.on_busy(True)
+        fut = self._pool.submit(fn)
+        fut.add_done_callback(lambda f: GLib.idle_add(self._done, f, on_done))
+
+    def _done(self, fut, on_done):
+        self.pending -= 1
+        if self.pending == 0 and self.on_busy:
+            self.on_busy(False)
+        try:
+            result, error = fut.result(), None
+        except Exception as e:
+            result, error = None, e
+        if on_done:
+            on_done(result, error)
+        return GLib.SOURCE_REMOVE
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)     # un guardado en curso termina antes de salir
+            self._pool = None
+
+class JobBar(Gtk.Revealer):
+    """Runs one long job at a time (zip import/export) in a thread, with a
+    progress bar and a Cancel button; `fn(progress, cancel)` must poll `cancel`."""
+    def __init__(self):
+        super().__init__(transition_type=Gtk.RevealerTransitionType.SLIDE_DOWN)
+        box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8,
+                      margin_top=6, margin_bottom=6, margin_start=12, margin_end=12)
+        self.label = Gtk.Label(xalign=0)
+        self.bar = Gtk.ProgressBar(hexpand=True, valign=Gtk.Align.CENTER)
+        self.cancel_btn = Gtk.Button(label=_("Cancel"))
+        self.cancel_btn.connect("clicked", self._on_cancel)
+        box.append(self.label); box.append(self.bar); box.append(self.cancel_btn)
+        self.set_child(box)
+        self._cancel = None     # threading.Event del trabajo en curso
+        self._last = 0.0
+
+    @property
+    def busy(self) -> bool:
+        return self._cancel is not None
+
+    def run(self, title: str, fn, on_done) -> bool:
+        """Start `fn` unless another job runs; on_done(result, error) runs on the main loop."""
+        if self.busy:
+            return False
+        self._cancel = threading.Event()
+        self.label.set_label(title)
+        self.bar.set_fraction(0.0)
+        self.cancel_btn.set_sensitive(True)
+        self.set_reveal_child(True)
+        threading.Thread(target=self._work, args=(fn, on_done, self._cancel), daemon=True).start()
+        return True
+
+    def _work(self, fn, on_done, cancel):
+        try:
+            result, error = fn(self._progress, cancel), None
+        except Exception as e:
+            result, error = None, e
+        GLib.idle_add(self._finish, on_done, result, error)
+
+    def _progress(self, done: int, total: int):
+        # hilo de trabajo: como mucho ~20 actualizaciones por segundo al main loop
+        now = time.monotonic()
+        if now - self._last < 0.05 and done < total:
+            return
+        self._last = now
+        GLib.idle_add(self.bar.set_fraction, min(1.0, done / total) if total else 1.0)
+
+    def _on_cancel(self, _btn):
+        if self._cancel is not None:
+            self._cancel.set()
+            self.cancel_btn.set_sensitive(False)
+
+    def _finish(self, on_done, result, error):
+        self._cancel = None
+        self.set_reveal_child(False)
+        on_done(result, error)
+        return GLib.SOURCE_REMOVE
 
 # ===== UI widgets =====
 class ColorRow(Gtk.Box):
@@ -275,31 +672,134 @@ class OpacityRow(Gtk.Box):
     def value(self) -> int:
         return int(self.spin.get_value())
 
+# ===== List models (state lives here, widgets are recycled) =====
+class ModuleItem(GObject.Object):
+    """One entry of the modules list (or a zone header when `header` is set)."""
+    __gtype_name__ = "WaybarConfModuleItem"
+    def __init__(self, name: str, zone: str, active: bool = True, header: bool = False):
+        super().__init__()
+        self.name = name
+        self.zone = zone
+        self.active = active
+        self.header = header
+        self.dirty = False  # switch toggled in the GUI and not saved yet
+        self.row = None
+
+class StyleItem(GObject.Object):
+    """Style state of one module; kind is "header", "module", "workspaces" or
+    "palette" (one @define-color, named "@name")."""
+    __gtype_name__ = "WaybarConfStyleItem"
+    WS_TARGETS = ("container", "button", "active", "text")
+
+    def __init__(self, name: str, kind: str, state=None):
+        super().__init__()
+        self.name = name
+        self.kind = kind
+        self.state = state or {}
+        self.row = None     # widget currently bound to this item, if visible
+        self.dirty = False  # edited in the GUI and not saved yet
+        self.error = None   # CSS errors caused by this module, as text
+
+    @classmethod
+    def for_module(cls, name: str, sheet: Stylesheet):
+        sel = module_to_selector(name)
+        bg_hex, alpha, radius = read_bg_radius(sheet, sel)
+        return cls(name, "module", {"bg_hex": bg_hex, "alpha": alpha, "radius": radius,
+                                    "text_hex": read_text_hex(sheet, sel)})
+
+    @classmethod
+    def for_workspaces(cls, sheet: Stylesheet):
+        state = {}
+        for target, sel, dflt in (("container", "#workspaces", ("#111827", 0.85, 14)),
+                                  ("button", "#workspaces button", ("#111827", 0.85, 6)),
+                                  ("active", "#workspaces button.active", ("#025939", 0.95, 6))):
+            hh, aa, rr = read_bg_radius(sheet, sel, *dflt)
+            state[target] = {"bg_hex": hh, "alpha": aa, "radius": rr}
+        state["text"] = {"text_hex": read_text_hex(sheet, "#workspaces button")}
+        return cls("hyprland/workspaces", "workspaces", state)
+
+    @classmethod
+    def for_define(cls, name: str, rgba):
+        return cls("@" + name, "palette", {"bg_hex": color_hex(rgba), "alpha": rgba[3]})
+
+    def snapshot(self) -> dict:
+        """Copy of `state` (one level deep) for the undo journal."""
+        return {k: dict(v) if isinstance(v, dict) else v for k, v in self.state.items()}
+
+    def payloads(self) -> list[dict]:
+        if self.kind == "module":
+            return [{"module": self.name, **self.state}]
+        if self.kind == "workspaces":
+            return [{"module": self.name, "target": t, **self.state[t]} for t in self.WS_TARGETS]
+        if self.kind == "palette":
+            return [{"define": self.name[1:], **self.state}]
+        return []
+
+class ModuleRow(Gtk.Box):
+    def __init__(self, journal_cb=None):
+        super().__init__(orientation=Gtk.Orientation.HORIZONTAL, spacing=8,
+                         margin_start=6, margin_end=6)
+        self.item = None
+        self.journal_cb = journal_cb
+        self.icon = Gtk.Label()
+        self.lab = Gtk.Label(xalign=0); self.lab.set_hexpand(True)
+        self.sw = Gtk.Switch()
+        self.append(self.icon); self.append(self.lab); self.append(self.sw)
+        self.sw.connect("notify::active", self._on_switch)
+
+    def bind(self, item: ModuleItem):
+        self.item = None
+        self.icon.set_label(ICON_HINTS.get(item.name.split("#")[0], ""))
+        self.lab.set_label(item.name)
+        self.sw.set_active(item.active)
+        self.item = item
+        item.row = self
+
+    def unbind(self):
+        if self.item is not None and self.item.row is self:
+            self.item.row = None
+        self.item = None
+
+    def _on_switch(self, *_):
+        if self.item is not None and self.item.active != self.sw.get_active():
+            before = {"active": self.item.active}
+            self.item.active = self.sw.get_active()
+            self.item.dirty = True
+            if self.journal_cb:
+                self.journal_cb(("module", self.item.name), before, {"active": self.item.active})
+
+def error_label() -> Gtk.Label:
+    lab = Gtk.Label(xalign=0, wrap=True, visible=False, selectable=True)
+    lab.add_css_class("error")
+    return lab
+
 class ModuleStyleRow(Gtk.Box):
-    def __init__(self, module_name, initial_bg_hex, initial_alpha, initial_radius, initial_text_hex, apply_to_all_cb, live_cb):
+    def __init__(self, apply_to_all_cb, live_cb, journal_cb=None):
         super().__init__(orientation=Gtk.Orientation.VERTICAL, spacing=6)
-        self.module_name = module_name
+        self.item = None
         self.apply_to_all_cb = apply_to_all_cb
         self.live_cb = live_cb
+        self.journal_cb = journal_cb
+        self._muted = 0
 
         title = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
         icon = Gtk.Label(label="🎛")
-        lab = Gtk.Label(label=module_name, xalign=0); lab.add_css_class("title-4")
-        title.append(icon); title.append(lab)
+        self.title_lab = Gtk.Label(xalign=0); self.title_lab.add_css_class("title-4")
+        title.append(icon); title.append(self.title_lab)
         self.append(title)
 
         row1 = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
-        self.bg_picker = ColorRow(_("Background"), initial_bg_hex)
+        self.bg_picker = ColorRow(_("Background"), "#111827")
         row1.append(self.bg_picker)
-        self.opacity = OpacityRow(int(round((initial_alpha if initial_alpha is not None else 0.85) * 100)))
+        self.opacity = OpacityRow(85)
         row1.append(self.opacity)
         self.append(row1)
 
         row2 = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
         row2.append(Gtk.Label(label=_("Radius (px):"), xalign=0))
-        self.radius = Gtk.SpinButton.new_with_range(0, 30, 1); self.radius.set_value(initial_radius)
+        self.radius = Gtk.SpinButton.new_with_range(0, 30, 1); self.radius.set_value(14)
         row2.append(self.radius)
-        self.text_picker = ColorRow(_("Text"), initial_text_hex or "#ffffff")
+        self.text_picker = ColorRow(_("Text"), "#ffffff")
         row2.append(self.text_picker)
         self.append(row2)
 
@@ -308,6 +808,8 @@ class ModuleStyleRow(Gtk.Box):
         btn_all.connect("clicked", lambda *_: self.apply_to_all_cb(self.get_style_payload()))
         row3.append(btn_all)
         self.append(row3)
+        self.error_lab = error_label()
+        self.append(self.error_lab)
 
         self.bg_picker.entry.connect("changed", self._live)
         self.bg_picker.btn.connect("notify::rgba", self._live)
@@ -316,6 +818,42 @@ class ModuleStyleRow(Gtk.Box):
         self.opacity.spin.connect("value-changed", self._live)
         self.radius.connect("value-changed", self._live)
 
+    @property
+    def module_name(self):
+        return self.item.name if self.item else ""
+
+    @contextmanager
+    def muted(self):
+        """Suppress live callbacks while several widgets are set at once."""
+        self._muted += 1
+        try:
+            yield
+        finally:
+            self._muted -= 1
+
+    def set_values(self, bg_hex=None, alpha=None, radius=None, text_hex=None):
+        with self.muted():
+            if bg_hex is not None: self.bg_picker.entry.set_text(bg_hex)
+            if alpha is not None: self.opacity.spin.set_value(int(round(alpha * 100)))
+            if radius is not None: self.radius.set_value(radius)
+            if text_hex is not None: self.text_picker.entry.set_text(text_hex)
+
+    def bind(self, item: StyleItem):
+        self.item = item
+        item.row = self
+        self.title_lab.set_label(item.name)
+        self.set_values(**item.state)
+        self.show_error(item.error)
+
+    def show_error(self, text):
+        self.error_lab.set_label(text or "")
+        self.error_lab.set_visible(bool(text))
+
+    def unbind(self):
+        if self.item is not None and self.item.row is self:
+            self.item.row = None
+        self.item = None
+
     def get_style_payload(self):
         alpha = max(0, min(100, self.opacity.value())) / 100.0
         return {
@@ -326,38 +864,82 @@ class ModuleStyleRow(Gtk.Box):
             "text_hex": self.text_picker.value(),
         }
     def _live(self, *_):
-        if self.live_cb: self.live_cb(self.get_style_payload())
+        if self._muted or self.item is None:
+            return
+        payload = self.get_style_payload()
+        before = self.item.snapshot()
+        self.item.state = {k: v for k, v in payload.items() if k != "module"}
+        self.item.dirty = True
+        if self.journal_cb: self.journal_cb(("style", self.item.name), before, self.item.state)
+        if self.live_cb: self.live_cb(payload)
+
+class PaletteRow(Gtk.Box):
+    """One @define-color of the palette: every rule using @name follows it."""
+    def __init__(self, live_cb, journal_cb=None):
+        super().__init__(orientation=Gtk.Orientation.VERTICAL, spacing=4)
+        self.item = None
+        self.live_cb = live_cb
+        self.journal_cb = journal_cb
+        self._muted = 0
+
+        row = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
+        self.name_lab = Gtk.Label(xalign=0, width_chars=12)
+        self.name_lab.add_css_class("monospace")
+        self.color = ColorRow(_("Color"), "#ffffff")
+        self.opacity = OpacityRow(100)
+        row.append(self.name_lab); row.append(self.color); row.append(self.opacity)
+        self.append(row)
+        self.error_lab = error_label()
+        self.append(self.error_lab)
+
+        self.color.entry.connect("changed", self._live)
+        self.color.btn.connect("notify::rgba", self._live)
+        self.opacity.spin.connect("value-changed", self._live)
+
+    @contextmanager
+    def muted(self):
+        self._muted += 1
+        try:
+            yield
+        finally:
+            self._muted -= 1
+
+    def bind(self, item: StyleItem):
+        self.item = item
+        item.row = self
+        self.name_lab.set_label(item.name)
+        with self.muted():
+            self.color.entry.set_text(item.state["bg_hex"])
+            self.opacity.spin.set_value(int(round(item.state["alpha"] * 100)))
+        self.show_error(item.error)
+
+    def show_error(self, text):
+        self.error_lab.set_label(text or "")
+        self.error_lab.set_visible(bool(text))
+
+    def unbind(self):
+        if self.item is not None and self.item.row is self:
+            self.item.row = None
+        self.item = None
+
+    def _live(self, *_):
+        if self._muted or self.item is None:
+            return
+        before = self.item.snapshot()
+        self.item.state = {"bg_hex": self.color.value(),
+                           "alpha": max(0, min(100, self.opacity.value())) / 100.0}
+        self.item.dirty = True
+        if self.journal_cb: self.journal_cb(("style", self.item.name), before, self.item.state)
+        if self.live_cb: self.live_cb(self.item.payloads()[0])
 
 class WorkspacesStyleRow(Gtk.Box):
-    def __init__(self, apply_to_all_cb, live_cb, css_text: str):
+    def __init__(self, apply_to_all_cb, live_cb, journal_cb=None):
         super().__init__(orientation=Gtk.Orientation.VERTICAL, spacing=8)
+        self.item = None
         self.apply_to_all_cb = apply_to_all_cb
         self.live_cb = live_cb
-
-        self.sel_container = "#workspaces"
-        self.sel_button    = "#workspaces button"
-        self.sel_active    = "#workspaces button.active"
-
-        def _read_rgba_and_radius(selector, default_hex="#111827", default_alpha=0.85, default_rad=14):
-            bg_val = css_get_property(css_text, selector, "background-color") or ""
-            hh, aa = default_hex, default_alpha
-            m = re.match(r"rgba\(\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*,\s*([0-9.]+)\s*\)", bg_val or "", flags=re.I)
-            if m:
-                r,g,b,a = map(float, m.groups()); hh = f"#{int(r):02x}{int(g):02x}{int(b):02x}"; aa = float(a)
-            elif isinstance(bg_val, str) and bg_val.strip().startswith("#"):
-                hh = bg_val.strip(); aa = 1.0
-            rad_val = css_get_property(css_text, selector, "border-radius") or f"{default_rad}px"
-            try: rr = int(rad_val.strip().rstrip("px"))
-            except: rr = default_rad
-            return hh, aa, rr
-
-        cont_hex, cont_alpha, cont_rad = _read_rgba_and_radius(self.sel_container, "#111827", 0.85, 14)
-        btn_hex,  btn_alpha,  btn_rad  = _read_rgba_and_radius(self.sel_button,    "#111827", 0.85, 6)
-        act_hex,  act_alpha,  act_rad  = _read_rgba_and_radius(self.sel_active,    "#025939", 0.95, 6)
-
-        txt_hex = css_get_property(css_text, self.sel_button, "color") or "#ffffff"
-        if not (isinstance(txt_hex, str) and txt_hex.strip().startswith("#")):
-            txt_hex = "#ffffff"
+        self.journal_cb = journal_cb
+        self._muted = 0
 
         title = Gtk.Label(label="hyprland/workspaces (container + button + active + text)", xalign=0)
         title.add_css_class("title-4")
@@ -367,9 +949,9 @@ class WorkspacesStyleRow(Gtk.Box):
         sec1 = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
         sec1.append(Gtk.Label(label=_("Container background"), xalign=0))
         row1 = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
-        self.cont_bg = ColorRow(_("Background"), cont_hex)
-        self.cont_op = OpacityRow(int(round(cont_alpha * 100)))
-        self.cont_rad = Gtk.SpinButton.new_with_range(0, 30, 1); self.cont_rad.set_value(cont_rad)
+        self.cont_bg = ColorRow(_("Background"), "#111827")
+        self.cont_op = OpacityRow(85)
+        self.cont_rad = Gtk.SpinButton.new_with_range(0, 30, 1); self.cont_rad.set_value(14)
         row1.append(self.cont_bg); row1.append(self.cont_op)
         row1.append(Gtk.Label(label=_("Radius (px):"), xalign=0)); row1.append(self.cont_rad)
         sec1.append(row1); self.append(sec1)
@@ -378,9 +960,9 @@ class WorkspacesStyleRow(Gtk.Box):
         sec2 = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
         sec2.append(Gtk.Label(label=_("Button background"), xalign=0))
         row2 = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
-        self.btn_bg = ColorRow(_("Background"), btn_hex)
-        self.btn_op = OpacityRow(int(round(btn_alpha * 100)))
-        self.btn_rad = Gtk.SpinButton.new_with_range(0, 30, 1); self.btn_rad.set_value(btn_rad)
+        self.btn_bg = ColorRow(_("Background"), "#111827")
+        self.btn_op = OpacityRow(85)
+        self.btn_rad = Gtk.SpinButton.new_with_range(0, 30, 1); self.btn_rad.set_value(6)
         row2.append(self.btn_bg); row2.append(self.btn_op)
         row2.append(Gtk.Label(label=_("Radius (px):"), xalign=0)); row2.append(self.btn_rad)
         sec2.append(row2); self.append(sec2)
@@ -389,9 +971,9 @@ class WorkspacesStyleRow(Gtk.Box):
         secA = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
         secA.append(Gtk.Label(label=_("Active button background"), xalign=0))
         rowA = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
-        self.act_bg = ColorRow(_("Background"), act_hex)
-        self.act_op = OpacityRow(int(round(act_alpha * 100)))
-        self.act_rad = Gtk.SpinButton.new_with_range(0, 30, 1); self.act_rad.set_value(act_rad)
+        self.act_bg = ColorRow(_("Background"), "#025939")
+        self.act_op = OpacityRow(95)
+        self.act_rad = Gtk.SpinButton.new_with_range(0, 30, 1); self.act_rad.set_value(6)
         rowA.append(self.act_bg); rowA.append(self.act_op)
         rowA.append(Gtk.Label(label=_("Radius (px):"), xalign=0)); rowA.append(self.act_rad)
         secA.append(rowA); self.append(secA)
@@ -399,12 +981,14 @@ class WorkspacesStyleRow(Gtk.Box):
         # Text
         sec3 = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
         sec3.append(Gtk.Label(label=_("Text (on button)"), xalign=0))
-        self.txt_color = ColorRow(_("Text"), txt_hex)
+        self.txt_color = ColorRow(_("Text"), "#ffffff")
         sec3.append(self.txt_color); self.append(sec3)
 
         act = Gtk.Button(label=_("Apply bg+opacity+radius to ALL (use container values)"))
         act.connect("clicked", lambda *_: self.apply_to_all_cb(self.payload_container()))
         self.append(act)
+        self.error_lab = error_label()
+        self.append(self.error_lab)
 
         for w in [
             (self.cont_bg.entry, "changed"), (self.cont_bg.btn, "notify::rgba"),
@@ -420,6 +1004,37 @@ class WorkspacesStyleRow(Gtk.Box):
             elif isinstance(w, Gtk.SpinButton):
                 w.connect("value-changed", self._live)
 
+    @contextmanager
+    def muted(self):
+        self._muted += 1
+        try:
+            yield
+        finally:
+            self._muted -= 1
+
+    def bind(self, item: StyleItem):
+        self.item = item
+        item.row = self
+        with self.muted():
+            for target, (bg, op, rad) in (("container", (self.cont_bg, self.cont_op, self.cont_rad)),
+                                          ("button", (self.btn_bg, self.btn_op, self.btn_rad)),
+                                          ("active", (self.act_bg, self.act_op, self.act_rad))):
+                st = item.state[target]
+                bg.entry.set_text(st["bg_hex"])
+                op.spin.set_value(int(round(st["alpha"] * 100)))
+                rad.set_value(st["radius"])
+            self.txt_color.entry.set_text(item.state["text"]["text_hex"])
+        self.show_error(item.error)
+
+    def show_error(self, text):
+        self.error_lab.set_label(text or "")
+        self.error_lab.set_visible(bool(text))
+
+    def unbind(self):
+        if self.item is not None and self.item.row is self:
+            self.item.row = None
+        self.item = None
+
     def payload_container(self):
         return {"module": "hyprland/workspaces","target": "container",
                 "bg_hex": self.cont_bg.value(),
@@ -439,11 +1054,79 @@ class WorkspacesStyleRow(Gtk.Box):
         return {"module": "hyprland/workspaces","target": "text",
                 "text_hex": self.txt_color.value()}
     def _live(self, *_):
+        if self._muted or self.item is None:
+            return
+        payloads = (self.payload_container(), self.payload_button(), self.payload_active(), self.payload_text())
+        before = self.item.snapshot()
+        for p in payloads:
+            self.item.state[p["target"]] = {k: v for k, v in p.items() if k not in ("module", "target")}
+        self.item.dirty = True
+        if self.journal_cb:
+            self.journal_cb(("style", self.item.name), before, self.item.state)
         if self.live_cb:
-            self.live_cb(self.payload_container())
-            self.live_cb(self.payload_button())
-            self.live_cb(self.payload_active())
-            self.live_cb(self.payload_text())
+            for p in payloads:
+                self.live_cb(p)
+
+class RowSlot(Gtk.Box):
+    """ListView child that keeps one recycled widget per row kind."""
+    def __init__(self, builders: dict):
+        super().__init__(orientation=Gtk.Orientation.VERTICAL)
+        self.builders = builders    # kind -> callable() -> widget
+        self.rows = {}
+        self.current = None
+
+    def show(self, kind: str):
+        row = self.rows.get(kind)
+        if row is None:
+            row = self.rows[kind] = self.builders[kind]()
+        if self.current is not row:
+            if self.current is not None:
+                self.remove(self.current)
+            self.append(row)
+            self.current = row
+        return row
+
+class ThemeItem(GObject.Object):
+    """One user theme of the index (see ThemeIndex)."""
+    __gtype_name__ = "WaybarConfThemeItem"
+    def __init__(self, name: str, path: Path, entry: dict):
+        super().__init__()
+        self.name = name
+        self.path = path
+        self.digest = entry["hash"]
+        self.colors = entry["colors"]
+        self.tags = entry["tags"]
+
+class UserThemeRow(Gtk.Button):
+    def __init__(self, thumbs: "ThumbnailLoader", on_apply):
+        super().__init__()
+        self.item = None
+        self.thumbs = thumbs
+        self.pic = Gtk.Picture(can_shrink=True)
+        self.pic.set_size_request(-1, THUMB_H)
+        self.lab = Gtk.Label(xalign=0, hexpand=True, ellipsize=Pango.EllipsizeMode.END)
+        self.swatches = Gtk.Label(xalign=1)
+        line = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        line.append(self.lab); line.append(self.swatches)
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=4)
+        box.append(self.pic); box.append(line)
+        self.set_child(box)
+        self.connect("clicked", lambda _b: self.item and on_apply(self.item.path))
+
+    def bind(self, item: ThemeItem):
+        self.item = item
+        self.lab.set_label(item.name)
+        self.swatches.set_markup("".join(f'<span foreground="{c}">●</span>' for c in item.colors))
+        self.set_tooltip_text(", ".join(item.tags))
+        self.thumbs.load(self.pic, path=item.path, digest=item.digest)
+
+    def unbind(self):
+        self.item = None
+
+def zone_header(text: str = "") -> Gtk.Label:
+    lab = Gtk.Label(label=text, xalign=0); lab.add_css_class("title-4")
+    lab.set_margin_top(6)
+    return lab
 
 # ===== App principal =====
 class App(Adw.Application):
@@ -453,21 +1136,64 @@ class App(Adw.Application):
         self.connect("activate", self.on_activate)
 
         self.cfg_text = ""; self.cfg = {}; self.css_text = ""
-        self.modules_box = None
-        self.styles_box = None
-        self.module_rows = {}       # name -> row
-        self.module_switches = {}   # name -> Gtk.Switch
-        self.style_rows = {}        # name -> ModuleStyleRow | WorkspacesStyleRow
-        self.css_provider = Gtk.CssProvider()
+        self.bars = []              # ConfigBar list (config.jsonc may hold several bars)
+        self.bar_index = 0
+        self.bar_dropdown = None
+        self._bar_picker_busy = False
+        self.css_sheet = Stylesheet("")  # working model: css_text + live edits
+        self.modules_store = Gio.ListStore(item_type=ModuleItem)
+        self.styles_store = Gio.ListStore(item_type=StyleItem)
+        self.module_items = {}      # name -> ModuleItem
+        self.style_items = {}       # name -> StyleItem
+        self.css_providers = PreviewProviders(self.on_css_errors,
+                                              lambda sel, props: self.css_sheet.refinements(sel, props))
+        self.css_errors = {}        # key -> [(line, col, msg, selectors)]
+        self.mock_bar = None
+        self._validator = None
+        self.preview = PreviewScheduler(self.apply_style_edits)
+        self.journal = EditJournal()
+        self.undo_btn = self.redo_btn = None
+        self.watcher = WaybarWatcher(self.on_external_change)
+        self.jobs = JobBar()
+        self.io = IoWorker(self.set_busy)
+        self.connect("shutdown", lambda *_: self.io.shutdown())
+        self.busy_spinner = None
+        self._busy_widgets = []     # se deshabilitan mientras hay I/O en curso
+        self._file_dialog = None    # FileChooserNative abierto (hay que mantenerlo vivo)
+        self.thumbs = ThumbnailLoader()
+        self.connect("shutdown", lambda *_: self.thumbs.shutdown())
+        self.theme_index = ThemeIndex()
+        self.theme_items = {}       # name -> ThemeItem
+        self.user_themes_store = Gio.ListStore(item_type=ThemeItem)
+        self.themes_watcher = WaybarWatcher(lambda _paths: self.refresh_user_themes_list())
+        self._index_job = None      # None | "running" | "again"
+        self._theme_tags = []
         self.toast_overlay = None
+        self.win = None
+        self.startup_ms = None      # time-to-first-frame
+        self.panels_ms = None       # hasta paneles cargados
 
         # Sidebar refs
-        self.user_themes_list_box = None
+        self.theme_search = None
+        self.theme_tag = None
+        self.user_themes_empty = None
 
         # Modules editor state
         self.module_check = {}  # name -> (Gtk.CheckButton, Gtk.ComboBoxText)
 
     # ----- Helpers UI -----
+    def theme_button(self, label: str, on_click, css: str):
+        """Sidebar theme button: bar thumbnail (filled in async) + name."""
+        pic = Gtk.Picture(can_shrink=True)
+        pic.set_size_request(-1, THUMB_H)
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=4)
+        box.append(pic)
+        box.append(Gtk.Label(label=label, xalign=0))
+        btn = Gtk.Button(child=box)
+        btn.connect("clicked", lambda _b: on_click())
+        self.thumbs.load(pic, css=css)
+        return btn
+
     def clear_box(self, box: Gtk.Box):
         child = box.get_first_child()
         while child:
@@ -475,27 +1201,96 @@ class App(Adw.Application):
             box.remove(child)
             child = nxt
 
-    # ----- IO -----
-    def load_all(self):
-        self.cfg_text = read_text(CONFIG_JSONC)
-        self.cfg = read_jsonc(CONFIG_JSONC)
-        self.css_text = read_text(STYLE_CSS)
-
-    # ----- Export/Import -----
-    def export_theme_zip(self):
-        THEMES_DIR.mkdir(parents=True, exist_ok=True)
-        ts = datetime.now().strftime("%Y%m%d-%H%M%S")
-        out = THEMES_DIR / f"waybar-theme-{ts}.zip"
-        import zipfile
-        with zipfile.ZipFile(out, "w") as z:
-            if CONFIG_JSONC.exists(): z.write(CONFIG_JSONC, "config.jsonc")
-            if STYLE_CSS.exists():   z.write(STYLE_CSS,   "style.css")
-        return out
-
-    def import_theme_zip(self, filepath: str):
-        import zipfile
-        with zipfile.ZipFile(filepath, "r") as z:
-            z.extractall(WAYBAR_DIR)
+    # ----- IO (todo lo de disco pasa por self.io) -----
+    def set_busy(self, busy: bool):
+        for w in self._busy_widgets:
+            w.set_sensitive(not busy)
+        if self.busy_spinner is not None:
+            self.busy_spinner.set_visible(busy)
+            self.busy_spinner.set_spinning(busy)
+
+    def load_all(self, then=None, before=None):
+        """Read and parse config + CSS in the I/O worker (after `before()`, if
+        given), then apply it and rebuild the panels on the main loop."""
+        def job():
+            if before is not None:
+                before()
+            return load_waybar_files()
+        self.io.submit(job, lambda state, error: self._apply_loaded(state, error, then))
+
+    @PROFILER.timed
+    def _apply_loaded(self, state, error, then=None):
+        if error is not None:
+            self.toast(f"{_('Error loading')}: {error}")
+            return
+        self.cfg_text = state["cfg_text"]
+        self.bars = state["bars"]
+        if self.bar_index >= len(self.bars):
+            self.bar_index = 0
+        self.cfg = self.bars[self.bar_index].config if self.bars else state["cfg"]
+        self.css_text = state["css_text"]
+        self.css_sheet = state["sheet"]
+        self.reset_preview()
+        self.refresh_bar_picker()
+        self.refresh_modules_section()
+        self.refresh_styles_section()
+        self.apply_preview_css()
+        if then is not None:
+            then()
+
+    def current_bar(self):
+        return self.bars[self.bar_index] if self.bar_index < len(self.bars) else None
+
+    def write_config_zones(self, zones: dict, then=None):
+        """write_zones() for the current bar in the I/O worker; then(changed)
+        runs on the main loop once bars are reloaded (not when parsing failed)."""
+        bar = self.current_bar()
+        def job():
+            changed = write_zones(bar, zones)
+            return changed, (load_waybar_files() if changed else None)
+        def done(res, error):
+            if error is not None:
+                self.toast(f"{_('Error saving')}: {error}")
+                return
+            changed, state = res
+            if changed is None:
+                self.toast(_("config.jsonc could not be parsed; modules not saved"))
+                return
+            if state is not None:
+                self.apply_config_state(state)
+            if then is not None:
+                then(changed)
+        self.io.submit(job, done)
+
+    def apply_config_state(self, state):
+        self.cfg_text = state["cfg_text"]
+        self.bars = state["bars"]
+        if self.bar_index >= len(self.bars):
+            self.bar_index = 0
+        if self.current_bar():
+            self.cfg = self.current_bar().config
+        self.watcher.watch(self.watched_paths())
+
+    # ----- Bar picker -----
+    def refresh_bar_picker(self):
+        if self.bar_dropdown is None:
+            return
+        labels = [b.label() for b in self.bars]
+        self._bar_picker_busy = True
+        self.bar_dropdown.set_model(Gtk.StringList.new(labels))
+        self.bar_dropdown.set_selected(self.bar_index)
+        self._bar_picker_busy = False
+        self.bar_dropdown.set_visible(len(labels) > 1)
+
+    def on_bar_selected(self, dropdown, _pspec):
+        idx = dropdown.get_selected()
+        if self._bar_picker_busy or idx == Gtk.INVALID_LIST_POSITION or idx == self.bar_index:
+            return
+        self.bar_index = idx
+        self.cfg = self.bars[idx].config
+        self.refresh_modules_section()
+        self.refresh_styles_section()
+        self.apply_preview_css()
 
     # ----- Themes ops -----
     def apply_builtin_theme(self, name: str):
@@ -503,37 +1298,96 @@ class App(Adw.Application):
         if not css:
             self.toast(_("Theme not found"))
             return
-        write_text(STYLE_CSS, css)
-        self.css_text = css
-        self.refresh_styles_section()
-        self.apply_preview_css()
-        self.toast(f"{_('Applied theme')}: {name}")
+        self.apply_theme_css(name, lambda: css, _("Applied theme"))
+
+    def apply_theme_css(self, name: str, read, done_msg: str):
+        """Read the theme in the I/O worker, check it with GTK's CSS parser, then
+        write style.css and parse it there; the styles panel is rebuilt once
+        the new sheet is ready. Themes with CSS errors are not applied."""
+        def validated(css, error):
+            errors = self.validate_css(css) if error is None else []
+            if errors:
+                error = f"{_('CSS error')}: {self.css_error_text(css, errors)}"
+            if error is not None:
+                self.toast(f"{_('Error applying theme')}: {error}")
+                return
+            self.io.submit(lambda: write(css), done)
+        def write(css):
+            HISTORY.record("before theme")
+            if write_text(STYLE_CSS, css):
+                HISTORY.record(f"theme: {name}")
+            return css, Stylesheet(css).attach_imports(STYLE_CSS)
+        def done(res, error):
+            if error is not None:
+                self.toast(f"{_('Error applying theme')}: {error}")
+                return
+            self.css_text, self.css_sheet = res
+            self.reset_preview()
+            self.refresh_styles_section()
+            self.apply_preview_css()
+            self.toast(f"{done_msg}: {name}")
+        self.io.submit(read, validated)
 
     def refresh_user_themes_list(self):
-        if not self.user_themes_list_box:
+        """Show the persisted index right away, then re-scan the folder in a
+        thread; only new/changed .css files are read (see ThemeIndex.update)."""
+        self.show_user_themes()
+        if self._index_job:
+            self._index_job = "again"
             return
-        self.clear_box(self.user_themes_list_box)
-        found = False
-        for p in sorted(USER_THEMES_DIR.glob("*.css")):
-            found = True
-            btn = Gtk.Button(label=p.stem)
-            btn.connect("clicked", lambda _b, path=p: self.apply_user_theme(path))
-            self.user_themes_list_box.append(btn)
-        if not found:
-            lbl = Gtk.Label(label=_("(no user themes yet)"), xalign=0)
-            lbl.add_css_class("dim-label")
-            self.user_themes_list_box.append(lbl)
+        self._index_job = "running"
+        threading.Thread(target=self._index_worker, daemon=True).start()
 
-    def apply_user_theme(self, path: Path):
+    def _index_worker(self):
         try:
-            css = read_text(path)
-            write_text(STYLE_CSS, css)
-            self.css_text = css
-            self.refresh_styles_section()
-            self.apply_preview_css()
-            self.toast(f"{_('User theme applied')}: {path.stem}")
-        except Exception as e:
-            self.toast(f"{_('Error applying theme')}: {e}")
+            changed = self.theme_index.update()
+        except Exception as e:      # se sigue mostrando el índice guardado
+            GLib.idle_add(self.toast, f"{_('Error loading')}: {e}")
+            changed = False
+        GLib.idle_add(self._index_done, changed)
+
+    def _index_done(self, changed):
+        again = self._index_job == "again"
+        self._index_job = None
+        if changed:
+            self.show_user_themes()
+        if again:
+            self.refresh_user_themes_list()
+        return GLib.SOURCE_REMOVE
+
+    def show_user_themes(self, *_):
+        entries = self.theme_index.load()
+        tags = self.theme_index.tags()
+        if self.theme_tag is not None and tags != self._theme_tags:
+            current = self.selected_theme_tag()
+            self._theme_tags = tags
+            self.theme_tag.set_model(Gtk.StringList.new([_("All tags")] + tags))
+            self.theme_tag.set_selected(tags.index(current) + 1 if current in tags else 0)
+        query = self.theme_search.get_text() if self.theme_search is not None else ""
+        items = []
+        for name in self.theme_index.search(query, self.selected_theme_tag()):
+            item = self.theme_items.get(name)
+            if item is None or item.digest != entries[name]["hash"]:
+                item = self.theme_items[name] = ThemeItem(name, self.theme_index.file(name), entries[name])
+            items.append(item)
+        self._sync_store(self.user_themes_store, items)
+        if self.user_themes_empty is not None:
+            self.user_themes_empty.set_label(_("(no user themes yet)") if not entries else _("No matching themes"))
+            self.user_themes_empty.set_visible(not items)
+
+    def selected_theme_tag(self):
+        idx = self.theme_tag.get_selected() if self.theme_tag is not None else 0
+        return self._theme_tags[idx - 1] if 0 < idx <= len(self._theme_tags) else None
+
+    def user_themes_factory(self):
+        f = Gtk.SignalListItemFactory()
+        f.connect("setup", lambda _f, li: li.set_child(UserThemeRow(self.thumbs, self.apply_user_theme)))
+        f.connect("bind", lambda _f, li: li.get_child().bind(li.get_item()))
+        f.connect("unbind", lambda _f, li: li.get_child().unbind())
+        return f
+
+    def apply_user_theme(self, path: Path):
+        self.apply_theme_css(path.stem, lambda: read_text(path), _("User theme applied"))
 
     def add_current_theme(self, parent):
         dialog = Adw.MessageDialog.new(parent, _("Add current theme"), _("Save current CSS as user theme"))
@@ -552,31 +1406,125 @@ class App(Adw.Application):
             if resp == "ok":
                 name = entry.get_text().strip()
                 if name:
-                    path = USER_THEMES_DIR / f"{name}.css"
-                    try:
-                        write_text(path, self.css_text or read_text(STYLE_CSS))
-                        self.toast(f"{_('Saved theme')}: {name}")
-                        self.refresh_user_themes_list()
-                    except Exception as e:
-                        self.toast(f"{_('Error saving theme')}: {e}")
+                    self.copy_current_css(USER_THEMES_DIR / f"{name}.css", f"{_('Saved theme')}: {name}",
+                                          _("Error saving theme"), then=self.refresh_user_themes_list)
         dialog.connect("response", _resp)
 
+    def copy_current_css(self, path: Path, ok_msg: str, err_msg: str, then=None):
+        css = self.css_text
+        def job():
+            write_text(path, css or read_text(STYLE_CSS))
+        def done(_res, error):
+            if error is not None:
+                self.toast(f"{err_msg}: {error}")
+                return
+            self.toast(ok_msg)
+            if then is not None:
+                then()
+        self.io.submit(job, done)
+
     def save_default_setup(self):
-        try:
-            write_text(DEFAULT_THEME_FILE, self.css_text or read_text(STYLE_CSS))
-            self.toast(_("Default setup saved"))
-        except Exception as e:
-            self.toast(f"{_('Error saving default')}: {e}")
+        self.copy_current_css(DEFAULT_THEME_FILE, _("Default setup saved"), _("Error saving default"))
 
-    def auto_apply_default_on_start(self):
+    @staticmethod
+    def auto_apply_default_on_start():
+        # Corre en el worker de I/O (ver _load_panels): solo disco, nada de GTK
         if DEFAULT_THEME_FILE.exists():
             try:
-                css = read_text(DEFAULT_THEME_FILE)
-                write_text(STYLE_CSS, css)
-                self.css_text = css
-            except Exception:
+                write_text(STYLE_CSS, read_text(DEFAULT_THEME_FILE))
+            except OSError:
                 pass
 
+    # ----- Recolor dialog -----
+    def working_sheet(self) -> Stylesheet:
+        """css_sheet with the unsaved row edits applied (imports included)."""
+        self.preview.flush()
+        self.css_sheet.update(self.collect_style_edits())
+        return self.css_sheet
+
+    def write_stylesheet(self, sheet: Stylesheet, label: str, done_msg: str):
+        """Check style.css and the @imported files `sheet` changed with GTK's
+        parser, write them in the I/O worker and reload the panels."""
+        files = [(STYLE_CSS, sheet.serialize())] + [(p, imp.serialize()) for p, imp in sheet.imported if imp.modified]
+        for path, text in files:
+            errors = self.validate_css(text, path)
+            if errors:
+                self.toast(f"{_('CSS error, not saved')}: {path.name} {self.css_error_text(text, errors)}")
+                return
+        def job():
+            HISTORY.record(f"before {label}")
+            if any([write_text(path, text) for path, text in files]):
+                HISTORY.record(label)
+        self.io.submit(job, lambda _r, error: self.toast(f"{_('Error saving')}: {error}") if error is not None
+                       else self.load_all(then=lambda: self.toast(done_msg)))
+
+    def open_recolor_dialog(self, parent):
+        base = self.working_sheet()
+        modules = [n for n, it in self.style_items.items() if it.kind != "palette"]
+        dialog = Adw.MessageDialog.new(parent, _("Recolor theme"),
+                                       _("Shift every color of the theme at once."))
+        grid = Gtk.Grid(column_spacing=12, row_spacing=6)
+        grid.set_margin_top(8); grid.set_margin_bottom(8); grid.set_margin_start(8); grid.set_margin_end(8)
+        scales = {}
+        for row, (key, label, lo, hi) in enumerate((("hue", _("Hue"), -180, 180),
+                                                     ("saturation", _("Saturation"), -100, 100),
+                                                     ("lightness", _("Lightness"), -50, 50))):
+            sc = Gtk.Scale.new_with_range(Gtk.Orientation.HORIZONTAL, lo, hi, 1)
+            sc.set_value(0); sc.set_hexpand(True); sc.set_size_request(260, -1)
+            grid.attach(Gtk.Label(label=label, xalign=0), 0, row, 1, 1)
+            grid.attach(sc, 1, row, 1, 1)
+            scales[key] = sc
+        alpha_check = Gtk.CheckButton(label=_("Background opacity"))
+        alpha_scale = Gtk.Scale.new_with_range(Gtk.Orientation.HORIZONTAL, 0, 1, 0.01)
+        alpha_scale.set_value(0.85); alpha_scale.set_sensitive(False)
+        alpha_check.connect("toggled", lambda c: alpha_scale.set_sensitive(c.get_active()))
+        grid.attach(alpha_check, 0, 3, 1, 1)
+        grid.attach(alpha_scale, 1, 3, 1, 1)
+        grid.attach(self.title(_("Contrast")), 0, 4, 2, 1)
+        report = Gtk.Label(xalign=0, selectable=True)
+        report.add_css_class("monospace")
+        grid.attach(report, 0, 5, 2, 1)
+
+        def params():
+            return (scales["hue"].get_value(), scales["saturation"].get_value() / 100,
+                    scales["lightness"].get_value() / 100,
+                    alpha_scale.get_value() if alpha_check.get_active() else None)
+        def recolored():
+            sheet = base.copy()
+            recolor(sheet, *params())
+            return sheet
+        def update(*_):
+            lines = []
+            for r in contrast_report(recolored(), modules):
+                name = r["module"] + (f" ({r['target']})" if r["target"] else "")
+                mark = "✓" if r["ok"] else "⚠ " + _("low contrast")
+                lines.append(f"{r['ratio']:5.2f}  {r['fg']} / {r['bg']}  {name}  {mark}")
+            report.set_label("\n".join(lines) or "—")
+        for sc in list(scales.values()) + [alpha_scale]:
+            sc.connect("value-changed", update)
+        alpha_check.connect("toggled", update)
+        update()
+
+        dialog.set_extra_child(grid)
+        dialog.add_response("cancel", _("Cancel"))
+        dialog.add_response("apply", _("Apply"))
+        dialog.set_response_appearance("apply", Adw.ResponseAppearance.SUGGESTED)
+        dialog.set_close_response("cancel")
+        def _resp(_d, resp):
+            if resp == "apply":
+                self.write_stylesheet(recolored(), "recolor", _("Theme recolored"))
+        dialog.connect("response", _resp)
+        dialog.present()
+
+    # ----- Palette -----
+    def convert_to_palette(self):
+        sheet = self.working_sheet().copy()
+        added = factor_palette(sheet)
+        if not added:
+            self.toast(_("No repeated colors to factor"))
+            return
+        self.write_stylesheet(sheet, "palette", f"{_('Palette')}: " + ", ".join("@" + n for n in added))
+
     # ----- Settings dialog -----
     def open_settings_dialog(self, parent):
         dialog = Adw.MessageDialog.new(parent, _("About Waybar Configurator"), _("Community Edition"))
@@ -627,6 +1575,43 @@ class App(Adw.Application):
         dialog.set_close_response("close")
         dialog.present()
 
+    # ----- Profiling panel -----
+    def profiling_extra(self) -> dict:
+        return {"startup_ms": self.startup_ms, "panels_ms": self.panels_ms,
+                "preview": self.preview.stats()}
+
+    def open_profiling_dialog(self, parent):
+        extra = self.profiling_extra()
+        dialog = Adw.MessageDialog.new(parent, _("Profiling"),
+                                       f"{_('First frame')}: {extra['startup_ms'] or 0:.0f} ms · "
+                                       f"{_('Panels loaded')}: {extra['panels_ms'] or 0:.0f} ms")
+        pv = extra["preview"]
+        text = (PROFILER.report() + "\n\n"
+                f"preview: queued={pv['queued']} flushes={pv['flushes']} coalesced={pv['coalesced']}")
+        lab = Gtk.Label(label=text, xalign=0, selectable=True)
+        lab.add_css_class("monospace")
+        scrolled = Gtk.ScrolledWindow(); scrolled.set_min_content_height(280); scrolled.set_min_content_width(640)
+        scrolled.set_child(lab)
+        dialog.set_extra_child(scrolled)
+        dialog.add_response("json", _("Dump JSON"))
+        dialog.add_response("pstats", _("Dump cProfile"))
+        dialog.add_response("close", _("Close"))
+        dialog.set_close_response("close")
+        def _resp(_d, resp):
+            ts = datetime.now().strftime("%Y%m%d-%H%M%S")
+            try:
+                if resp == "json":
+                    out = PROFILER.dump_json(STORAGE_DIR / f"profile-{ts}.json", self.profiling_extra())
+                elif resp == "pstats":
+                    out = PROFILER.dump_pstats(STORAGE_DIR / f"profile-{ts}.prof")
+                else:
+                    return
+                self.toast(f"{_('Exported')}: {out}")
+            except Exception as e:
+                self.toast(f"{_('Error exporting')}: {e}")
+        dialog.connect("response", _resp)
+        dialog.present()
+
     # ----- Modules Editor -----
     def open_modules_editor(self):
         win = Adw.ApplicationWindow.new(self)
@@ -719,26 +1704,27 @@ class App(Adw.Application):
                     center.append(name)
                 else:
                     right.append(name)
-        # Reescribimos los arrays en el JSONC (sin comentarios aquí)
-        cfg = read_jsonc(CONFIG_JSONC)
-        cfg["modules-left"] = left
-        cfg["modules-center"] = center
-        cfg["modules-right"] = right
-        write_text(CONFIG_JSONC, json5.dumps(cfg, indent=2))
-        self.cfg = cfg
-        self.cfg_text = read_text(CONFIG_JSONC)
-        self.refresh_modules_section()
-        self.toast(_("Modules updated"))
-        dialog_win.close()
+        def written(_changed):
+            self.refresh_modules_section()
+            self.toast(_("Modules updated"))
+            dialog_win.close()
+        # Reescribimos solo los arrays de zonas en el JSONC (el resto queda igual)
+        self.write_config_zones({"modules-left":   [(n, True) for n in left],
+                                 "modules-center": [(n, True) for n in center],
+                                 "modules-right":  [(n, True) for n in right]}, then=written)
 
     # ----- Activate -----
     def on_activate(self, _app):
-        ensure_backup()
-        self.auto_apply_default_on_start()
-        self.load_all()
+        if self.win is not None:
+            self.win.present()
+            return
+        Adw.StyleManager.get_default().set_color_scheme(Adw.ColorScheme.PREFER_DARK)
+        ensure_storage_dirs()
 
         win = Adw.ApplicationWindow(application=self, title="Waybar Configurator v1.0b")
+        self.win = win
         win.set_default_size(1200, 780); win.set_resizable(True)
+        self.preview.attach(win)
 
         hbox = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=0)
         win.set_content(hbox)
@@ -764,10 +1750,8 @@ class App(Adw.Application):
         # Built-in Themes
         themes_lbl = Gtk.Label(label="🎨 " + _("Themes"), xalign=0); themes_lbl.add_css_class("title-4")
         sidebar.append(themes_lbl)
-        for name in BUILTIN_THEMES.keys():
-            btn = Gtk.Button(label=name)
-            btn.connect("clicked", lambda _b, nm=name: self.apply_builtin_theme(nm))
-            sidebar.append(btn)
+        for name, css in BUILTIN_THEMES.items():
+            sidebar.append(self.theme_button(name, lambda nm=name: self.apply_builtin_theme(nm), css=css))
         more_btn = Gtk.Button(label="➕ " + _("More soon…"))
         more_btn.set_sensitive(False)
         sidebar.append(more_btn)
@@ -776,12 +1760,31 @@ class App(Adw.Application):
         u_lbl = Gtk.Label(label="👤 " + _("User Themes"), xalign=0); u_lbl.add_css_class("title-4")
         sidebar.append(u_lbl)
 
-        self.user_themes_list_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
-        frame = Gtk.Frame()
-        frame.set_child(self.user_themes_list_box)
+        self.theme_search = Gtk.SearchEntry(placeholder_text=_("Search themes…"))
+        self.theme_search.connect("search-changed", self.show_user_themes)
+        sidebar.append(self.theme_search)
+        self.theme_tag = Gtk.DropDown.new_from_strings([_("All tags")])
+        self.theme_tag.connect("notify::selected", self.show_user_themes)
+        sidebar.append(self.theme_tag)
+        self.user_themes_empty = Gtk.Label(label=_("(no user themes yet)"), xalign=0)
+        self.user_themes_empty.add_css_class("dim-label")
+        sidebar.append(self.user_themes_empty)
+        # ListView: solo se crean filas para lo visible, aunque haya miles de temas
+        themes_view = Gtk.ListView(model=Gtk.NoSelection(model=self.user_themes_store),
+                                   factory=self.user_themes_factory())
+        themes_scroll = Gtk.ScrolledWindow(hscrollbar_policy=Gtk.PolicyType.NEVER, child=themes_view)
+        themes_scroll.set_min_content_height(240)
+        frame = Gtk.Frame(child=themes_scroll)
         frame.set_hexpand(True)
         sidebar.append(frame)
-        self.refresh_user_themes_list()
+
+        btn_recolor = Gtk.Button(label="🎨 " + _("Recolor theme"))
+        btn_recolor.connect("clicked", lambda *_: self.open_recolor_dialog(win))
+        sidebar.append(btn_recolor)
+        btn_palette = Gtk.Button(label="🎯 " + _("Convert to palette"))
+        btn_palette.set_tooltip_text(_("Repeated colors become @define-color variables the modules share"))
+        btn_palette.connect("clicked", lambda *_: self.convert_to_palette())
+        sidebar.append(btn_palette)
 
         add_cur = Gtk.Button(label="➕ " + _("Add current theme"))
         add_cur.connect("clicked", lambda *_: self.add_current_theme(win))
@@ -803,17 +1806,25 @@ class App(Adw.Application):
 
         btn_sr = Gtk.Button(label="🔄 " + _("Save & Restart"))
         btn_sr.connect("clicked", self.on_save_restart_clicked)
+        self._busy_widgets.append(btn_sr)
         sidebar.append(btn_sr)
 
         btn_cfg = Gtk.Button(label="⚙️ " + _("Settings"))
         btn_cfg.connect("clicked", lambda *_: self.open_settings_dialog(win))
         sidebar.append(btn_cfg)
 
+        if PROFILER.enabled:
+            btn_prof = Gtk.Button(label="🐞 " + _("Profiling"))
+            btn_prof.connect("clicked", lambda *_: self.open_profiling_dialog(win))
+            sidebar.append(btn_prof)
+
         foot = Gtk.Label(label="v1.0b – by veitorman", xalign=0.5)
         foot.add_css_class("dim-label")
         sidebar.append(foot)
 
-        hbox.append(sidebar)
+        # con miniaturas la barra lateral puede pasar el alto de la ventana
+        side_scroll = Gtk.ScrolledWindow(hscrollbar_policy=Gtk.PolicyType.NEVER, child=sidebar)
+        hbox.append(side_scroll)
 
         # === Panel derecho ===
         root = Adw.ToolbarView()
@@ -823,86 +1834,189 @@ class App(Adw.Application):
         btn_save.connect("clicked", self.on_save_clicked)
         btn_restore.connect("clicked", self.on_restore_clicked)
         header.pack_start(btn_restore); header.pack_end(btn_save)
+        self._busy_widgets += [btn_save, btn_restore]
+        self.busy_spinner = Gtk.Spinner(visible=False, tooltip_text=_("Working…"))
+        header.pack_start(self.busy_spinner)
+        self.undo_btn = Gtk.Button(icon_name="edit-undo-symbolic", tooltip_text=_("Undo") + " (Ctrl+Z)")
+        self.redo_btn = Gtk.Button(icon_name="edit-redo-symbolic", tooltip_text=_("Redo") + " (Ctrl+Shift+Z)")
+        self.undo_btn.connect("clicked", self.undo)
+        self.redo_btn.connect("clicked", self.redo)
+        header.pack_end(self.redo_btn); header.pack_end(self.undo_btn)
+        for name, cb, accels in (("undo", self.undo, ["<Control>z"]),
+                                 ("redo", self.redo, ["<Control><Shift>z", "<Control>y"])):
+            action = Gio.SimpleAction.new(name, None)
+            action.connect("activate", cb)
+            self.add_action(action)
+            self.set_accels_for_action(f"app.{name}", accels)
+        self.update_undo_buttons()
+        self.bar_dropdown = Gtk.DropDown.new_from_strings([])
+        self.bar_dropdown.set_tooltip_text(_("Bar"))
+        self.bar_dropdown.set_visible(False)
+        self.bar_dropdown.connect("notify::selected", self.on_bar_selected)
+        header.pack_start(self.bar_dropdown)
         root.add_top_bar(header)
+        root.add_top_bar(self.jobs)
 
         self.toast_overlay = Adw.ToastOverlay()
         root.set_content(self.toast_overlay)
         self.toast_overlay.set_vexpand(True)
 
-        scrolled = Gtk.ScrolledWindow(); scrolled.set_vexpand(True)
-        content = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=16,
-                          margin_top=12, margin_bottom=24, margin_start=16, margin_end=16)
-        content.set_vexpand(True)
-        scrolled.set_child(content)
-        self.toast_overlay.set_child(scrolled)
-
-        content.append(self.title("🧩  " + _("Modules (from JSON)")))
-        self.modules_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=8)
-        content.append(self.modules_box)
-        self.refresh_modules_section()
-
-        content.append(self.title("🎨  " + _("Per-module styles (grouped by zone)")))
-        self.styles_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=10)
-        content.append(self.styles_box)
-        self.refresh_styles_section()
-
-        self.apply_preview_css()
+        # Listas virtualizadas: solo se crean (y reciclan) las filas visibles
+        paned = Gtk.Paned(orientation=Gtk.Orientation.VERTICAL)
+        paned.set_margin_top(12); paned.set_margin_bottom(24); paned.set_margin_start(16); paned.set_margin_end(16)
+        paned.set_start_child(self.list_section("🧩  " + _("Modules (from JSON)"),
+                                                self.modules_store, self.modules_factory()))
+        paned.set_end_child(self.list_section("🎨  " + _("Per-module styles (grouped by zone)"),
+                                              self.styles_store, self.styles_factory()))
+        paned.set_position(260)
+        # Barra simulada: los cambios de estilo se ven acá sin escribir ni reiniciar Waybar
+        content = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
+        preview_title = self.title("👁  " + _("Preview"))
+        preview_title.set_margin_top(12); preview_title.set_margin_start(16)
+        content.append(preview_title)
+        self.mock_bar = MockBar(self.css_providers)
+        mock_frame = Gtk.Frame(child=self.mock_bar)
+        mock_frame.set_margin_start(16); mock_frame.set_margin_end(16)
+        content.append(mock_frame)
+        paned.set_vexpand(True)
+        content.append(paned)
+        self.toast_overlay.set_child(content)
 
         hbox.append(root)
+        # Primero se pinta la ventana vacía; los paneles se llenan después del primer frame
+        win.add_tick_callback(self._on_first_frame)
         win.present()
 
+    def _on_first_frame(self, _win, _clock):
+        self.startup_ms = (time.perf_counter() - _T_START) * 1000   # se ve en el diálogo de profiling
+        GLib.idle_add(self._load_panels)
+        return GLib.SOURCE_REMOVE
+
+    def _load_panels(self):
+        def before():
+            ensure_backup()
+            self.auto_apply_default_on_start()
+        def loaded():
+            self.refresh_user_themes_list()
+            self.themes_watcher.watch((), trees=[USER_THEMES_DIR])
+            self.panels_ms = (time.perf_counter() - _T_START) * 1000
+        self.load_all(then=loaded, before=before)
+        return GLib.SOURCE_REMOVE
+
     def title(self, txt):
         l = Gtk.Label(label=txt, xalign=0); l.add_css_class("title-3"); return l
 
+    def list_section(self, title_txt, store, factory):
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=8)
+        box.append(self.title(title_txt))
+        view = Gtk.ListView(model=Gtk.NoSelection(model=store), factory=factory)
+        scrolled = Gtk.ScrolledWindow(); scrolled.set_vexpand(True)
+        scrolled.set_child(view)
+        box.append(scrolled)
+        return box
+
+    def modules_factory(self):
+        f = Gtk.SignalListItemFactory()
+        f.connect("setup", lambda _f, li: li.set_child(RowSlot({"header": zone_header, "module": lambda: ModuleRow(self.record_edit)})))
+        def _bind(_f, li):
+            item = li.get_item()
+            row = li.get_child().show("header" if item.header else "module")
+            if item.header: row.set_label(item.name)
+            else: row.bind(item)
+        def _unbind(_f, li):
+            row = li.get_child().current
+            if isinstance(row, ModuleRow): row.unbind()
+        f.connect("bind", _bind)
+        f.connect("unbind", _unbind)
+        return f
+
+    def styles_factory(self):
+        builders = {
+            "header": zone_header,
+            "module": lambda: ModuleStyleRow(self.apply_style_to_all, self.on_live_style_change, self.record_edit),
+            "workspaces": lambda: WorkspacesStyleRow(self.apply_style_to_all, self.on_live_style_change, self.record_edit),
+            "palette": lambda: PaletteRow(self.on_live_style_change, self.record_edit),
+        }
+        f = Gtk.SignalListItemFactory()
+        f.connect("setup", lambda _f, li: li.set_child(RowSlot(builders)))
+        def _bind(_f, li):
+            item = li.get_item()
+            row = li.get_child().show(item.kind)
+            if item.kind == "header": row.set_label(item.name)
+            else: row.bind(item)
+        def _unbind(_f, li):
+            row = li.get_child().current
+            if isinstance(row, (ModuleStyleRow, WorkspacesStyleRow, PaletteRow)): row.unbind()
+        f.connect("bind", _bind)
+        f.connect("unbind", _unbind)
+        return f
+
     # ---------- Lectura textual módulos (preserva //) ----------
+    @PROFILER.timed
     def _read_modules_zone_textual(self, key: str):
-        text = self.cfg_text
-        pat = rf'"{re.escape(key)}"\s*:\s*\[(.*?)\]'
-        m = re.search(pat, text, flags=re.S)
-        result = []
-        if not m:
-            for name in self.cfg.get(key, []):
-                result.append((name, True))
-            return result
-        inner = m.group(1)
-        for line in inner.splitlines():
-            s = line.strip().rstrip(",")
-            if not s: continue
-            active = True
-            if s.startswith("//"):
-                active = False
-                s = s[2:].strip()
-            q = re.match(r'^"(.+)"$', s)
-            name = q.group(1) if q else s.strip('" ')
-            if name: result.append((name, active))
-        if not result and key in self.cfg:
-            result = [(x, True) for x in self.cfg[key]]
-        return result
+        bar = self.current_bar()
+        zone = bar.zone(key) if bar else None
+        if zone is None:
+            return [(name, True) for name in self.cfg.get(key, [])]
+        return zone
 
     # ---------- Sección MÓDULOS ----------
-    def refresh_modules_section(self):
-        self.clear_box(self.modules_box)
-        self.module_rows.clear()
-        self.module_switches.clear()
-
+    def _sync_store(self, store: Gio.ListStore, items: list):
+        """Splice only the range of `store` that differs from `items` (by identity)."""
+        cur = [store.get_item(i) for i in range(store.get_n_items())]
+        pre = 0
+        while pre < min(len(cur), len(items)) and cur[pre] is items[pre]:
+            pre += 1
+        suf = 0
+        while suf < min(len(cur), len(items)) - pre and cur[-1 - suf] is items[-1 - suf]:
+            suf += 1
+        if pre == len(cur) == len(items):
+            return
+        store.splice(pre, len(cur) - pre - suf, items[pre:len(items) - suf])
+
+    def refresh_modules_section(self, keep_edits: bool = False):
+        """Rebuild module items; with keep_edits, reuse existing ones and keep unsaved switches."""
+        old = {}
+        if keep_edits:
+            for i in range(self.modules_store.get_n_items()):
+                it = self.modules_store.get_item(i)
+                old[(it.zone, it.name, it.header)] = it
+        items = []
+        self.module_items = {}
         for zone in ("modules-left","modules-center","modules-right"):
-            zlab = Gtk.Label(label=zone, xalign=0); zlab.add_css_class("title-4")
-            self.modules_box.append(zlab)
+            items.append(old.get((zone, zone, True)) or ModuleItem(zone, zone, header=True))
             for name, active in self._read_modules_zone_textual(zone):
-                row = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8,
-                              margin_start=6, margin_end=6)
-                icon = Gtk.Label(label=ICON_HINTS.get(name.split("#")[0], ""))
-                lab = Gtk.Label(label=name, xalign=0); lab.set_hexpand(True)
-                sw = Gtk.Switch(active=active)
-                row.append(icon); row.append(lab); row.append(sw)
-                self.modules_box.append(row)
-                self.module_rows[name] = row
-                self.module_switches[name] = sw
+                item = old.get((zone, name, False))
+                if item is None:
+                    item = ModuleItem(name, zone, active)
+                elif not item.dirty and item.active != active:
+                    item.active = active
+                    if item.row is not None: item.row.bind(item)
+                items.append(item)
+                self.module_items[name] = item
+        self._sync_store(self.modules_store, items)
+        self.refresh_mock_bar()
+
+    def refresh_mock_bar(self):
+        if self.mock_bar is None:
+            return
+        zones = {}
+        for key in JsoncDocument.ZONES:
+            zones[key] = [(n, self.module_items[n].active if n in self.module_items else active)
+                          for n, active in self._read_modules_zone_textual(key)]
+        self.mock_bar.queue_build(zones, self.cfg)
 
     # ---------- Sección ESTILOS ----------
-    def refresh_styles_section(self):
-        self.clear_box(self.styles_box)
-        self.style_rows.clear()
+    @PROFILER.timed
+    def refresh_styles_section(self, keep_edits: bool = False):
+        """Rebuild style items from css_sheet; with keep_edits, unsaved rows keep their values."""
+        old = {}
+        if keep_edits:
+            for i in range(self.styles_store.get_n_items()):
+                it = self.styles_store.get_item(i)
+                old[(it.kind, it.name)] = it
+        else:
+            self.preview.discard()
 
         zones = {
             "modules-left":   [n for (n, _) in self._read_modules_zone_textual("modules-left")],
@@ -912,50 +2026,33 @@ class App(Adw.Application):
         seen = set(n for arr in zones.values() for n in arr)
 
         css_only = []
-        for css_mod in extract_css_ids(self.css_text):
+        for css_mod in extract_css_ids(self.css_sheet):
             if css_mod not in seen:
                 css_only.append(css_mod)
 
+        items = []
+        self.style_items = {}
+        colors = palette(self.css_sheet)
         def add_zone(title_text, names):
-            ztitle = Gtk.Label(label=title_text, xalign=0); ztitle.add_css_class("title-4")
-            self.styles_box.append(ztitle)
+            items.append(old.get(("header", title_text)) or StyleItem(title_text, "header"))
             for name in names:
-                if name == "hyprland/workspaces":
-                    row = WorkspacesStyleRow(self.apply_style_to_all, self.on_live_style_change, self.css_text)
-                    self.styles_box.append(row)
-                    self.style_rows["hyprland/workspaces"] = row
-                    continue
-
-                sel = module_to_selector(name)
-                text_hex = css_get_property(self.css_text, sel, "color") or "#ffffff"
-                if not (isinstance(text_hex, str) and text_hex.strip().startswith("#")):
-                    text_hex = "#ffffff"
-
-                bg_val = css_get_property(self.css_text, sel, "background-color") or ""
-                bg_hex, alpha = "#111827", 0.85
-                m_rgba = re.match(r"rgba\(\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*,\s*([0-9.]+)\s*\)", bg_val or "", flags=re.I)
-                if m_rgba:
-                    r,g,b,a = map(float, m_rgba.groups())
-                    bg_hex = f"#{int(r):02x}{int(g):02x}{int(b):02x}"; alpha = float(a)
-                elif isinstance(bg_val, str) and bg_val.strip().startswith("#"):
-                    bg_hex = bg_val.strip(); alpha = 1.0
-
-                rad_val = css_get_property(self.css_text, sel, "border-radius") or "14px"
-                try: radius = int(rad_val.strip().rstrip("px"))
-                except: radius = 14
-
-                row = ModuleStyleRow(
-                    module_name=name,
-                    initial_bg_hex=bg_hex,
-                    initial_alpha=alpha,
-                    initial_radius=radius,
-                    initial_text_hex=text_hex,
-                    apply_to_all_cb=self.apply_style_to_all,
-                    live_cb=self.on_live_style_change,
-                )
-                self.styles_box.append(row)
-                self.style_rows[name] = row
-
+                if name.startswith("@"):
+                    fresh = StyleItem.for_define(name[1:], colors[name[1:]])
+                elif name == "hyprland/workspaces":
+                    fresh = StyleItem.for_workspaces(self.css_sheet)
+                else:
+                    fresh = StyleItem.for_module(name, self.css_sheet)
+                item = old.get((fresh.kind, name))
+                if item is None:
+                    item = fresh
+                elif not item.dirty and item.state != fresh.state:
+                    item.state = fresh.state
+                    if item.row is not None: item.row.bind(item)
+                items.append(item)
+                self.style_items[name] = item
+
+        if colors:
+            add_zone(_("Palette"), ["@" + n for n in colors])
         add_zone("modules-left", zones["modules-left"])
         add_zone("modules-center", zones["modules-center"])
         add_zone("modules-right", zones["modules-right"])
@@ -963,191 +2060,453 @@ class App(Adw.Application):
         if css_only:
             add_zone(_("Others (CSS only)"), css_only)
 
+        self._sync_store(self.styles_store, items)
+        self.show_css_errors()
+
+    # ---------- Cambios externos (watcher) ----------
+    def watched_paths(self) -> set:
+        paths = {CONFIG_JSONC, STYLE_CSS}
+        for bar in self.bars:
+            paths.update(bar.files)
+        paths.update(p for p, _sheet in self.css_sheet.imported)
+        return paths
+
+    def on_external_change(self, paths: set):
+        imports = self.watched_paths() - {CONFIG_JSONC, STYLE_CSS} - {f for b in self.bars for f in b.files}
+        css_hit = STYLE_CSS in paths or bool(paths & imports)
+        cfg_hit = bool(paths - {STYLE_CSS} - imports)
+        force = STYLE_CSS not in paths
+        def done(state, error):
+            if error is not None:
+                self.toast(f"{_('Error loading')}: {error}")
+                return
+            changed = False
+            if cfg_hit:
+                changed |= self.sync_config_from_disk(state)
+            if css_hit:
+                changed |= self.sync_css_from_disk(state, force=force)
+            self.watcher.watch(self.watched_paths())
+            if changed:
+                self.toast(_("Reloaded external changes"))
+        self.io.submit(load_waybar_files, done)
+
+    def sync_config_from_disk(self, state) -> bool:
+        before = {k: self._read_modules_zone_textual(k) for k in JsoncDocument.ZONES}
+        self.cfg_text = state["cfg_text"]
+        self.bars = state["bars"]
+        if self.bar_index >= len(self.bars):
+            self.bar_index = 0
+        if self.current_bar():
+            self.cfg = self.current_bar().config
+        self.refresh_bar_picker()
+        after = {k: self._read_modules_zone_textual(k) for k in JsoncDocument.ZONES}
+        if before == after:
+            return False
+        self.refresh_modules_section(keep_edits=True)
+        self.refresh_styles_section(keep_edits=True)
+        return True
+
+    def sync_css_from_disk(self, state, force: bool = False) -> bool:
+        text = state["css_text"]
+        if text == self.css_text and not force:
+            return False
+        self.preview.flush()
+        self.css_text = text
+        self.css_sheet = state["sheet"]
+        self.css_providers.reset(text)
+        self.refresh_styles_section(keep_edits=True)
+        # Lo editado y no guardado se vuelve a aplicar encima del CSS nuevo
+        self.apply_style_edits(self.collect_style_edits())
+        return True
+
     # ---------- Aplicar a TODOS + live CSS ----------
     def apply_style_to_all(self, payload: dict):
-        if payload.get("module") == "hyprland/workspaces" and payload.get("target") == "container":
-            for key, mrow in self.style_rows.items():
-                if key == "hyprland/workspaces":
+        if not ("bg_hex" in payload and "alpha" in payload and "radius" in payload):
+            return
+        from_ws = payload.get("module") == "hyprland/workspaces" and payload.get("target") == "container"
+        with self.preview.batch(), self.journal.group():
+            for key, item in self.style_items.items():
+                if item.kind != "module" or key == payload.get("module"):
                     continue
-                if isinstance(mrow, ModuleStyleRow):
-                    mrow.bg_picker.entry.set_text(payload["bg_hex"])
-                    mrow.opacity.spin.set_value(int(round(payload["alpha"] * 100)))
-                    mrow.radius.set_value(payload["radius"])
-            self.apply_preview_css()
+                before = item.snapshot()
+                item.state.update(bg_hex=payload["bg_hex"], alpha=payload["alpha"], radius=payload["radius"])
+                item.dirty = True
+                self.record_edit(("style", key), before, item.state)
+                if item.row is not None:
+                    item.row.bind(item)
+                for p in item.payloads():
+                    self.on_live_style_change(p)
+        if from_ws:
             self.toast(_("Applied to all from Workspaces (container)"))
-            return
-
-        if "bg_hex" in payload and "alpha" in payload and "radius" in payload:
-            for key, mrow in self.style_rows.items():
-                if isinstance(mrow, ModuleStyleRow):
-                    if key == payload.get("module"):
-                        continue
-                    mrow.bg_picker.entry.set_text(payload["bg_hex"])
-                    mrow.opacity.spin.set_value(int(round(payload["alpha"] * 100)))
-                    mrow.radius.set_value(payload["radius"])
-            self.apply_preview_css()
+        else:
             self.toast(f"{_('Applied to all from')}: {payload.get('module','(module)')}")
 
-    def on_live_style_change(self, payload: dict):
-        css = self.css_text or ""
-        if payload.get("module") == "hyprland/workspaces":
-            if payload.get("target") == "container":
-                css = css_set_property(css, "#workspaces", "background-color", rgba_css(payload["bg_hex"], payload["alpha"]))
-                css = css_set_property(css, "#workspaces", "border-radius", f"{payload['radius']}px")
-            elif payload.get("target") == "button":
-                css = css_set_property(css, "#workspaces button", "background-color", rgba_css(payload["bg_hex"], payload["alpha"]))
-                css = css_set_property(css, "#workspaces button", "border-radius", f"{payload['radius']}px")
-            elif payload.get("target") == "active":
-                css = css_set_property(css, "#workspaces button.active", "background-color", rgba_css(payload["bg_hex"], payload["alpha"]))
-                css = css_set_property(css, "#workspaces button.active", "border-radius", f"{payload['radius']}px")
-            elif payload.get("target") == "text":
-                css = css_set_property(css, "#workspaces button", "color", payload["text_hex"])
+    def collect_style_edits(self) -> list:
+        """Edits of the rows changed in the GUI; untouched rows were read from
+        css_sheet, so re-applying them could only add rules (and a save)."""
+        return self.style_item_edits(it for it in self.style_items.values() if it.dirty)
+
+    def style_item_edits(self, items) -> list:
+        """CSS edits of `items`; payloads with an invalid color are left out and
+        reported on their row instead."""
+        edits = []
+        for item in items:
+            for p in item.payloads():
+                edits.extend(self.payload_edits(p) or [])
+        return edits
+
+    def payload_edits(self, payload: dict):
+        name = "@" + payload["define"] if "define" in payload else payload["module"]
+        key = ("value", name, payload.get("target"))
+        try:
+            edits = style_edits(payload)
+        except ValueError as e:
+            sel = name if "define" in payload else \
+                WS_SELECTORS.get(payload.get("target")) or module_to_selector(name)
+            self.set_css_errors(key, [(0, 0, str(e))], [sel])
+            return None
+        if key in self.css_errors:
+            self.set_css_errors(key, [])
+        return edits
+
+    # ---------- Validación CSS ----------
+    def validate_css(self, css: str, path: Path = STYLE_CSS) -> list:
+        """GTK parse errors of a whole stylesheet as (line, col, msg); relative
+        @imports are resolved from `path`'s folder."""
+        if self._validator is None:
+            self._validator = CssValidator()
+        return self._validator.check(absolute_imports(css, path.parent))
+
+    def on_css_errors(self, key, errors):
+        """Errors of one preview provider: key is the overlay's selector (only
+        that rule was re-parsed) or None for the base stylesheet."""
+        if key is None:
+            css = self.css_text or ""
+            self.set_css_errors(key, errors, [selectors_at(css, line, col) for line, col, _m in errors])
+            if errors:
+                self.toast(f"{_('style.css has CSS errors')}: {self.css_error_text(css, errors)}")
         else:
-            sel = module_to_selector(payload["module"])
-            css = css_set_property(css, sel, "background-color", rgba_css(payload["bg_hex"], payload["alpha"]))
-            css = css_set_property(css, sel, "border-radius", f"{payload['radius']}px")
-            css = css_set_property(css, sel, "color", payload["text_hex"])
+            self.set_css_errors(key, [(0, 0, msg) for _l, _c, msg in errors], [[key]] * len(errors))
+
+    def set_css_errors(self, key, errors, selectors=()):
+        selectors = list(selectors)
+        entries = []
+        for i, (line, col, msg) in enumerate(errors):
+            sels = selectors[i] if i < len(selectors) else []
+            entries.append((line, col, msg, [sels] if isinstance(sels, str) else sels))
+        if entries:
+            self.css_errors[key] = entries
+        elif self.css_errors.pop(key, None) is None:
+            return
+        self.show_css_errors()
+
+    def item_for_selectors(self, selectors):
+        for name, item in self.style_items.items():
+            own = set(WS_SELECTORS.values()) if item.kind == "workspaces" else \
+                {name} if item.kind == "palette" else {module_to_selector(name)}
+            if own & set(selectors):
+                return name
+        return None
 
-        try:
-            self.css_provider.load_from_data(css.encode("utf-8"))
-            display = Gdk.Display.get_default()
-            Gtk.StyleContext.add_provider_for_display(display, self.css_provider, Gtk.STYLE_PROVIDER_PRIORITY_USER)
-        except Exception:
-            pass
+    def show_css_errors(self):
+        per_item = {}
+        for entries in self.css_errors.values():
+            for line, col, msg, sels in entries:
+                name = self.item_for_selectors(sels)
+                per_item.setdefault(name, []).append(f"⚠ {line}:{col}  {msg}" if line else f"⚠ {msg}")
+        for name, item in self.style_items.items():
+            err = "\n".join(per_item.get(name, [])) or None
+            if err != item.error:
+                item.error = err
+                if item.row is not None:
+                    item.row.show_error(err)
+
+    def css_error_text(self, css: str, errors) -> str:
+        line, col, msg = errors[0]
+        where = (", ".join(selectors_at(css, line, col)) or f"{line}:{col}") if line else ""
+        more = f" (+{len(errors) - 1})" if len(errors) > 1 else ""
+        return f"{where}: {msg}{more}"
+
+    def reset_preview(self):
+        self.journal.clear()        # los pasos guardados eran sobre el estado anterior
+        self.update_undo_buttons()
+        self.preview.discard()
+        self.css_providers.reset(self.css_text or "")
+        self.watcher.watch(self.watched_paths())
+
+    @PROFILER.timed
+    def apply_style_edits(self, edits):
+        changed, defines = {}, False
+        for sel, prop, val in edits:
+            if self.css_sheet.set(sel, prop, val):
+                if sel is None:
+                    defines = True
+                else:
+                    changed.setdefault(sel, {})[prop] = val
+        if defines:
+            # Un @define-color cambia todas las reglas que lo usan: un solo
+            # re-parse de la base. Los @import se leen de disco, así que lo
+            # editado en colors.css se redefine al final (gana el último).
+            sheet = self.css_sheet
+            css = sheet.serialize() + "".join(f"\n@define-color {n} {sheet.define(n)};"
+                                              for n, owner in sheet.symbols().items()
+                                              if owner is not sheet and owner.modified)
+            self.css_providers.reload_base(css)
+            self.refresh_style_states()
+        for sel, props in changed.items():
+            self.css_providers.update(sel, props)
+
+    def refresh_style_states(self):
+        """Re-read module rows from css_sheet after a palette change: they show
+        resolved colors, and a stale one would be saved over the @name."""
+        pending = {k[1] for k in self.css_errors if isinstance(k, tuple)}
+        for name, item in self.style_items.items():
+            if item.kind not in ("module", "workspaces") or name in pending:
+                continue
+            fresh = (StyleItem.for_workspaces(self.css_sheet) if item.kind == "workspaces"
+                     else StyleItem.for_module(name, self.css_sheet))
+            if fresh.state != item.state:
+                item.state = fresh.state
+                if item.row is not None:
+                    item.row.bind(item)
+
+    @PROFILER.timed
+    def on_live_style_change(self, payload: dict):
+        edits = self.payload_edits(payload)
+        if edits is not None:
+            self.preview.queue(edits)
 
+    @PROFILER.timed
     def apply_preview_css(self):
-        css = self.css_text or ""
-        for key, row in self.style_rows.items():
-            if key == "hyprland/workspaces" and isinstance(row, WorkspacesStyleRow):
-                p1 = row.payload_container()
-                p2 = row.payload_button()
-                pA = row.payload_active()
-                p3 = row.payload_text()
-                css = css_set_property(css, "#workspaces", "background-color", rgba_css(p1["bg_hex"], p1["alpha"]))
-                css = css_set_property(css, "#workspaces", "border-radius", f"{p1['radius']}px")
-                css = css_set_property(css, "#workspaces button", "background-color", rgba_css(p2["bg_hex"], p2["alpha"]))
-                css = css_set_property(css, "#workspaces button", "border-radius", f"{p2['radius']}px")
-                css = css_set_property(css, "#workspaces button.active", "background-color", rgba_css(pA["bg_hex"], pA["alpha"]))
-                css = css_set_property(css, "#workspaces button.active", "border-radius", f"{pA['radius']}px")
-                css = css_set_property(css, "#workspaces button", "color", p3["text_hex"])
-            elif isinstance(row, ModuleStyleRow):
-                sel = module_to_selector(key)
-                p = row.get_style_payload()
-                css = css_set_property(css, sel, "background-color", rgba_css(p["bg_hex"], p["alpha"]))
-                css = css_set_property(css, sel, "border-radius", f"{p['radius']}px")
-                css = css_set_property(css, sel, "color", p["text_hex"])
-        try:
-            self.css_provider.load_from_data(css.encode("utf-8"))
-            display = Gdk.Display.get_default()
-            Gtk.StyleContext.add_provider_for_display(display, self.css_provider, Gtk.STYLE_PROVIDER_PRIORITY_USER)
-        except Exception:
-            pass
+        self.preview.flush()
+        self.apply_style_edits(self.collect_style_edits())
+
+    # ---------- Deshacer / rehacer ----------
+    def record_edit(self, key, before, after):
+        self.journal.record(key, before, after)
+        self.update_undo_buttons()
+        if key[0] == "module":
+            self.refresh_mock_bar()
+
+    def update_undo_buttons(self):
+        if self.undo_btn is not None:
+            self.undo_btn.set_sensitive(bool(self.journal.undo_stack))
+            self.redo_btn.set_sensitive(bool(self.journal.redo_stack))
+
+    def undo(self, *_):
+        self.replay_journal(self.journal.undo())
+
+    def redo(self, *_):
+        self.replay_journal(self.journal.redo())
+
+    def replay_journal(self, entries):
+        """Put journal values back into the items; one preview flush for the whole step."""
+        if entries is None:
+            return
+        with self.preview.batch():
+            for (kind, name), values in entries:
+                if kind == "module":
+                    item = self.module_items.get(name)
+                    if item is None:
+                        continue
+                    item.active = values[("active",)]
+                    item.dirty = True
+                    if item.row is not None:
+                        item.row.bind(item)
+                    continue
+                item = self.style_items.get(name)
+                if item is None:
+                    continue
+                item.state = item.snapshot()
+                apply_delta(item.state, values)
+                item.dirty = True
+                if item.row is not None:
+                    item.row.bind(item)
+                for p in item.payloads():
+                    self.on_live_style_change(p)
+        self.update_undo_buttons()
+        self.refresh_mock_bar()
 
     # ---------- Guardar ----------
-    def on_save_clicked(self, _btn):
+    @PROFILER.timed
+    def on_save_clicked(self, _btn, then=None):
+        """Collect zones and CSS here, write them in the I/O worker; then(changed)
+        runs on the main loop when the save succeeded."""
+        self.journal.seal()
         # 1) Módulos (preservar orden y comentar desactivados)
-        def collect_zone_text(key: str) -> str:
-            names = [n for (n, _) in self._read_modules_zone_textual(key)]
-            lines = []
-            for n in names:
-                active = self.module_switches.get(n, Gtk.Switch()).get_active()
-                item = f'"{n}"'
-                if not active:
-                    item = f"// {item}"
-                lines.append("    " + item)
-            return "[\n" + (",\n".join(lines) + ("\n" if lines else "")) + "  ]"
-
-        cfg = read_jsonc(CONFIG_JSONC)
-        dumped = json5.dumps(cfg, indent=2)
-        left_txt   = collect_zone_text("modules-left")
-        center_txt = collect_zone_text("modules-center")
-        right_txt  = collect_zone_text("modules-right")
-
-        def repl(key, arrtxt, text):
-            pat = rf'("{re.escape(key)}"\s*:\s*)\[(.*?)\]'
-            if re.search(pat, text, flags=re.S):
-                return re.sub(pat, rf"\1{arrtxt}", text, flags=re.S)
-            return text.replace("{", "{\n  " + f'"{key}": {arrtxt},' + "\n", 1)
-
-        dumped = repl("modules-left", left_txt, dumped)
-        dumped = repl("modules-center", center_txt, dumped)
-        dumped = repl("modules-right", right_txt, dumped)
-        write_text(CONFIG_JSONC, dumped)
-        self.cfg_text = read_text(CONFIG_JSONC)
+        zones = {}
+        for key in JsoncDocument.ZONES:
+            entries = []
+            for n, _active in self._read_modules_zone_textual(key):
+                item = self.module_items.get(n)
+                entries.append((n, item.active if item else False))
+            zones[key] = entries
+        bar = self.current_bar()
 
         # 2) CSS por módulo
-        css = self.css_text
-        for key, row in self.style_rows.items():
-            if key == "hyprland/workspaces" and isinstance(row, WorkspacesStyleRow):
-                p1 = row.payload_container()
-                p2 = row.payload_button()
-                pA = row.payload_active()
-                p3 = row.payload_text()
-                css = css_set_property(css, "#workspaces", "background-color", rgba_css(p1["bg_hex"], p1["alpha"]))
-                css = css_set_property(css, "#workspaces", "border-radius", f"{p1['radius']}px")
-                css = css_set_property(css, "#workspaces button", "background-color", rgba_css(p2["bg_hex"], p2["alpha"]))
-                css = css_set_property(css, "#workspaces button", "border-radius", f"{p2['radius']}px")
-                css = css_set_property(css, "#workspaces button.active", "background-color", rgba_css(pA["bg_hex"], pA["alpha"]))
-                css = css_set_property(css, "#workspaces button.active", "border-radius", f"{pA['radius']}px")
-                css = css_set_property(css, "#workspaces button", "color", p3["text_hex"])
-            elif isinstance(row, ModuleStyleRow):
-                sel = module_to_selector(key)
-                p = row.get_style_payload()
-                css = css_set_property(css, sel, "background-color", rgba_css(p["bg_hex"], p["alpha"]))
-                css = css_set_property(css, sel, "border-radius", f"{p['radius']}px")
-                css = css_set_property(css, sel, "color", p["text_hex"])
-
-        write_text(STYLE_CSS, css)
-        self.css_text = css
-        self.toast(_("Saved"))
+        self.preview.flush()
+        self.css_sheet.update(self.collect_style_edits())
+        css = self.css_sheet.serialize()
+        # Nada llega a disco (ni a Waybar) con el CSS roto
+        if any(isinstance(k, tuple) for k in self.css_errors):      # ("value", módulo, target)
+            self.toast(_("Fix the highlighted colors before saving"))
+            return
+        errors = self.validate_css(css)
+        if errors:
+            self.set_css_errors(None, errors, [selectors_at(css, l, c) for l, c, _m in errors])
+            self.toast(f"{_('CSS error, not saved')}: {self.css_error_text(css, errors)}")
+            return
+        # Ediciones que fueron a un @import (colors.css…) se guardan en ese archivo
+        imports = [(p, imp, imp.serialize()) for p, imp in self.css_sheet.imported if imp.modified]
+        for path, _imp, text in imports:
+            errors = self.validate_css(text, path)
+            if errors:
+                self.toast(f"{_('CSS error, not saved')}: {path.name} {self.css_error_text(text, errors)}")
+                return
+        dirty = [it for it in list(self.module_items.values()) + list(self.style_items.values()) if it.dirty]
+        for it in dirty:
+            it.dirty = False
+
+        def job():
+            HISTORY.record("before save")   # por si hubo ediciones externas desde el último guardado
+            written = [path for path, _imp, text in imports if write_text(path, text)]
+            if write_text(STYLE_CSS, css):
+                written.append(STYLE_CSS)
+            changed = write_zones(bar, zones)
+            parsed = changed is not None
+            changed = list(changed or [])
+            state = load_waybar_files() if changed else None
+            changed += written
+            if changed:
+                HISTORY.record("save")
+            return changed, state, parsed
+
+        def done(res, error):
+            if error is not None:
+                for it in dirty:
+                    it.dirty = True
+                self.toast(f"{_('Error saving')}: {error}")
+                return
+            changed, state, parsed = res
+            for _path, imp, _text in imports:
+                imp.modified = False
+            if state is not None:
+                self.apply_config_state(state)
+            self.css_text = css
+            if not parsed:
+                self.toast(_("config.jsonc could not be parsed; modules not saved"))
+            elif changed:
+                self.toast(f"{_('Saved')}: " + ", ".join(Path(p).name for p in changed))
+            else:
+                self.toast(_("Nothing changed"))
+            if then is not None:
+                then(changed)
+        self.io.submit(job, done)
 
     # ---------- Restaurar ----------
     def on_restore_clicked(self, _btn):
-        restore_defaults()
-        self.load_all()
-        self.refresh_modules_section()
-        self.refresh_styles_section()
-        self.apply_preview_css()
-        self.toast(_("Restored from backup"))
+        self.open_history_dialog(self.win)
+
+    def open_history_dialog(self, parent):
+        snaps = HISTORY.timeline()
+        dialog = Adw.MessageDialog.new(parent, _("History"), _("Every save is kept; pick one to go back to."))
+        rows = [f"{datetime.fromtimestamp(sn['ts']):%Y-%m-%d %H:%M:%S}  ·  {sn['label']}  ·  "
+                f"{len(sn['files'])} {_('files')}" for sn in snaps]
+        selection = Gtk.SingleSelection(model=Gtk.StringList.new(rows))
+        factory = Gtk.SignalListItemFactory()
+        factory.connect("setup", lambda _f, li: li.set_child(Gtk.Label(xalign=0)))
+        factory.connect("bind", lambda _f, li: li.get_child().set_label(li.get_item().get_string()))
+        scrolled = Gtk.ScrolledWindow(child=Gtk.ListView(model=selection, factory=factory))
+        scrolled.set_min_content_height(320); scrolled.set_min_content_width(560)
+        dialog.set_extra_child(scrolled)
+        dialog.add_response("close", _("Close"))
+        dialog.add_response("original", _("Restore original"))
+        dialog.add_response("restore", _("Restore"))
+        dialog.set_response_appearance("restore", Adw.ResponseAppearance.SUGGESTED)
+        dialog.set_response_enabled("restore", bool(snaps))
+        dialog.set_close_response("close")
+        def _resp(_d, resp):
+            if resp == "restore" and selection.get_selected() < len(snaps):
+                self.restore_snapshot(lambda: HISTORY.restore(snaps[selection.get_selected()]["id"]))
+            elif resp == "original":
+                self.restore_snapshot(restore_defaults)
+        dialog.connect("response", _resp)
+        dialog.present()
+
+    def restore_snapshot(self, restore):
+        def done(state, error):
+            if error is not None:
+                self.toast(f"{_('Error restoring')}: {error}")
+                return
+            self._apply_loaded(state, None)
+            self.toast(_("Restored from backup"))
+        self.io.submit(lambda: (restore(), load_waybar_files())[1], done)
 
     # ---------- Sidebar buttons ----------
     def on_import_clicked(self, _btn):
         dialog = Gtk.FileChooserNative.new(
             _("Import theme (.zip with config.jsonc and style.css)"),
-            None, Gtk.FileChooserAction.OPEN, _("_Import"), _("_Cancel")
+            self.win, Gtk.FileChooserAction.OPEN, _("_Import"), _("_Cancel")
         )
-        response = dialog.run()
-        if response == Gtk.ResponseType.ACCEPT:
-            try:
-                self.import_theme_zip(dialog.get_file().get_path())
-                self.toast(_("Theme imported"))
-                self.load_all()
-                self.refresh_modules_section()
-                self.refresh_styles_section()
-                self.apply_preview_css()
-            except Exception as e:
-                self.toast(f"{_('Error importing')}: {e}")
-        dialog.destroy()
+        zips = Gtk.FileFilter(); zips.set_name("Zip"); zips.add_pattern("*.zip")
+        dialog.add_filter(zips)
+        dialog.connect("response", self._on_import_response)
+        self._file_dialog = dialog
+        dialog.show()
+
+    def _on_import_response(self, dialog, response):
+        self._file_dialog = None
+        if response != Gtk.ResponseType.ACCEPT:
+            return
+        path = dialog.get_file().get_path()
+        if not self.jobs.run(_("Importing…"),
+                             lambda progress, cancel: import_theme_zip(path, progress=progress, cancel=cancel),
+                             self._on_imported):
+            self.toast(_("Another job is running"))
+
+    def _on_imported(self, changed, error):
+        if isinstance(error, JobCancelled):
+            self.toast(_("Cancelled"))
+        elif error is not None:
+            self.toast(f"{_('Error importing')}: {error}")
+        elif not changed:
+            self.toast(_("Nothing changed"))
+        else:
+            self.toast(_("Theme imported"))
+            self.load_all(before=lambda: HISTORY.record("import"))
 
     def on_export_clicked(self, _btn):
-        try:
-            out = self.export_theme_zip()
+        if not self.jobs.run(_("Exporting…"),
+                             lambda progress, cancel: export_theme_zip(progress=progress, cancel=cancel),
+                             self._on_exported):
+            self.toast(_("Another job is running"))
+
+    def _on_exported(self, out, error):
+        if isinstance(error, JobCancelled):
+            self.toast(_("Cancelled"))
+        elif error is not None:
+            self.toast(f"{_('Error exporting')}: {error}")
+        else:
             self.toast(f"{_('Exported')}: {out}")
-        except Exception as e:
-            self.toast(f"{_('Error exporting')}: {e}")
 
     def on_save_restart_clicked(self, _btn):
-        self.on_save_clicked(_btn)
-        restart_waybar()
-        self.toast(_("Waybar restarted"))
+        def saved(changed):
+            style_changed = STYLE_CSS in changed
+            config_changed = any(p != STYLE_CSS for p in changed)
+            cfg = self.cfg
+            self.io.submit(lambda: restart_waybar(config_changed, style_changed, cfg), restarted)
+        def restarted(result, _error):
+            self.toast({
+                "noop":        _("Waybar already up to date"),
+                "signaled":    _("Waybar reloaded"),
+                "unconfirmed": _("Waybar signalled, reload not confirmed yet"),
+                "respawned":   _("Waybar restarted"),
+            }.get(result, _("Could not restart Waybar")))
+        self.on_save_clicked(_btn, then=saved)
 
     # ---------- Botón HOME ----------
     def on_home_clicked(self):
-        self.load_all()
-        self.refresh_modules_section()
-        self.refresh_styles_section()
-        self.apply_preview_css()
-        self.toast(_("Manual edit mode enabled"))
+        self.load_all(then=lambda: self.toast(_("Manual edit mode enabled")))
 
     # ---------- Toast ----------
     def toast(self, msg: str):
@@ -1158,6 +2517,9 @@ class App(Adw.Application):
 
 # ===== Main =====
 if __name__ == "__main__":
+    import sys
+    if "--profile" in sys.argv[1:]:
+        PROFILER.enable()
     app = App()
     app.run([])
 
@@ -0,0 +1,2467 @@
+# Waybar Configurator – core (sin GTK)
+# Author: veitorman
+# Todo lo que no necesita ventana: rutas, lectura/escritura segura de archivos,
+# JSONC (CST + includes + multi-bar), modelo de style.css, temas, zip y recarga
+# de Waybar. Lo usan la GUI (waybar_configurator.py) y el CLI (waybar_cli.py).
+
+import colorsys
+import functools
+import hashlib
+import os
+import re
+import shutil
+import signal
+import subprocess
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+# json5, tinycss2 y zipfile se importan donde se usan (arranque rápido)
+
+# ===== Paths =====
+HOME          = Path.home()
+CFG_DIR       = HOME / ".config" / "waybar-configurator"
+LANG_DIR      = CFG_DIR / "lang"
+SETTINGS_JSON = CFG_DIR / "settings.json"
+
+WAYBAR_DIR    = HOME / ".config" / "waybar"
+CONFIG_JSONC  = WAYBAR_DIR / "config.jsonc"
+STYLE_CSS     = WAYBAR_DIR / "style.css"
+BACKUP_CONFIG = WAYBAR_DIR / "config.jsonc.backup"
+BACKUP_CSS    = WAYBAR_DIR / "style.css.backup"
+
+STORAGE_DIR        = HOME / ".local" / "share" / "waybar-configurator"
+THEMES_DIR         = STORAGE_DIR / "themes"
+USER_THEMES_DIR    = STORAGE_DIR / "user_themes"
+DEFAULT_THEME_FILE = STORAGE_DIR / "default_theme.css"
+THUMBS_DIR         = STORAGE_DIR / "thumbnails"
+THEME_INDEX_FILE   = STORAGE_DIR / "user_themes_index.json"
+HISTORY_DIR        = STORAGE_DIR / "history"
+
+def ensure_storage_dirs():
+    for d in (CFG_DIR, LANG_DIR, STORAGE_DIR, THEMES_DIR, USER_THEMES_DIR, THUMBS_DIR):
+        d.mkdir(parents=True, exist_ok=True)
+
+# ===== Profiling (opt-in: WAYBAR_CONFIGURATOR_PROFILE=1 o --profile) =====
+class Profiler:
+    """Wall time + call counts for hot paths, plus an optional cProfile session."""
+    def __init__(self):
+        self.enabled = False
+        self.stats = {}     # name -> [calls, total_s, max_s]
+        self.events = {}    # name -> count (e.g. CSS provider reloads)
+        self.cprofile = None
+
+    def enable(self):
+        if self.enabled:
+            return
+        import cProfile
+        self.enabled = True
+        self.cprofile = cProfile.Profile()
+        self.cprofile.enable()
+
+    def record(self, name: str, elapsed: float):
+        st = self.stats.setdefault(name, [0, 0.0, 0.0])
+        st[0] += 1; st[1] += elapsed; st[2] = max(st[2], elapsed)
+
+    def count(self, name: str, n: int = 1):
+        if self.enabled:
+            self.events[name] = self.events.get(name, 0) + n
+
+    def timed(self, fn):
+        name = fn.__qualname__
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - t0)
+        return wrapper
+
+    def snapshot(self) -> dict:
+        return {
+            "functions": {n: {"calls": c, "total_ms": round(t * 1000, 3), "max_ms": round(m * 1000, 3),
+                              "avg_ms": round(t * 1000 / c, 3) if c else 0.0}
+                          for n, (c, t, m) in sorted(self.stats.items(), key=lambda kv: -kv[1][1])},
+            "events": dict(sorted(self.events.items())),
+        }
+
+    def report(self) -> str:
+        snap = self.snapshot()
+        lines = [f"{'function':<40} {'calls':>6} {'total ms':>10} {'avg ms':>8} {'max ms':>8}"]
+        for n, st in snap["functions"].items():
+            lines.append(f"{n:<40} {st['calls']:>6} {st['total_ms']:>10.1f} {st['avg_ms']:>8.2f} {st['max_ms']:>8.2f}")
+        for n, c in snap["events"].items():
+            lines.append(f"{n:<40} {c:>6}")
+        return "\n".join(lines)
+
+    def dump_json(self, path: Path, extra: dict = None) -> Path:
+        data = self.snapshot()
+        if extra:
+            data.update(extra)
+        path.write_text(json.dumps(data, indent=2), "utf-8")
+        return path
+
+    def dump_pstats(self, path: Path) -> Path:
+        if self.cprofile is not None:
+            self.cprofile.dump_stats(str(path))
+        return path
+
+PROFILER = Profiler()
+if os.environ.get("WAYBAR_CONFIGURATOR_PROFILE", "") not in ("", "0"):
+    PROFILER.enable()
+
+# ===== Built-in themes (embedded CSS) =====
+# Colores arriba como @define-color: cambiar el acento es una sola línea
+BUILTIN_THEMES = {
+    "🌑 Dark Emerald": """
+@define-color bg rgba(17,24,39,0.85);
+@define-color fg #e0e0e0;
+@define-color accent rgba(2,89,57,0.95);
+#waybar { background-color: rgba(0,0,0,0.0); color: @fg; }
+#workspaces { background-color: @bg; border-radius: 14px; }
+#workspaces button { background-color: @bg; border-radius: 6px; color: #e8e8e8; }
+#workspaces button.active { background-color: @accent; border-radius: 6px; color: #ffffff; }
+#clock,#battery,#cpu,#memory,#disk,#temperature,#backlight,#network,#pulseaudio,#wireplumber,#custom-media,#mode,#idle_inhibitor,#mpd,#bluetooth,#custom-spotify,#custom-weather,#custom-screenshot_t,#custom-power,#tray,#custom-storage {
+  background-color: @bg; border-radius: 14px; color: @fg;
+}
+""",
+    "🌅 Sunrise Blue": """
+@define-color bg rgba(10,25,47,0.78);
+@define-color ws-bg rgba(10,25,47,0.85);
+@define-color fg #ffffff;
+@define-color accent rgba(255,179,71,0.95);
+#waybar { background-color: rgba(0,0,0,0.0); color: @fg; }
+#workspaces { background-color: @ws-bg; border-radius: 14px; }
+#workspaces button { background-color: @ws-bg; border-radius: 6px; color: @fg; }
+#workspaces button.active { background-color: @accent; border-radius: 6px; color: #1a1a1a; }
+#clock,#battery,#cpu,#memory,#disk,#temperature,#backlight,#network,#pulseaudio,#wireplumber,#custom-media,#mode,#idle_inhibitor,#mpd,#bluetooth,#custom-spotify,#custom-weather,#custom-screenshot_t,#custom-power,#tray,#custom-storage {
+  background-color: @bg; border-radius: 14px; color: @fg;
+}
+""",
+    "🌆 Sunset Orange": """
+@define-color bg rgba(28,27,26,0.80);
+@define-color ws-bg rgba(28,27,26,0.85);
+@define-color fg #f5f5f5;
+@define-color accent rgba(255,112,67,0.95);
+#waybar { background-color: rgba(0,0,0,0.0); color: @fg; }
+#workspaces { background-color: @ws-bg; border-radius: 14px; }
+#workspaces button { background-color: @ws-bg; border-radius: 6px; color: @fg; }
+#workspaces button.active { background-color: @accent; border-radius: 6px; color: #1a1a1a; }
+#clock,#battery,#cpu,#memory,#disk,#temperature,#backlight,#network,#pulseaudio,#wireplumber,#custom-media,#mode,#idle_inhibitor,#mpd,#bluetooth,#custom-spotify,#custom-weather,#custom-screenshot_t,#custom-power,#tray,#custom-storage {
+  background-color: @bg; border-radius: 14px; color: @fg;
+}
+""",
+    "🌸 Sakura Light": """
+@define-color bg rgba(248,241,241,0.72);
+@define-color ws-bg rgba(248,241,241,0.68);
+@define-color fg #2e2e2e;
+@define-color accent rgba(255,183,197,0.95);
+#waybar { background-color: rgba(0,0,0,0.0); color: @fg; }
+#workspaces { background-color: @ws-bg; border-radius: 14px; }
+#workspaces button { background-color: rgba(255,183,197,0.82); border-radius: 6px; color: @fg; }
+#workspaces button.active { background-color: @accent; border-radius: 6px; color: #1a1a1a; }
+#clock,#battery,#cpu,#memory,#disk,#temperature,#backlight,#network,#pulseaudio,#wireplumber,#custom-media,#mode,#idle_inhibitor,#mpd,#bluetooth,#custom-spotify,#custom-weather,#custom-screenshot_t,#custom-power,#tray,#custom-storage {
+  background-color: @bg; border-radius: 14px; color: @fg;
+}
+""",
+    "🧊 Glacier Minimal": """
+@define-color bg rgba(255,255,255,0.80);
+@define-color ws-bg rgba(232,240,248,0.80);
+@define-color fg #1e1e1e;
+@define-color accent rgba(0,122,204,0.92);
+#waybar { background-color: rgba(0,0,0,0.0); color: @fg; }
+#workspaces { background-color: @ws-bg; border-radius: 14px; }
+#workspaces button { background-color: @ws-bg; border-radius: 6px; color: @fg; }
+#workspaces button.active { background-color: @accent; border-radius: 6px; color: #ffffff; }
+#clock,#battery,#cpu,#memory,#disk,#temperature,#backlight,#network,#pulseaudio,#wireplumber,#custom-media,#mode,#idle_inhibitor,#mpd,#bluetooth,#custom-spotify,#custom-weather,#custom-screenshot_t,#custom-power,#tray,#custom-storage {
+  background-color: @bg; border-radius: 14px; color: @fg;
+}
+""",
+}
+
+# ===== File helpers =====
+def read_text(p: Path) -> str:
+    return p.read_text("utf-8") if p.exists() else ""
+
+def file_stamp(p: Path):
+    """(mtime_ns, size) or None: cheap "did it change?" key for caches."""
+    try:
+        st = p.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+# Hash de lo que hay en disco, reutilizado mientras (mtime, size) no cambie
+_DISK_HASHES = {}   # path -> ((mtime_ns, size), sha256)
+
+def _disk_hash(p: Path, size_hint: int = None):
+    try:
+        st = p.stat()
+    except OSError:
+        return None
+    if size_hint is not None and st.st_size != size_hint:
+        return None     # distinto tamaño: seguro cambió, no hace falta leer
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _DISK_HASHES.get(p)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    digest = hashlib.sha256(p.read_bytes()).hexdigest()
+    _DISK_HASHES[p] = (stamp, digest)
+    return digest
+
+def write_text(p: Path, s: str) -> bool:
+    """Atomically write `s` to `p` unless the file already holds exactly that.
+
+    Goes through temp file + fsync + rename in the same directory (symlinks,
+    e.g. from a dotfiles repo, are written through). Returns True when the file
+    actually changed.
+    """
+    p = Path(p)
+    if p.is_symlink():
+        p = p.resolve()
+    data = s.encode("utf-8")
+    digest = hashlib.sha256(data).hexdigest()
+    if _disk_hash(p, len(data)) == digest:
+        return False
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_name(f".{p.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if p.exists():
+            shutil.copymode(p, tmp)
+        os.replace(tmp, p)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    try:
+        dfd = os.open(p.parent, os.O_RDONLY)
+        try:
+            os.fsync(dfd)
+        finally:
+            os.close(dfd)
+    except OSError:
+        pass
+    st = p.stat()
+    _DISK_HASHES[p] = ((st.st_mtime_ns, st.st_size), digest)
+    return True
+
+@PROFILER.timed
+def read_jsonc(p: Path) -> dict:
+    import json5
+    try:
+        return json5.loads(read_text(p)) if p.exists() else {}
+    except Exception:
+        return {}
+
+# ===== JSONC document (CST con comentarios y formato intactos) =====
+class JsoncError(ValueError):
+    pass
+
+_JSONC_TOKEN_RE = re.compile(r"""
+    (?P<ws>[ \t\r\n\ufeff]+)
+  | (?P<line>//[^\n]*)
+  | (?P<block>/\*.*?\*/)
+  | (?P<str>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+  | (?P<punct>[{}\[\]:,])
+  | (?P<word>[^\s{}\[\]:,"'/]+)
+""", re.X | re.S)
+
+# `// "module",` (desactivado), con o sin un comentario propio detrás
+_COMMENTED_ENTRY_RE = re.compile(r'^(//\s*"([^"]+)"\s*,?)\s*(?://.*)?$')
+
+class JsoncNode:
+    __slots__ = ("kind", "start", "end", "members", "items", "comments", "token")
+    def __init__(self, kind: str, start: int):
+        self.kind = kind            # "object" | "array" | "scalar"
+        self.start = start
+        self.end = start
+        self.members = {}           # object: key -> (key_start, value node), last wins
+        self.items = []             # array: value nodes
+        self.comments = []          # array: (start, end, text) of comments inside
+        self.token = ""             # scalar: raw token text
+
+def _jsonc_scalar(raw: str):
+    if raw[0] == '"':
+        return json.loads(raw)
+    if raw in ("true", "false", "null"):
+        return {"true": True, "false": False, "null": None}[raw]
+    try:
+        return json.loads(raw)
+    except ValueError:
+        import json5
+        return json5.loads(raw)
+
+class JsoncDocument:
+    """Concrete syntax tree of a config.jsonc, built in a single tokenizer pass.
+
+    Keeps offsets for every value so edits rewrite only the touched spans;
+    the modules-left/center/right zones (including `// "module"` lines) and
+    module definition blocks are indexed per bar at parse time.
+    """
+    ZONES = ("modules-left", "modules-center", "modules-right")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = []    # (kind, start, end)
+        pos, n = 0, len(text)
+        while pos < n:
+            m = _JSONC_TOKEN_RE.match(text, pos)
+            if not m:
+                raise JsoncError(f"unexpected character at offset {pos}")
+            self.tokens.append((m.lastgroup, pos, m.end()))
+            pos = m.end()
+        self._i = 0
+        self.root = self._value() if self._peek() else None
+        if self._peek():
+            raise JsoncError(f"trailing data at offset {self._peek()[1]}")
+        if self.root is None or self.root.kind == "object":
+            self.bars = [self.root] if self.root else []
+        elif self.root.kind == "array":
+            self.bars = [it for it in self.root.items if it.kind == "object"]
+        else:
+            raise JsoncError("top level must be an object or an array of bars")
+        self._zones = [self._index_zones(bar) for bar in self.bars]
+
+    # ----- parsing -----
+    def _peek(self, collect=None):
+        while self._i < len(self.tokens):
+            kind, s, e = self.tokens[self._i]
+            if kind in ("ws", "line", "block"):
+                if collect is not None and kind != "ws":
+                    collect.append((s, e, self.text[s:e]))
+                self._i += 1
+                continue
+            return self.tokens[self._i]
+        return None
+
+    def _expect(self, punct: str):
+        tok = self._peek()
+        if not tok or self.text[tok[1]:tok[2]] != punct:
+            raise JsoncError(f"expected '{punct}' at offset {tok[1] if tok else len(self.text)}")
+        self._i += 1
+        return tok
+
+    def _value(self) -> JsoncNode:
+        tok = self._peek()
+        if tok is None:
+            raise JsoncError("unexpected end of input")
+        kind, s, e = tok
+        raw = self.text[s:e]
+        if raw == "{":
+            return self._object()
+        if raw == "[":
+            return self._array()
+        if kind not in ("str", "word"):
+            raise JsoncError(f"unexpected '{raw}' at offset {s}")
+        self._i += 1
+        node = JsoncNode("scalar", s); node.end = e; node.token = raw
+        return node
+
+    def _object(self) -> JsoncNode:
+        node = JsoncNode("object", self._expect("{")[1])
+        while True:
+            tok = self._peek()
+            if tok and self.text[tok[1]:tok[2]] == "}":
+                break
+            if not tok or tok[0] not in ("str", "word"):
+                raise JsoncError(f"expected key at offset {tok[1] if tok else len(self.text)}")
+            self._i += 1
+            raw = self.text[tok[1]:tok[2]]
+            key = _jsonc_scalar(raw) if tok[0] == "str" else raw
+            self._expect(":")
+            node.members[key] = (tok[1], self._value())
+            tok = self._peek()
+            if tok and self.text[tok[1]:tok[2]] == ",":
+                self._i += 1
+            else:
+                break
+        node.end = self._expect("}")[2]
+        return node
+
+    def _array(self) -> JsoncNode:
+        node = JsoncNode("array", self._expect("[")[1])
+        while True:
+            tok = self._peek(node.comments)
+            if tok and self.text[tok[1]:tok[2]] == "]":
+                break
+            node.items.append(self._value())
+            tok = self._peek(node.comments)
+            if tok and self.text[tok[1]:tok[2]] == ",":
+                self._i += 1
+            else:
+                break
+        node.end = self._expect("]")[2]
+        return node
+
+    # ----- index -----
+    def _index_zones(self, bar: JsoncNode) -> dict:
+        zones = {}
+        for key in self.ZONES:
+            member = bar.members.get(key)
+            if not member or member[1].kind != "array":
+                continue
+            arr = member[1]
+            entries = [(it.start, self.to_python(it), True) for it in arr.items if it.kind == "scalar"]
+            for s, _e, txt in arr.comments:
+                m = _COMMENTED_ENTRY_RE.match(txt.strip())
+                if m:
+                    entries.append((s, m.group(2), False))
+            zones[key] = [(name, active) for _s, name, active in sorted(entries, key=lambda x: x[0])
+                          if isinstance(name, str)]
+        return zones
+
+    def zone(self, key: str, bar: int = 0):
+        """[(module, active)] in file order, or None when the bar has no such array."""
+        if bar >= len(self._zones):
+            return None
+        return self._zones[bar].get(key)
+
+    def definitions(self, bar: int = 0) -> dict:
+        """Module definition blocks of a bar: name -> object node."""
+        if bar >= len(self.bars):
+            return {}
+        return {k: v for k, (_s, v) in self.bars[bar].members.items() if v.kind == "object"}
+
+    def to_python(self, node: JsoncNode = None):
+        node = node if node is not None else self.root
+        if node is None:
+            return {}
+        if node.kind == "object":
+            return {k: self.to_python(v) for k, (_s, v) in node.members.items()}
+        if node.kind == "array":
+            return [self.to_python(v) for v in node.items]
+        return _jsonc_scalar(node.token)
+
+    def edit(self) -> "JsoncEdit":
+        return JsoncEdit(self)
+
+class JsoncEdit:
+    """Batch of span replacements over a JsoncDocument; text() applies them in one pass."""
+    def __init__(self, doc: JsoncDocument):
+        self.doc = doc
+        self.spans = {}     # (start, end) -> replacement
+
+    def _line_indent(self, pos: int, default: str) -> str:
+        ls = self.doc.text.rfind("\n", 0, pos) + 1
+        prefix = self.doc.text[ls:pos]
+        return prefix if prefix.strip() == "" and ls > 0 else default
+
+    def _key_indent(self, pos: int) -> str:
+        """Leading whitespace of the line holding `pos` (a key may share it)."""
+        text = self.doc.text
+        ls = text.rfind("\n", 0, pos) + 1
+        return text[ls:pos][:len(text[ls:pos]) - len(text[ls:pos].lstrip())]
+
+    def _indent_unit(self, obj: JsoncNode, key_ind: str) -> str:
+        outer = self._key_indent(obj.start)
+        unit = key_ind[len(outer):] if key_ind.startswith(outer) else ""
+        return unit or "  "
+
+    def _member_indent(self, obj: JsoncNode) -> str:
+        first = min((ks for ks, _v in obj.members.values()), default=None)
+        if first is not None:
+            return self._line_indent(first, "  ")
+        return self._line_indent(obj.start, "") + "  "
+
+    def _put(self, pos: int, txt: str):
+        self.spans[(pos, pos)] = self.spans.get((pos, pos), "") + txt
+
+    def _insert_member(self, obj: JsoncNode, key: str, value_txt: str):
+        # Nuevo miembro justo después de "{", con el formato del objeto:
+        # en una línea `{"k": v, ...}`, si no una línea con la sangría de los demás
+        pos = obj.start + 1
+        member = f"{json.dumps(key)}: {value_txt}"
+        if obj.members and "\n" not in self.doc.text[obj.start:obj.end]:
+            self._put(pos, member + ", ")
+            return
+        ind = self._member_indent(obj)
+        prev = self.spans.get((pos, pos), "")
+        tail = "," if obj.members or prev else "\n" + ind[:-2]
+        self.spans[(pos, pos)] = f"\n{ind}{member}{tail}" + prev
+
+    def _zone_slots(self, arr: JsoncNode) -> list[dict]:
+        """Entries of a zone array with their spans: an active item runs up to
+        its comma, a disabled one is the `// "name",` part of its comment."""
+        text, slots = self.doc.text, []
+        for it in arr.items:
+            if it.kind != "scalar" or not isinstance(self.doc.to_python(it), str):
+                continue
+            m = re.compile(r"[ \t]*,").match(text, it.end)
+            slots.append({"name": self.doc.to_python(it), "active": True, "start": it.start,
+                          "end": it.end, "comma": (m.start() + len(m.group()) - 1, m.end()) if m else None})
+        for cs, _ce, txt in arr.comments:
+            m = _COMMENTED_ENTRY_RE.match(txt.rstrip())
+            if m:
+                slots.append({"name": m.group(2), "active": False, "start": cs,
+                              "end": cs + len(m.group(1)), "comma": None})
+        slots.sort(key=lambda e: e["start"])
+        for e in slots:
+            seg_end = e["comma"][1] if e["comma"] else e["end"]
+            ls = text.rfind("\n", 0, e["start"]) + 1
+            le = text.find("\n", seg_end)
+            le = len(text) if le < 0 else le
+            rest = text[seg_end:le].strip()
+            e.update(seg_end=seg_end, line=(ls, le),
+                     alone=not text[ls:e["start"]].strip() and (not rest or rest.startswith("//"))
+                     and le < arr.end - 1,
+                     note=text[seg_end:le].rstrip() if rest.startswith("//") else "")
+        return slots
+
+    def set_zone(self, key: str, entries, bar: int = 0):
+        """Update the array of `key` to [(module, active)], inactive ones as
+        `// "module",` lines. Only the entries that were added, removed or
+        toggled (and the commas around them) are rewritten; comments after an
+        item stay with it."""
+        entries = [(n, bool(a)) for n, a in entries]
+        if self.doc.zone(key, bar) == entries:
+            return
+        text = self.doc.text
+        bar_node = self.doc.bars[bar]
+        member = bar_node.members.get(key)
+        arr = member[1] if member and member[1].kind == "array" else None
+        if member:
+            key_ind = self._key_indent(member[0])
+        elif "\n" in text[bar_node.start:bar_node.end] or not bar_node.members:
+            key_ind = self._member_indent(bar_node)
+        else:
+            key_ind = self._key_indent(bar_node.start)
+        item_ind = key_ind + self._indent_unit(bar_node, key_ind)
+        def render(i, n, a, note=""):
+            if not a:
+                return f"// {json.dumps(n)},{note}"
+            later = any(a2 for _n2, a2 in entries[i + 1:])
+            return json.dumps(n) + ("," if later else "") + note
+        def whole_array():
+            if all(a for _n, a in entries) and (arr is None or "\n" not in text[arr.start:arr.end]):
+                return "[" + ", ".join(json.dumps(n) for n, _a in entries) + "]"
+            lines = [item_ind + render(i, n, a) for i, (n, a) in enumerate(entries)]
+            return "[\n" + "\n".join(lines) + "\n" + key_ind + "]" if lines else "[]"
+        if arr is None:
+            self._insert_member(bar_node, key, whole_array())
+            return
+        slots = self._zone_slots(arr)
+        if not all(e["alone"] for e in slots) or "\n" not in text[arr.start:arr.end]:
+            # En una línea (o varias entradas por línea): un `//` taparía a las
+            # siguientes, así que se reescribe con la sangría de la línea de la clave
+            self.spans[(arr.start, arr.end)] = whole_array()
+            return
+        if slots:
+            item_ind = self._key_indent(slots[0]["start"])
+
+        import difflib
+        sm = difflib.SequenceMatcher(a=[e["name"] for e in slots], b=[n for n, _a in entries], autojunk=False)
+        kept = {}           # new index -> slot
+        for tag, i1, i2, j1, j2 in sm.get_opcodes():
+            if tag == "equal":
+                for k in range(i2 - i1):
+                    kept[j1 + k] = slots[i1 + k]
+        kept_slots = {id(e) for e in kept.values()}
+        by_name = {}        # un módulo movido se lleva su comentario
+        for e in slots:
+            if id(e) not in kept_slots:
+                by_name.setdefault(e["name"], e)
+                ls, le = e["line"]
+                self.spans[(ls, min(le + 1, len(text)))] = ""
+        anchor = arr.start + 1      # dónde van las entradas nuevas: tras la anterior conservada
+        for j, (n, a) in enumerate(entries):
+            e = kept.get(j)
+            if e is None:
+                old = by_name.pop(n, None)
+                self._put(anchor, "\n" + item_ind + render(j, n, a, old["note"] if old else ""))
+                continue
+            later = any(a2 for _n2, a2 in entries[j + 1:])
+            if e["active"] and not a:
+                self.spans[(e["start"], e["seg_end"])] = render(j, n, a)
+            elif not e["active"] and a:
+                self.spans[(e["start"], e["end"])] = render(j, n, a)
+            elif a and later and not e["comma"]:
+                self._put(e["end"], ",")
+            elif a and not later and e["comma"]:
+                self.spans[e["comma"]] = ""
+            anchor = e["line"][1]
+
+    def set_value(self, key: str, value, bar: int = 0):
+        """Replace (or add) a scalar/JSON value of a bar-level key."""
+        bar_node = self.doc.bars[bar]
+        member = bar_node.members.get(key)
+        txt = json.dumps(value)
+        if member:
+            node = member[1]
+            if node.kind == "scalar" and self.doc.to_python(node) == value:
+                return
+            self.spans[(node.start, node.end)] = txt
+        else:
+            self._insert_member(bar_node, key, txt)
+
+    def changed(self) -> bool:
+        return bool(self.spans)
+
+    def text(self) -> str:
+        src = self.doc.text
+        if not self.spans:
+            return src
+        out, pos = [], 0
+        for (s, e), rep in sorted(self.spans.items()):
+            out.append(src[pos:s]); out.append(rep); pos = e
+        out.append(src[pos:])
+        return "".join(out)
+
+@functools.lru_cache(maxsize=8)
+def parse_jsonc(text: str) -> JsoncDocument:
+    """CST for a given config text; cached, so each file version is parsed once."""
+    return JsoncDocument(text)
+
+# ===== Config loader (multi-bar + include) =====
+class ConfigBar:
+    """One bar of the config with its includes merged in."""
+    def __init__(self, index: int, path: Path, doc_bar: int):
+        self.index = index
+        self.path = path            # main config file
+        self.doc_bar = doc_bar      # index of the bar inside that file
+        self.config = {}            # merged view (main file wins over includes)
+        self.sources = {}           # key -> (path, JsoncDocument, bar index) that defines it
+        self.files = []             # every file of this bar's include graph
+
+    def label(self) -> str:
+        pos = self.config.get("position", "top")
+        out = self.config.get("output")
+        if isinstance(out, list):
+            out = ", ".join(str(o) for o in out)
+        name = self.config.get("name")
+        parts = [p for p in (name, pos, out) if p]
+        return f"{self.index + 1}: " + " · ".join(str(p) for p in parts)
+
+    def zone(self, key: str):
+        src = self.sources.get(key)
+        return src[1].zone(key, src[2]) if src else None
+
+class ConfigLoader:
+    """Loads config.jsonc bars and their include graph; each file is parsed
+    only when its (mtime, size) changes and merged bars are reused while no
+    file of the graph changed."""
+    def __init__(self):
+        self._files = {}    # path -> ((mtime_ns, size), JsoncDocument | None)
+        self._merged = {}   # main path -> (stamps, [ConfigBar])
+
+    def _stamp(self, path: Path):
+        return file_stamp(path)
+
+    def document(self, path: Path):
+        path = Path(path)
+        stamp = self._stamp(path)
+        cached = self._files.get(path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        doc = None
+        if stamp is not None:
+            try:
+                doc = parse_jsonc(read_text(path))   # mismo texto => mismo CST (lru)
+            except JsoncError:
+                doc = None
+        self._files[path] = (stamp, doc)
+        return doc
+
+    def _include_paths(self, value, base: Path) -> list[Path]:
+        if isinstance(value, str):
+            value = [value]
+        out = []
+        for raw in value if isinstance(value, list) else []:
+            if isinstance(raw, str) and raw:
+                p = Path(os.path.expandvars(os.path.expanduser(raw)))
+                out.append(p if p.is_absolute() else base / p)
+        return out
+
+    def _merge(self, bar: ConfigBar, path: Path, doc: JsoncDocument, bi: int, seen: set):
+        node = doc.bars[bi]
+        own = doc.to_python(node)
+        for key, val in own.items():
+            if key not in bar.config and key != "include":
+                bar.config[key] = val
+                bar.sources[key] = (path, doc, bi)
+        for inc in self._include_paths(own.get("include"), path.parent):
+            inc = inc.resolve()
+            if inc in seen:
+                continue    # ciclo
+            seen.add(inc)
+            bar.files.append(inc)
+            idoc = self.document(inc)
+            if idoc is not None and idoc.bars:
+                self._merge(bar, inc, idoc, 0, seen)
+
+    def load(self, path: Path) -> list[ConfigBar]:
+        path = Path(path)
+        cached = self._merged.get(path)
+        if cached and all(self._stamp(f) == st for f, st in cached[0]):
+            return cached[1]
+        doc = self.document(path)
+        bars = []
+        for bi in range(len(doc.bars) if doc else 0):
+            bar = ConfigBar(len(bars), path, bi)
+            bar.files.append(path)
+            self._merge(bar, path, doc, bi, {path.resolve()})
+            bars.append(bar)
+        files = {f for b in bars for f in b.files} | {path}
+        self._merged[path] = ([(f, self._stamp(f)) for f in files], bars)
+        return bars
+
+CONFIG_LOADER = ConfigLoader()
+
+def ensure_backup():
+    """The config as found on first run becomes the first history snapshot."""
+    HISTORY.ensure_original()
+
+def restore_defaults():
+    """Go back to the first snapshot (or to the old single .backup files)."""
+    first = HISTORY.first()
+    if first is not None:
+        return HISTORY.restore(first["id"])
+    changed = []
+    for backup, target in ((BACKUP_CONFIG, CONFIG_JSONC), (BACKUP_CSS, STYLE_CSS)):
+        if backup.exists():
+            shutil.copy2(backup, target)
+            changed.append(target)
+    return changed
+
+# ===== Waybar reload =====
+class WaybarReloader:
+    """Hot-reloads a running bar with signals; respawns only as a fallback.
+
+    Waybar re-reads config + style on SIGUSR2 and, with
+    "reload_style_on_change": true, picks up style.css edits by itself.
+    `name`/`command` can point at any stand-in process that handles the same
+    signal (a script run through python/sh is matched by its file name) and
+    `proc` at a fake /proc tree, which keeps the engine testable without a
+    compositor (see tests/test_reloader.py).
+    """
+    RELOAD_SIGNAL = signal.SIGUSR2
+    INTERPRETERS = ("sh", "bash", "dash", "python", "python3")
+
+    def __init__(self, name: str = "waybar", command=("waybar",), proc=Path("/proc"),
+                 timeout: float = 3.0, poll: float = 0.02, settle: float = 0.1):
+        self.name = name
+        self.command = list(command)
+        self.proc = proc
+        self.timeout = timeout
+        self.poll = poll
+        self.settle = settle    # tiempo quieto (sin despertar) para darlo por listo
+        self.child = None
+
+    # ----- process inspection -----
+    def _state(self, pid: int):
+        try:
+            stat = (self.proc / str(pid) / "stat").read_text()
+        except OSError:
+            return None
+        return stat.rsplit(")", 1)[1].split()[0]  # comm puede tener espacios
+
+    def _matches(self, pid_dir: Path) -> bool:
+        try:
+            if (pid_dir / "comm").read_text().strip() == self.name:
+                return True
+            argv = (pid_dir / "cmdline").read_bytes().decode(errors="replace").split("\0")
+        except OSError:
+            return False
+        if Path(argv[0]).name == self.name:
+            return True
+        # `python3 fakebar.py`: el nombre es el del script, no el del intérprete
+        return (Path(argv[0]).name in self.INTERPRETERS and len(argv) > 1
+                and Path(argv[1]).name == self.name)
+
+    def _activity(self, pid: int):
+        """Context switches of all threads of `pid`: the count grows every time
+        the process wakes up, so it shows whether a signal was acted upon."""
+        task_dir = self.proc / str(pid) / "task"
+        try:
+            tasks = list(task_dir.iterdir())
+        except OSError:
+            tasks = [self.proc / str(pid)]
+        total = None
+        for task in tasks:
+            try:
+                lines = (task / "status").read_text().splitlines()
+            except OSError:
+                continue
+            for line in lines:
+                if line.startswith(("voluntary_ctxt_switches:", "nonvoluntary_ctxt_switches:")):
+                    total = (total or 0) + int(line.split(":", 1)[1])
+        return total
+
+    def _alive(self, pid: int) -> bool:
+        return self._state(pid) not in (None, "Z", "X")
+
+    def pids(self) -> list[int]:
+        out = []
+        for d in self.proc.iterdir():
+            if d.name.isdigit() and self._matches(d) and self._alive(int(d.name)):
+                out.append(int(d.name))
+        return sorted(out)
+
+    def _wait(self, cond) -> bool:
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            if cond():
+                return True
+            time.sleep(self.poll)
+        return cond()
+
+    def _ready(self, pid: int, since=None) -> bool:
+        """Wait until `pid` is idle in its main loop: sleeping, without waking
+        up for `settle` seconds and, when `since` (its _activity() before a
+        signal) is given, after having woken up at least once since then.
+        A bar that was already asleep still reads "S" right after SIGUSR2,
+        so the state alone does not say the reload happened."""
+        deadline = time.monotonic() + self.timeout
+        last, quiet_since = None, None
+        while True:
+            state = self._state(pid)
+            if state in (None, "Z", "X"):
+                return False
+            act = self._activity(pid)
+            now = time.monotonic()
+            woke = since is None or act is None or act > since
+            if state in ("S", "I") and woke and act == last:
+                quiet_since = quiet_since or now
+                if now - quiet_since >= self.settle:
+                    return True
+            else:
+                quiet_since = None
+            if now >= deadline:
+                return False
+            last = act
+            time.sleep(self.poll)
+
+    # ----- actions -----
+    def signal_reload(self, pids) -> str:
+        """Send the reload signal to every bar. Returns "signaled" once all of
+        them settled again, "unconfirmed" if they are alive but did not settle
+        within the timeout (Waybar threads can stay busy; the signal was
+        delivered anyway) and "failed" if a signal could not be sent or a bar died."""
+        before = {pid: self._activity(pid) for pid in pids}
+        for pid in pids:
+            try:
+                os.kill(pid, self.RELOAD_SIGNAL)
+            except (ProcessLookupError, PermissionError):
+                return "failed"
+        if all(self._ready(pid, before[pid]) for pid in pids):
+            return "signaled"
+        return "unconfirmed" if all(self._alive(pid) for pid in pids) else "failed"
+
+    def respawn(self, pids=()) -> bool:
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        if not self._wait(lambda: not any(self._state(p) not in (None, "Z") for p in pids)):
+            for pid in pids:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+        try:
+            child = subprocess.Popen(self.command, start_new_session=True,
+                                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                     stderr=subprocess.DEVNULL)
+        except OSError:
+            return False
+        self.child = child
+        # arrancó aunque no se asiente a tiempo: no es un fallo
+        return self._ready(child.pid) or self._alive(child.pid)
+
+    def reload(self, config_changed: bool = True, style_changed: bool = True,
+               style_autoreload: bool = False) -> str:
+        """Returns "noop", "signaled", "unconfirmed" (signal delivered, reload
+        not observed in time), "respawned" or "failed". Only respawns when no
+        bar runs, the signal cannot be sent or the bar died."""
+        if not config_changed and (not style_changed or style_autoreload):
+            return "noop"
+        pids = self.pids()
+        if not pids:
+            return "respawned" if self.respawn() else "failed"
+        result = self.signal_reload(pids)
+        if result != "failed":
+            return result
+        return "respawned" if self.respawn(self.pids()) else "failed"
+
+WAYBAR = WaybarReloader()
+
+def restart_waybar(config_changed: bool = True, style_changed: bool = True, cfg=None) -> str:
+    autoreload = bool(isinstance(cfg, dict) and cfg.get("reload_style_on_change"))
+    return WAYBAR.reload(config_changed, style_changed, autoreload)
+
+# ===== Stylesheet model =====
+# style.css se parsea una sola vez con tinycss2 y se trocea en texto literal +
+# "slots" (valores de propiedades, puntos de inserción por regla, cola del
+# archivo). Editar = cambiar un slot; serializar = un solo "".join(). Todo lo que
+# no se toca (comentarios, espacios, reglas con errores) se conserva tal cual.
+_LINE_BREAK_RE = re.compile(r"\r\n|[\r\n\f]")
+
+def _selector_key(tokens) -> str:
+    import tinycss2
+    return " ".join(tinycss2.serialize(tokens).split())
+
+def _split_selectors(prelude) -> list[str]:
+    out, cur = [], []
+    for tok in prelude:
+        if tok.type == "literal" and tok.value == ",":
+            out.append(_selector_key(cur)); cur = []
+        else:
+            cur.append(tok)
+    out.append(_selector_key(cur))
+    return [s for s in out if s]
+
+def import_path(target: str, base: Path):
+    """File of an @import target relative to `base` (None for remote URLs)."""
+    if target.startswith("file://"):
+        from urllib.parse import unquote
+        return Path(unquote(target[7:]))
+    if "://" in target:
+        return None
+    p = Path(os.path.expanduser(target))
+    return p if p.is_absolute() else Path(base) / p
+
+def absolute_imports(css: str, base: Path) -> str:
+    """`css` with relative @import targets made absolute file:// URLs, for
+    parsers that get the text without its location (GTK load_from_string)."""
+    def repl(m):
+        target = import_path(m.group(3), base)
+        if target is None or target.is_absolute() and m.group(3).startswith(("/", "file://")):
+            return m.group(0)
+        return f"{m.group(1)}{m.group(2)}{target.resolve().as_uri()}{m.group(2)}"
+    return _IMPORT_RE.sub(repl, css)
+
+_IMPORT_RE = re.compile(r"""(@import\s+(?:url\(\s*)?)(["'])([^"']+)\2""", re.I)
+
+_SIMPLE_SEL_RE = re.compile(r"::?[\w-]+(?:\([^)]*\))?|[.#][\w-]+|\[[^\]]*\]|\*|[\w-]+")
+
+def refines_selector(sel: str, base: str) -> bool:
+    """True if `sel` targets the same element as `base`, only more narrowly
+    (`#workspaces button.active` or `:hover` for `#workspaces button`,
+    `window#waybar` for `#waybar`)."""
+    s_parts, b_parts = sel.split(), base.split()
+    if sel == base or len(s_parts) != len(b_parts) or s_parts[:-1] != b_parts[:-1]:
+        return False
+    return set(_SIMPLE_SEL_RE.findall(b_parts[-1])) <= set(_SIMPLE_SEL_RE.findall(s_parts[-1]))
+
+def selectors_at(css: str, line: int, column: int = 1) -> list[str]:
+    """Selectors of the rule at a 1-based (line, column) of `css`, or [] when
+    that position is outside any rule (used to map CSS parser errors)."""
+    import tinycss2
+    hit = []
+    for node in tinycss2.parse_stylesheet(css, skip_comments=True, skip_whitespace=True):
+        if (node.source_line, node.source_column) > (line, column):
+            break
+        hit = _split_selectors(node.prelude) if node.type == "qualified-rule" else []
+    return hit
+
+class _Rule:
+    """One indexed qualified rule: prop -> slot, plus declarations added later."""
+    def __init__(self, selectors, decls=None, tail=None, inline=False, needs_semi=False, pad=""):
+        self.selectors = selectors
+        self.decls = decls or {}    # prop -> slot index (existing declarations)
+        self.added = {}             # prop -> value (appended declarations)
+        self.tail = tail            # slot index of the insertion point (None = new rule)
+        self.inline = inline
+        self.needs_semi = needs_semi
+        self.pad = pad
+
+    def render_added(self) -> str:
+        if not self.added:
+            return ""
+        sep = " " if self.inline else "\n  "
+        out = ";" if self.needs_semi else ""
+        out += "".join(f"{sep}{p}: {v};" for p, v in self.added.items())
+        return out + self.pad
+
+    def render_new(self) -> str:
+        body = "".join(f"  {p}: {v};\n" for p, v in self.added.items())
+        return f"\n{self.selectors[0]} {{\n{body}}}\n"
+
+class Stylesheet:
+    """Parsed, indexed view of a Waybar style.css that supports in-place edits."""
+    def __init__(self, text: str = ""):
+        self._chunks: list[str] = []
+        self._rules: list[_Rule] = []
+        self._by_selector: dict[str, list[_Rule]] = {}  # every rule mentioning a selector, in order
+        self._exact: dict[str, _Rule] = {}              # last rule whose whole prelude is the selector
+        self._new_rules: list[_Rule] = []
+        self._values: list[tuple] = []                  # (chunk, rule | None, prop) de cada valor, en orden
+        self._defines: dict[str, int] = {}              # @define-color name -> chunk
+        self._new_defines: dict[str, str] = {}          # @define-color añadidos (van tras los @import)
+        self._head = 0                                  # chunk donde se insertan
+        self.imports: list[str] = []                    # @import targets, in order
+        self.imported: list[tuple] = []                 # (Path, Stylesheet) resolved graph, see attach_imports
+        self._symbols = None                            # @define-color name -> Stylesheet that wins
+        self.modified = False                           # edited since it was loaded/saved
+        self._text = text
+        self._dirty = False
+        self._parse(text)
+
+    # ----- parsing -----
+    def _parse(self, text: str):
+        import tinycss2
+        starts = [0] + [m.end() for m in _LINE_BREAK_RE.finditer(text)]
+        def off(tok):
+            return starts[tok.source_line - 1] + tok.source_column - 1
+
+        nodes = tinycss2.parse_stylesheet(text, skip_comments=False, skip_whitespace=False)
+        slots = []  # (start, end, owner, kind)
+        head = 0
+        for i, node in enumerate(nodes):
+            if node.type == "at-rule" and node.lower_at_keyword == "import":
+                head = off(nodes[i + 1]) if i + 1 < len(nodes) else len(text)
+                for tok in node.prelude:
+                    if tok.type in ("string", "url"):
+                        self.imports.append(tok.value); break
+                    if tok.type == "function" and tok.lower_name == "url":
+                        args = [a for a in tok.arguments if a.type == "string"]
+                        if args:
+                            self.imports.append(args[0].value)
+                        break
+            if node.type == "at-rule" and node.lower_at_keyword == "define-color":
+                sig = [t for t in node.prelude if t.type not in ("whitespace", "comment")]
+                if len(sig) >= 2 and sig[0].type == "ident":
+                    end = off(nodes[i + 1]) if i + 1 < len(nodes) else len(text)
+                    semi = end - 1 if end > 0 and text[end - 1] == ";" else end
+                    trail = len(node.prelude)
+                    while trail > 0 and node.prelude[trail - 1].type in ("whitespace", "comment"):
+                        trail -= 1
+                    v_end = off(node.prelude[trail]) if trail < len(node.prelude) else semi
+                    slots.append((off(sig[1]), v_end, None, "@" + sig[0].value))
+            if node.type != "qualified-rule":
+                continue
+            end = off(nodes[i + 1]) if i + 1 < len(nodes) else len(text)
+            close = end - 1 if end > 0 and text[end - 1] == "}" else end
+            content = node.content
+            rule = _Rule(_split_selectors(node.prelude))
+
+            j, n = 0, len(content)
+            while j < n:
+                tok = content[j]
+                if tok.type in ("whitespace", "comment") or (tok.type == "literal" and tok.value == ";"):
+                    j += 1; continue
+                k = j
+                while k < n and not (content[k].type == "literal" and content[k].value == ";"):
+                    k += 1
+                if tok.type == "ident":
+                    c = j + 1
+                    while c < k and content[c].type in ("whitespace", "comment"):
+                        c += 1
+                    if c < k and content[c].type == "literal" and content[c].value == ":":
+                        vs = c + 1
+                        while vs < k and content[vs].type in ("whitespace", "comment"):
+                            vs += 1
+                        ve = k
+                        while ve > vs and content[ve - 1].type in ("whitespace", "comment"):
+                            ve -= 1
+                        v_start = off(content[vs]) if vs < n else close
+                        v_end = off(content[ve]) if ve < n else close
+                        slots.append((v_start, v_end, rule, tok.lower_value))
+                j = k + 1
+
+            tail_off = close
+            for idx in range(n - 1, -1, -1):
+                if content[idx].type != "whitespace":
+                    tail_off = off(content[idx + 1]) if idx + 1 < n else close
+                    break
+            sig = [t for t in content if t.type not in ("whitespace", "comment")]
+            rule.inline = not any(t.type == "whitespace" and "\n" in t.value for t in content)
+            rule.needs_semi = bool(sig) and not (sig[-1].type == "literal" and sig[-1].value == ";")
+            rule.pad = " " if rule.inline and tail_off == close else ""
+            slots.append((tail_off, tail_off, rule, None))
+            self._index_rule(rule)
+        slots.append((head, head, None, "^"))
+
+        pos = 0
+        for start, end, rule, prop in sorted(slots, key=lambda s: (s[0], s[1])):
+            self._chunks.append(text[pos:start])
+            self._chunks.append(text[start:end])
+            idx = len(self._chunks) - 1
+            if prop == "^":
+                self._head = idx
+            elif rule is None:
+                self._defines[prop[1:]] = idx
+                self._values.append((idx, None, prop))
+            elif prop is None:
+                rule.tail = idx
+            else:
+                rule.decls[prop] = idx
+                self._values.append((idx, rule, prop))
+            pos = end
+        self._chunks.append(text[pos:])
+        self._chunks.append("")  # cola: reglas nuevas
+        self._ends_nl = text.endswith("\n") or not text
+
+    def _index_rule(self, rule: _Rule):
+        self._rules.append(rule)
+        for sel in rule.selectors:
+            self._by_selector.setdefault(sel, []).append(rule)
+        if len(rule.selectors) == 1:
+            self._exact[rule.selectors[0]] = rule
+
+    # ----- queries -----
+    def _value(self, rule: _Rule, prop: str):
+        if prop in rule.added:
+            return rule.added[prop]
+        if prop in rule.decls:
+            return self._chunks[rule.decls[prop]]
+        return None
+
+    def _get_local(self, selector: str, prop: str):
+        for rule in reversed(self._by_selector.get(selector, ())):
+            val = self._value(rule, prop)
+            if val is not None:
+                return val.strip()
+        return None
+
+    def source(self, selector: str, prop: str):
+        """The sheet (this one or an @imported one) whose value of `prop` wins."""
+        selector = " ".join(selector.split())
+        for sheet in reversed(self.sheets()):
+            if sheet._get_local(selector, prop) is not None:
+                return sheet
+        return None
+
+    def get(self, selector: str, prop: str):
+        """Cascaded value of `prop` for `selector` (grouped rules and @imported
+        files included), or None."""
+        sheet = self.source(selector, prop)
+        return sheet._get_local(" ".join(selector.split()), prop) if sheet else None
+
+    def selectors(self) -> list[str]:
+        """Selectors that have a rule of their own, in first-seen order."""
+        return list(self._exact.keys())
+
+    def refinements(self, selector: str, props) -> list[tuple[str, dict]]:
+        """Rules of the graph that refine `selector` (see refines_selector) and
+        set one of `props` or its shorthand, as (selector, {prop: value}) with
+        @define-color references inlined, ready for a stand-alone provider."""
+        selector = " ".join(selector.split())
+        wanted = list(dict.fromkeys(list(props) + [p.split("-")[0] for p in props]))
+        out = []
+        for sel in dict.fromkeys(s for sh in self.sheets() for s in sh._by_selector):
+            if not refines_selector(sel, selector):
+                continue
+            vals = {p: inline_defines(self, v) for p in wanted if (v := self.get(sel, p)) is not None}
+            if vals:
+                out.append((sel, vals))
+        return out
+
+    def _define_local(self, name: str):
+        if name in self._new_defines:
+            return self._new_defines[name]
+        idx = self._defines.get(name)
+        return self._chunks[idx].strip() if idx is not None else None
+
+    def symbols(self) -> dict:
+        """@define-color name -> Stylesheet whose definition wins (the last one
+        in cascade order: imported files first, then this sheet)."""
+        if self._symbols is None:
+            table = {}
+            for sheet in self.sheets():
+                for name in list(sheet._defines) + list(sheet._new_defines):
+                    table[name] = sheet
+            self._symbols = table
+        return self._symbols
+
+    def define(self, name: str):
+        """Value of `@define-color name` (looked up through @imports), or None."""
+        owner = self.symbols().get(name)
+        return owner._define_local(name) if owner is not None else None
+
+    def defines(self) -> dict:
+        return {name: self.define(name) for name in self.symbols()}
+
+    def sheets(self) -> list:
+        """Every sheet of the graph in cascade order (imports first, this one last)."""
+        return [sheet for _path, sheet in self.imported] + [self]
+
+    def copy(self) -> "Stylesheet":
+        """Independent copy of this sheet and of the sheets it @imports."""
+        out = Stylesheet(self.serialize())
+        out.imported = [(p, Stylesheet(sheet.serialize())) for p, sheet in self.imported]
+        return out
+
+    def attach_imports(self, path: Path, cache: "StylesheetCache" = None):
+        """Resolve the @import graph below this sheet (saved at `path`).
+
+        Imported files come from `cache` and are only re-parsed when their
+        (mtime, size) changed, so re-attaching after an edit to colors.css
+        costs a stat() per file plus one parse of colors.css."""
+        cache = cache or STYLESHEETS
+        order, seen = [], {Path(path).resolve()}
+        def visit(sheet, base: Path):
+            for imp in sheet.imports:
+                target = import_path(imp, base)
+                if target is None or target.resolve() in seen or not target.is_file():
+                    continue
+                seen.add(target.resolve())
+                child = cache.load(target, imports=False)
+                visit(child, target.parent)
+                order.append((target, child))
+        visit(self, Path(path).parent)
+        self.imported = order
+        self._symbols = None
+        return self
+
+    def declarations(self):
+        """(selectors, prop, value) of every declaration in file order, then the
+        added ones; @define-color entries come as (None, "@name", value)."""
+        for idx, rule, prop in self._values:
+            yield (rule.selectors if rule else None), prop, self._chunks[idx]
+        for rule in self._rules:
+            for prop, value in rule.added.items():
+                yield rule.selectors, prop, value
+
+    # ----- edits -----
+    def set(self, selector: str, prop: str, value: str) -> bool:
+        """Set `prop` of `selector` where its value is defined: in the @imported
+        file if that file has the winning rule for exactly this selector, in
+        this sheet otherwise. Setting what the selector already gets (from a
+        grouped rule, or the color an @name reference resolves to) is a no-op.
+        (None, "@name", value) sets a @define-color, like declarations() yields it."""
+        if selector is None:
+            cur = self.define(prop[1:])
+            if cur is not None and parse_css_color(value) is not None \
+                    and resolve_color(self, cur) == parse_css_color(value):
+                return False
+            return self.set_define(prop[1:], value)
+        selector = " ".join(selector.split())
+        owner = self.source(selector, prop)
+        if owner is not None:
+            cur = owner._get_local(selector, prop)
+            if " ".join(cur.split()) == " ".join(value.split()):
+                return False
+            if _COLOR_TOKEN_RE.fullmatch(cur) and parse_css_color(value) is not None \
+                    and resolve_color(self, cur) == parse_css_color(value):
+                return False
+            rule = owner._exact.get(selector)
+            if owner is not self and rule is not None and owner._value(rule, prop) is not None:
+                return owner._set_local(selector, prop, value)
+        return self._set_local(selector, prop, value)
+
+    def set_define(self, name: str, value: str) -> bool:
+        """Change `@define-color name` in the file that defines it (new names
+        are added to this sheet, right after its @import rules)."""
+        owner = self.symbols().get(name, self)
+        if owner._define_local(name) == value:
+            return False
+        if name in owner._defines:
+            owner._chunks[owner._defines[name]] = value
+        else:
+            owner._new_defines[name] = value
+            owner._render_defines()
+            self.symbols()[name] = owner
+        owner._dirty = owner.modified = True
+        return True
+
+    def _render_defines(self):
+        # tras los @import (con salto si hay texto antes), una línea por define
+        lead = "\n" if "".join(self._chunks[:self._head]).strip() else ""
+        self._chunks[self._head] = lead + "".join(f"@define-color {n} {v};\n"
+                                                  for n, v in self._new_defines.items())
+
+    def _set_local(self, selector: str, prop: str, value: str) -> bool:
+        rule = self._exact.get(selector)
+        if rule is None:
+            rule = _Rule([selector])
+            self._new_rules.append(rule)
+            self._index_rule(rule)
+        if self._value(rule, prop) == value:
+            return False
+        if prop in rule.decls:
+            self._chunks[rule.decls[prop]] = value
+        else:
+            rule.added[prop] = value
+            if rule.tail is not None:
+                self._chunks[rule.tail] = rule.render_added()
+            else:
+                prefix = "" if self._ends_nl else "\n"
+                self._chunks[-1] = prefix + "".join(r.render_new() for r in self._new_rules)
+        self._dirty = self.modified = True
+        return True
+
+    def update(self, edits) -> int:
+        """Apply an iterable of (selector, prop, value); returns how many changed."""
+        return sum(1 for sel, prop, val in edits if self.set(sel, prop, val))
+
+    def map_values(self, fn) -> int:
+        """Rewrite every value (declarations and @define-color) as fn(prop, value)
+        in one pass; returns how many changed. Serialize once afterwards."""
+        n = 0
+        for idx, _rule, prop in self._values:
+            new = fn(prop, self._chunks[idx])
+            if new != self._chunks[idx]:
+                self._chunks[idx] = new; n += 1
+        for name, value in self._new_defines.items():
+            new = fn("@" + name, value)
+            if new != value:
+                self._new_defines[name] = new; n += 1
+        if self._new_defines:
+            self._render_defines()
+        for rule in self._rules:
+            changed = False
+            for prop, value in rule.added.items():
+                new = fn(prop, value)
+                if new != value:
+                    rule.added[prop] = new; changed = True; n += 1
+            if changed and rule.tail is not None:
+                self._chunks[rule.tail] = rule.render_added()
+        if any(r.added for r in self._new_rules):
+            prefix = "" if self._ends_nl else "\n"
+            self._chunks[-1] = prefix + "".join(r.render_new() for r in self._new_rules)
+        if n:
+            self._dirty = self.modified = True
+        return n
+
+    def serialize(self) -> str:
+        if self._dirty:
+            self._text = "".join(self._chunks)
+            self._dirty = False
+        return self._text
+
+class StylesheetCache:
+    """Parsed style sheets kept while the file's (mtime, size) does not change,
+    so a long-lived process (daemon) edits the warm model instead of re-parsing."""
+    def __init__(self):
+        self._sheets = {}   # path -> ((mtime_ns, size), Stylesheet)
+
+    def load(self, path: Path, imports: bool = True) -> "Stylesheet":
+        """Cached sheet for `path`; with `imports`, its @import graph is
+        re-attached (only imported files whose stamp changed are re-parsed).
+        A cached sheet with unsaved edits is thrown away and read again."""
+        path = Path(path)
+        stamp = file_stamp(path)
+        cached = self._sheets.get(path)
+        if cached and cached[0] == stamp and not cached[1].modified:
+            sheet = cached[1]
+        else:
+            sheet = Stylesheet(read_text(path))
+            self._sheets[path] = (stamp, sheet)
+        return sheet.attach_imports(path, self) if imports else sheet
+
+    def save(self, path: Path, sheet: "Stylesheet") -> bool:
+        path = Path(path)
+        try:
+            changed = write_text(path, sheet.serialize())
+        except Exception:
+            self._sheets.pop(path, None)
+            raise
+        sheet.modified = False
+        self._sheets[path] = (file_stamp(path), sheet)
+        return changed
+
+    def save_graph(self, path: Path, sheet: "Stylesheet") -> list:
+        """Save `sheet` and every @imported file edited through it; changed paths."""
+        changed = [p for p, imp in sheet.imported if imp.modified and self.save(p, imp)]
+        return changed + ([Path(path)] if self.save(path, sheet) else [])
+
+    def discard(self, path: Path):
+        self._sheets.pop(Path(path), None)
+
+STYLESHEETS = StylesheetCache()
+
+def style_edits(payload: dict) -> list[tuple[str, str, str]]:
+    """(selector, prop, value) edits for a style-row payload."""
+    if "define" in payload:         # entrada de la paleta: (None, "@name", color)
+        rgba = hex_to_rgb_tuple(payload["bg_hex"]) + (round(max(0.0, min(1.0, float(payload["alpha"]))), 2),)
+        return [(None, "@" + payload["define"], color_css(rgba))]
+    if payload.get("module") == "hyprland/workspaces":
+        target = payload.get("target")
+        if target == "text":
+            return [("#workspaces button", "color", payload["text_hex"])]
+        sel = {"container": "#workspaces", "button": "#workspaces button",
+               "active": "#workspaces button.active"}.get(target)
+        if not sel:
+            return []
+        return [(sel, "background-color", rgba_css(payload["bg_hex"], payload["alpha"])),
+                (sel, "border-radius", f"{payload['radius']}px")]
+    sel = module_to_selector(payload["module"])
+    return [(sel, "background-color", rgba_css(payload["bg_hex"], payload["alpha"])),
+            (sel, "border-radius", f"{payload['radius']}px"),
+            (sel, "color", payload["text_hex"])]
+
+def module_to_selector(mod: str) -> str:
+    base = mod.split("#", 1)[0]
+    if base.startswith("custom/"):
+        return "#" + base.replace("/", "-")
+    if base.startswith("hyprland/"):
+        return "#" + base.split("/", 1)[1]
+    return "#" + base
+
+def extract_css_ids(sheet: Stylesheet) -> list[str]:
+    ids = set()
+    for sel in sheet.selectors():
+        if re.fullmatch(r"#[a-zA-Z0-9_\-]+", sel):
+            ids.add(sel[1:])
+    mods = []
+    for idname in sorted(ids):
+        if idname.startswith("custom-"):
+            mods.append("custom/" + idname.split("custom-")[1])
+        elif idname in ("workspaces", "window"):
+            mods.append("hyprland/" + idname)
+        else:
+            mods.append(idname)
+    return mods
+
+# ===== Color engine =====
+# Todos los colores del tema en una pasada sobre los valores del Stylesheet
+# (hex, rgb/rgba, nombres, referencias @define-color). El parseo está
+# memoizado: un tema repite los mismos literales decenas de veces.
+_CSS_NAMED = {
+    "transparent": (0, 0, 0, 0.0), "black": (0, 0, 0, 1.0), "white": (255, 255, 255, 1.0),
+    "red": (255, 0, 0, 1.0), "green": (0, 128, 0, 1.0), "blue": (0, 0, 255, 1.0),
+    "yellow": (255, 255, 0, 1.0), "orange": (255, 165, 0, 1.0), "purple": (128, 0, 128, 1.0),
+    "gray": (128, 128, 128, 1.0), "grey": (128, 128, 128, 1.0), "silver": (192, 192, 192, 1.0),
+    "maroon": (128, 0, 0, 1.0), "olive": (128, 128, 0, 1.0), "lime": (0, 255, 0, 1.0),
+    "aqua": (0, 255, 255, 1.0), "cyan": (0, 255, 255, 1.0), "teal": (0, 128, 128, 1.0),
+    "navy": (0, 0, 128, 1.0), "fuchsia": (255, 0, 255, 1.0), "magenta": (255, 0, 255, 1.0),
+    "pink": (255, 192, 203, 1.0),
+}
+_COLOR_TOKEN_RE = re.compile(
+    r"#[0-9a-fA-F]{3,8}(?![\w-])|(?<![\w-])rgba?\([^()]*\)|@[A-Za-z_][\w-]*"
+    r"|(?<![\w#@-])(?:" + "|".join(_CSS_NAMED) + r")(?![\w-])", re.I)
+_DEFINE_REF_RE = re.compile(r"@([A-Za-z_][\w-]*)")
+_COLOR_PROP_PREFIXES = ("background", "border", "outline", "box-shadow", "text-shadow", "-gtk-icon-shadow")
+CONTRAST_MIN = 4.5      # WCAG AA, texto normal
+
+@functools.lru_cache(maxsize=4096)
+def parse_css_color(value):
+    """'#rgb[a]', '#rrggbb[aa]', 'rgb()/rgba()' or a CSS name -> (r, g, b, a) | None."""
+    v = (value or "").strip().lower()
+    if v in _CSS_NAMED:
+        return _CSS_NAMED[v]
+    if v.startswith("#"):
+        hx = v[1:]
+        if len(hx) in (3, 4):
+            hx = "".join(ch*2 for ch in hx)
+        if len(hx) not in (6, 8) or not re.fullmatch(r"[0-9a-f]+", hx):
+            return None
+        a = int(hx[6:8], 16) / 255 if len(hx) == 8 else 1.0
+        return (int(hx[0:2], 16), int(hx[2:4], 16), int(hx[4:6], 16), a)
+    m = re.fullmatch(r"rgba?\(\s*([\d.]+%?)\s*[, ]\s*([\d.]+%?)\s*[, ]\s*([\d.]+%?)\s*(?:[,/]\s*([\d.]+%?)\s*)?\)", v)
+    if not m:
+        return None
+    def chan(x, scale):
+        return float(x[:-1]) * scale / 100 if x.endswith("%") else float(x)
+    r, g, b = (max(0, min(255, round(chan(x, 255)))) for x in m.groups()[:3])
+    a = max(0.0, min(1.0, chan(m.group(4), 1.0))) if m.group(4) else 1.0
+    return (r, g, b, a)
+
+def hex_to_rgb_tuple(hx: str):
+    c = parse_css_color(hx)
+    if c is None:
+        raise ValueError(f"not a color: {hx!r}")
+    return c[:3]
+
+def rgba_css(hex_color: str, alpha: float) -> str:
+    r, g, b = hex_to_rgb_tuple(hex_color)
+    a = max(0.0, min(1.0, float(alpha)))
+    return f"rgba({r}, {g}, {b}, {a:.2f})"
+
+def color_hex(rgba) -> str:
+    return "#{:02x}{:02x}{:02x}".format(*rgba[:3])
+
+def color_css(rgba, like: str = "") -> str:
+    """Serialize like the literal it replaces: hex/names stay hex while opaque."""
+    if rgba[3] >= 1.0 and not like.lower().startswith("rgb"):
+        return color_hex(rgba)
+    return f"rgba({rgba[0]}, {rgba[1]}, {rgba[2]}, {rgba[3]:.2f})"
+
+def _color_prop(prop: str) -> bool:
+    return prop.startswith("@") or "color" in prop or prop.startswith(_COLOR_PROP_PREFIXES)
+
+def resolve_color(sheet: "Stylesheet", value, _depth: int = 0):
+    """First color in a CSS value, following @define-color references."""
+    for m in _COLOR_TOKEN_RE.finditer(value or ""):
+        tok = m.group(0)
+        if tok.startswith("@"):
+            if _depth < 8 and sheet.define(tok[1:]) is not None:
+                return resolve_color(sheet, sheet.define(tok[1:]), _depth + 1)
+            continue
+        c = parse_css_color(tok)
+        if c is not None:
+            return c
+    return None
+
+def inline_defines(sheet: "Stylesheet", value: str, _depth: int = 0) -> str:
+    """`value` with every @name replaced by its @define-color value."""
+    def repl(m):
+        tok = m.group(0)
+        val = sheet.define(tok[1:]) if tok.startswith("@") and _depth < 8 else None
+        return tok if val is None else inline_defines(sheet, val, _depth + 1)
+    return _COLOR_TOKEN_RE.sub(repl, value)
+
+def find_colors(sheet: "Stylesheet") -> list[tuple]:
+    """Every color use in the sheet and its @imports, one pass:
+    (selectors | None, prop, token, rgba); rgba is None for @name references."""
+    out = []
+    for selectors, prop, value in (d for sh in sheet.sheets() for d in sh.declarations()):
+        if not _color_prop(prop):
+            continue
+        for m in _COLOR_TOKEN_RE.finditer(value):
+            tok = m.group(0)
+            c = None if tok.startswith("@") else parse_css_color(tok)
+            if c is not None or tok.startswith("@"):
+                out.append((selectors, prop, tok, c))
+    return out
+
+@functools.lru_cache(maxsize=4096)
+def transform_color(rgba, hue: float = 0.0, saturation: float = 0.0, lightness: float = 0.0, alpha=None):
+    """Shift hue (degrees) and saturation/lightness (-1..1 in HSL); `alpha`
+    replaces the opacity of colors that are not fully transparent."""
+    r, g, b, a = rgba
+    if hue or saturation or lightness:
+        h, l, s = colorsys.rgb_to_hls(r / 255, g / 255, b / 255)
+        h = (h + hue / 360) % 1.0
+        l = max(0.0, min(1.0, l + lightness))
+        s = max(0.0, min(1.0, s + saturation))
+        r, g, b = (round(x * 255) for x in colorsys.hls_to_rgb(h, l, s))
+    if alpha is not None and a > 0:
+        a = round(max(0.0, min(1.0, float(alpha))), 2)
+    return (r, g, b, a)
+
+def recolor(sheet: "Stylesheet", hue: float = 0.0, saturation: float = 0.0,
+            lightness: float = 0.0, alpha=None) -> int:
+    """Apply one HSL/alpha transform to every color of the sheet and the files
+    it @imports (`alpha` only touches backgrounds, and the @define-color names
+    they reference) in a single pass; returns how many values changed. Fully
+    transparent colors are left alone."""
+    translucent = set()
+    if alpha is not None:
+        defines = {}
+        refs = []
+        for sh in sheet.sheets():
+            for _sel, prop, value in sh.declarations():
+                if prop.startswith("@"):
+                    defines.setdefault(prop[1:], value)
+                elif prop.startswith("background"):
+                    refs += _DEFINE_REF_RE.findall(value)
+        while refs:     # @bg -> @base -> #123: toda la cadena
+            name = refs.pop()
+            if name not in translucent:
+                translucent.add(name)
+                refs += _DEFINE_REF_RE.findall(defines.get(name, ""))
+    def rewrite(prop, value):
+        if not _color_prop(prop):
+            return value
+        a = alpha if prop.startswith("background") or prop[1:] in translucent else None
+        def repl(m):
+            tok = m.group(0)
+            c = None if tok.startswith("@") else parse_css_color(tok)
+            if c is None or c[3] == 0:
+                return tok
+            out = transform_color(c, hue, saturation, lightness, a)
+            return tok if out == c else color_css(out, tok)
+        return _COLOR_TOKEN_RE.sub(repl, value)
+    return sum(sh.map_values(rewrite) for sh in sheet.sheets())
+
+def _blend(top, bottom):
+    """`top` composited over an opaque `bottom`."""
+    a = top[3]
+    return tuple(round(t * a + b * (1 - a)) for t, b in zip(top[:3], bottom[:3])) + (1.0,)
+
+@functools.lru_cache(maxsize=1024)
+def _relative_luminance(rgb) -> float:
+    def lin(c):
+        c /= 255
+        return c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
+    r, g, b = (lin(c) for c in rgb[:3])
+    return 0.2126 * r + 0.7152 * g + 0.0722 * b
+
+def contrast_ratio(fg, bg) -> float:
+    """WCAG 2 contrast ratio (1..21) of two opaque colors."""
+    hi, lo = sorted((_relative_luminance(fg[:3]), _relative_luminance(bg[:3])), reverse=True)
+    return (hi + 0.05) / (lo + 0.05)
+
+def contrast_report(sheet: "Stylesheet", modules, backdrop=(0, 0, 0, 1.0)) -> list[dict]:
+    """Text-over-background contrast of each module (workspaces: button and
+    active button). Translucent layers are composited over the bar and
+    `backdrop` (what is behind the bar; dark by default)."""
+    def get(sel, prop):
+        c = resolve_color(sheet, sheet.get(sel, prop))
+        if c is None and prop == "background-color":
+            c = resolve_color(sheet, sheet.get(sel, "background"))
+        return c
+    bar_bg = get("window#waybar", "background-color") or get("#waybar", "background-color") or (0, 0, 0, 0.0)
+    bar_fg = get("window#waybar", "color") or get("#waybar", "color") or get("*", "color") or (255, 255, 255, 1.0)
+    behind = _blend(bar_bg, backdrop)
+    out = []
+    for name in modules:
+        if name == "hyprland/workspaces":
+            targets = [("button", WS_SELECTORS["button"]), ("active", WS_SELECTORS["active"])]
+        elif module_to_selector(name) == "#waybar":
+            continue        # la barra misma es el fondo, no un módulo
+        else:
+            targets = [(None, module_to_selector(name))]
+        for target, sel in targets:
+            bg = get(sel, "background-color") or (0, 0, 0, 0.0)
+            fg = get(sel, "color") or (get(WS_SELECTORS["text"], "color") if target else None) or bar_fg
+            if target == "active" and not get(sel, "background-color"):
+                bg = get(WS_SELECTORS["button"], "background-color") or bg
+            if target:
+                bg = _blend(bg, _blend(get(WS_SELECTORS["container"], "background-color") or (0, 0, 0, 0.0), behind))
+            else:
+                bg = _blend(bg, behind)
+            fg = _blend(fg, bg)
+            ratio = contrast_ratio(fg, bg)
+            out.append({"module": name, "target": target, "selector": sel,
+                        "fg": color_hex(fg), "bg": color_hex(bg),
+                        "ratio": round(ratio, 2), "ok": ratio >= CONTRAST_MIN})
+    return out
+
+# ===== Palette =====
+# Modo paleta: los módulos usan @name y los colores viven en unas pocas líneas
+# @define-color, así cambiar el acento (o recolorear) toca una línea y el
+# preview re-parsea una vez en vez de N reglas.
+_ACCENT_STATES = (".active", ".focused", ".urgent", ":hover", ":checked")
+
+def palette(sheet: "Stylesheet") -> dict:
+    """@define-color names of the graph whose value is a plain color -> rgba
+    (aliases and shade()/alpha()/mix() expressions are left out)."""
+    out = {}
+    for name in sheet.symbols():
+        c = parse_css_color(sheet.define(name))
+        if c is not None:
+            out[name] = c
+    return out
+
+def _palette_role(uses) -> str:
+    if all(sels and all(any(st in sel for st in _ACCENT_STATES) for sel in sels) for sels, _p, _t in uses):
+        return "accent"
+    roles = {"fg" if p == "color" else "bg" if p.startswith("background")
+             else "border" if p.startswith("border") else "color" for _s, p, _t in uses}
+    return roles.pop() if len(roles) == 1 else "color"
+
+def factor_palette(sheet: "Stylesheet", min_uses: int = 2) -> dict:
+    """Convert the sheet (and its @imports) to palette mode: every color literal
+    repeated `min_uses` times or more becomes an @name reference, named after
+    its role (bg, fg, border, accent…), and literals equal to an existing
+    @define-color use that name. New names are defined at the top of this
+    sheet; returns {name: value} of the ones added. Transparent is left as is."""
+    names = {}      # rgba -> name
+    for name, c in palette(sheet).items():
+        if c[3] > 0:
+            names.setdefault(c, name)
+    uses = {}       # rgba -> [(selectors, prop, token)]
+    for selectors, prop, tok, c in find_colors(sheet):
+        if c is not None and c[3] > 0 and not prop.startswith("@"):
+            uses.setdefault(c, []).append((selectors or [], prop, tok))
+    taken = set(sheet.symbols())
+    added = {}
+    for c, where in sorted(uses.items(), key=lambda kv: -len(kv[1])):
+        if c in names or len(where) < min_uses:
+            continue
+        role = _palette_role(where)
+        name, i = role, 2
+        while name in taken:
+            name, i = f"{role}-{i}", i + 1
+        taken.add(name)
+        names[c] = name
+        added[name] = color_css(c, where[0][2])
+    def rewrite(prop, value):
+        if prop.startswith("@") or not _color_prop(prop):
+            return value
+        def repl(m):
+            tok = m.group(0)
+            c = None if tok.startswith("@") else parse_css_color(tok)
+            return "@" + names[c] if c in names else tok
+        return _COLOR_TOKEN_RE.sub(repl, value)
+    for sh in sheet.sheets():
+        sh.map_values(rewrite)
+    for name, value in added.items():
+        sheet.set_define(name, value)
+    return added
+
+# ===== Style readers =====
+def read_bg_radius(sheet: Stylesheet, selector: str, default_hex="#111827", default_alpha=0.85, default_rad=14):
+    hh, aa = default_hex, default_alpha
+    c = resolve_color(sheet, sheet.get(selector, "background-color"))
+    if c is not None:
+        hh, aa = color_hex(c), c[3]
+    rad_val = sheet.get(selector, "border-radius") or f"{default_rad}px"
+    try: rr = int(rad_val.strip().rstrip("px"))
+    except: rr = default_rad
+    return hh, aa, rr
+
+def read_text_hex(sheet: Stylesheet, selector: str) -> str:
+    c = resolve_color(sheet, sheet.get(selector, "color"))
+    return color_hex(c) if c is not None else "#ffffff"
+
+
+WS_SELECTORS = {"container": "#workspaces", "button": "#workspaces button",
+                "active": "#workspaces button.active", "text": "#workspaces button"}
+
+def module_style_edits(sheet: Stylesheet, module: str, target: str = None, bg=None,
+                       alpha=None, radius=None, text=None) -> list[tuple[str, str, str]]:
+    """Edits setting only the given properties of a module (or workspaces part);
+    whatever is not given is taken from the current sheet."""
+    if module == "hyprland/workspaces":
+        target = target or "button"
+        sel = WS_SELECTORS[target]
+        payload = {"module": module, "target": target}
+    else:
+        sel = module_to_selector(module)
+        payload = {"module": module}
+    bg_hex, cur_alpha, cur_radius = read_bg_radius(sheet, sel)
+    payload.update(bg_hex=bg or bg_hex,
+                   alpha=cur_alpha if alpha is None else alpha,
+                   radius=cur_radius if radius is None else radius,
+                   text_hex=text or read_text_hex(sheet, sel))
+    wanted = {"background-color": bg is not None or alpha is not None,
+              "border-radius": radius is not None,
+              "color": text is not None}
+    return [e for e in style_edits(payload) if wanted.get(e[1])]
+
+# ===== Disk state =====
+@PROFILER.timed
+def load_waybar_files() -> dict:
+    """config.jsonc (all bars + includes) and style.css read and parsed.
+
+    Only touches disk and pure-Python parsers, so the GUI runs it in its I/O
+    worker thread and applies the result on the main loop.
+    """
+    cfg_text = read_text(CONFIG_JSONC)
+    bars = CONFIG_LOADER.load(CONFIG_JSONC)
+    cfg = bars[0].config if bars else read_jsonc(CONFIG_JSONC)
+    css_text = read_text(STYLE_CSS)
+    return {"cfg_text": cfg_text, "bars": bars, "cfg": cfg if isinstance(cfg, dict) else {},
+            "css_text": css_text, "sheet": Stylesheet(css_text).attach_imports(STYLE_CSS)}
+
+# ===== Themes, zones & zip (compartido por GUI y CLI) =====
+def _theme_key(name: str) -> str:
+    """'🌑 Dark Emerald' -> 'dark emerald' (sin emoji ni mayúsculas)."""
+    return " ".join(re.sub(r"[^\w\s-]", " ", name).split()).lower()
+
+def list_themes() -> list[tuple[str, str]]:
+    """[(name, 'builtin' | 'user')] in sidebar order."""
+    out = [(name, "builtin") for name in BUILTIN_THEMES]
+    out += [(p.stem, "user") for p in sorted(USER_THEMES_DIR.glob("*.css"))]
+    return out
+
+_USER_THEME_CSS = {}    # path -> ((mtime_ns, size), css): el daemon los tiene siempre a mano
+
+def _user_theme_css(p: Path) -> str:
+    stamp = file_stamp(p)
+    cached = _USER_THEME_CSS.get(p)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    css = read_text(p)
+    _USER_THEME_CSS[p] = (stamp, css)
+    return css
+
+def find_theme(name: str):
+    """CSS of a built-in or user theme; built-ins also match without emoji/case."""
+    if name in BUILTIN_THEMES:
+        return BUILTIN_THEMES[name]
+    key = _theme_key(name)
+    for label, css in BUILTIN_THEMES.items():
+        if _theme_key(label) == key:
+            return css
+    path = USER_THEMES_DIR / f"{name}.css"
+    if path.exists():
+        return _user_theme_css(path)
+    for p in USER_THEMES_DIR.glob("*.css"):
+        if _theme_key(p.stem) == key:
+            return _user_theme_css(p)
+    return None
+
+def current_zones(bar, cfg=None) -> dict:
+    """key -> [(module, active)] of the given bar (commented entries included)."""
+    zones = {}
+    for key in JsoncDocument.ZONES:
+        zone = bar.zone(key) if bar else None
+        if zone is None:
+            zone = [(name, True) for name in (cfg or {}).get(key, [])]
+        zones[key] = list(zone)     # copia: zone() devuelve la caché del documento
+    return zones
+
+def toggle_module(zones: dict, name: str, active: bool, zone: str | None = None) -> bool:
+    """Enable/disable `name` in place; enabling an unknown module appends it
+    to `zone` (modules-right by default). Returns False if there is nothing to do."""
+    target = f"modules-{zone}" if zone else None
+    for key, entries in zones.items():
+        for i, (n, was) in enumerate(entries):
+            if n != name:
+                continue
+            if target and target != key and active:
+                del entries[i]
+                zones.setdefault(target, []).append((name, True))
+                return True
+            if was == active:
+                return False
+            entries[i] = (n, active)
+            return True
+    if not active:
+        return False
+    zones.setdefault(target or "modules-right", []).append((name, True))
+    return True
+
+def write_zones(bar, zones: dict, main_path: Path = CONFIG_JSONC):
+    """Rewrite only the given zone arrays, each in the file that defines it.
+
+    zones = key -> [(module, active)]. Zones nobody defines yet go into the
+    main config file of the bar. Returns the files that actually changed, or
+    None when the config could not be parsed.
+    """
+    if bar is None:
+        if read_text(main_path).strip():
+            return None
+        main_doc, main_bi = parse_jsonc("{}\n"), 0
+    else:
+        main_doc, main_bi = CONFIG_LOADER.document(bar.path), bar.doc_bar
+    edits = {}      # path -> JsoncEdit
+    for key, entries in zones.items():
+        src = bar.sources.get(key) if bar else None
+        if src is None and not entries:
+            continue
+        path, doc, bi = src if src else (main_path if bar is None else bar.path, main_doc, main_bi)
+        edit = edits.setdefault(path, doc.edit())
+        edit.set_zone(key, entries, bar=bi)
+    return [path for path, edit in edits.items() if edit.changed() and write_text(path, edit.text())]
+
+# Límites del zip de temas: un pack con scripts e íconos entra holgado, una
+# zip bomb o un archivo gigante no
+ZIP_MAX_ENTRIES = 2000
+ZIP_MAX_FILE    = 16 * 1024 * 1024
+ZIP_MAX_TOTAL   = 64 * 1024 * 1024
+ZIP_MAX_RATIO   = 200
+_ZIP_CHUNK      = 64 * 1024
+
+class ZipError(ValueError):
+    pass
+
+class JobCancelled(Exception):
+    pass
+
+def _check_cancel(cancel):
+    if cancel is not None and cancel.is_set():
+        raise JobCancelled()
+
+def _zip_member_path(name: str):
+    """Relative Path for an archive member, or None if it could escape the target."""
+    n = name.replace("\\", "/")
+    if n.startswith("/") or re.match(r"[A-Za-z]:", n) or "\0" in n:
+        return None
+    parts = [p for p in n.split("/") if p not in ("", ".")]
+    if not parts or ".." in parts:
+        return None
+    return Path(*parts)
+
+def theme_files() -> list[tuple[Path, str]]:
+    """(path, name in zip) for config.jsonc, style.css, their includes and
+    @imports; only files inside WAYBAR_DIR are exported."""
+    paths = [CONFIG_JSONC, STYLE_CSS]
+    for bar in CONFIG_LOADER.load(CONFIG_JSONC):
+        paths += bar.files
+    if STYLE_CSS.exists():
+        paths += [p.resolve() for p, _sheet in STYLESHEETS.load(STYLE_CSS).imported]
+    out, seen = [], set()
+    root = WAYBAR_DIR.resolve()
+    for p in paths:
+        p = Path(p)
+        try:
+            arc = p.resolve().relative_to(root).as_posix() if p.is_absolute() else p.as_posix()
+        except ValueError:
+            continue
+        if arc in seen or not p.is_file():
+            continue
+        seen.add(arc)
+        out.append((p, arc))
+    return out
+
+def export_theme_zip(out: Path | None = None, progress=None, cancel=None) -> Path:
+    """Stream the theme files into a zip (written to a temp file, then renamed).
+
+    progress(done_bytes, total_bytes) is called while copying; setting the
+    `cancel` event aborts with JobCancelled and leaves no partial zip behind.
+    """
+    import zipfile
+    if out is None:
+        THEMES_DIR.mkdir(parents=True, exist_ok=True)
+        ts = datetime.now().strftime("%Y%m%d-%H%M%S")
+        out = THEMES_DIR / f"waybar-theme-{ts}.zip"
+    out = Path(out)
+    files = theme_files()
+    total, done = sum(p.stat().st_size for p, _arc in files), 0
+    tmp = out.with_name(f".{out.name}.{os.getpid()}.tmp")
+    try:
+        with zipfile.ZipFile(tmp, "w") as z:
+            for path, arc in files:
+                info = zipfile.ZipInfo.from_file(path, arc)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                with open(path, "rb") as src, z.open(info, "w") as dst:
+                    while chunk := src.read(_ZIP_CHUNK):
+                        _check_cancel(cancel)
+                        dst.write(chunk)
+                        done += len(chunk)
+                        if progress: progress(done, total)
+        os.replace(tmp, out)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return out
+
+def import_theme_zip(filepath, dest: Path = WAYBAR_DIR, progress=None, cancel=None) -> list[Path]:
+    """Extract a theme zip into `dest`; returns the files that changed.
+
+    Entries are streamed in chunks under caps on count, per-file/total size
+    and compression ratio (checked against the real bytes, not the headers).
+    Absolute paths, '..', symlinks and special files are refused. Everything is
+    staged first, so a refused or cancelled import leaves `dest` untouched.
+    Entries already on disk with the same content hash are not rewritten and
+    identical entries are extracted once.
+    """
+    import stat
+    import tempfile
+    import zipfile
+    dest = Path(dest)
+    try:
+        z = zipfile.ZipFile(filepath)
+    except zipfile.BadZipFile as e:
+        raise ZipError(str(e)) from None
+    with z:
+        infos = [i for i in z.infolist() if not i.is_dir()]
+        if len(infos) > ZIP_MAX_ENTRIES:
+            raise ZipError(f"too many entries ({len(infos)} > {ZIP_MAX_ENTRIES})")
+        total = sum(i.file_size for i in infos)
+        if total > ZIP_MAX_TOTAL:
+            raise ZipError(f"archive too large ({total} bytes > {ZIP_MAX_TOTAL})")
+        plan, names = [], set()
+        for i in infos:
+            rel = _zip_member_path(i.filename)
+            mode = i.external_attr >> 16
+            if rel is None or stat.S_IFMT(mode) not in (0, stat.S_IFREG):   # 0: zips sin permisos unix
+                raise ZipError(f"unsafe entry: {i.filename}")
+            if rel in names:
+                raise ZipError(f"duplicate entry: {i.filename}")
+            if i.file_size > ZIP_MAX_FILE:
+                raise ZipError(f"entry too large: {i.filename}")
+            if i.file_size > _ZIP_CHUNK and i.file_size > ZIP_MAX_RATIO * max(1, i.compress_size):
+                raise ZipError(f"suspicious compression ratio: {i.filename}")
+            names.add(rel)
+            plan.append((i, rel, mode & 0o777))
+
+        dest.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(prefix=".import-", dir=dest))
+        try:
+            staged, blobs, done = [], {}, 0     # blobs: sha256 -> primer archivo con ese contenido
+            for n, (i, rel, perms) in enumerate(plan):
+                h, size, tmp = hashlib.sha256(), 0, staging / str(n)
+                with z.open(i) as src, open(tmp, "wb") as out:
+                    while chunk := src.read(_ZIP_CHUNK):
+                        _check_cancel(cancel)
+                        size += len(chunk); done += len(chunk)
+                        if size > ZIP_MAX_FILE or done > ZIP_MAX_TOTAL:
+                            raise ZipError(f"entry larger than declared: {i.filename}")
+                        h.update(chunk); out.write(chunk)
+                        if progress: progress(done, total)
+                digest = h.hexdigest()
+                final = dest / rel
+                if _disk_hash(final, size) == digest:
+                    tmp.unlink()                # ya está igual en disco
+                    continue
+                if digest in blobs:
+                    tmp.unlink(); tmp = None    # se copia del primero
+                else:
+                    blobs[digest] = tmp
+                staged.append((tmp, final, digest, perms))
+            _check_cancel(cancel)
+            changed, placed = [], {}            # digest -> destino ya escrito
+            for tmp, final, digest, perms in staged:
+                final.parent.mkdir(parents=True, exist_ok=True)
+                if final.is_symlink():
+                    final = final.resolve()     # como write_text: escribir a través del link
+                # permisos: los del archivo que se pisa (o 644) + los bits de ejecución del zip
+                mode = (final.stat().st_mode & 0o777) if final.exists() else 0o644
+                if tmp is None:
+                    shutil.copyfile(placed[digest], final)
+                else:
+                    try:
+                        os.replace(tmp, final)
+                    except OSError:             # otro filesystem (link a un repo de dotfiles)
+                        shutil.copyfile(tmp, final)
+                os.chmod(final, mode | (perms & 0o111))
+                placed.setdefault(digest, final)
+                changed.append(final)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+    return changed
+
+# ===== Snapshot history =====
+# Cada guardado deja una instantánea de config.jsonc, style.css, includes e
+# @imports. Los contenidos van a objects/ab/cdef… (zlib, nombre = sha256), así un
+# archivo que no cambió no ocupa nada; snapshots.jsonl es la línea de tiempo.
+class History:
+    """Content-addressed snapshots of the Waybar files with bounded retention."""
+    def __init__(self, root: Path = HISTORY_DIR, keep_last: int = 100, keep_days: int = 30):
+        self.root = Path(root)
+        self.log = self.root / "snapshots.jsonl"
+        self.keep_last = keep_last      # las últimas N siempre se guardan
+        self.keep_days = keep_days      # y una por día (la última) de los últimos N días
+        self.snapshots = []             # oldest first
+        self.by_id = {}
+        self._stamp = False
+
+    # ----- store -----
+    def _blob(self, digest: str) -> Path:
+        return self.root / "objects" / digest[:2] / digest[2:]
+
+    def _put(self, data: bytes) -> str:
+        import zlib
+        digest = hashlib.sha256(data).hexdigest()
+        out = self._blob(digest)
+        if not out.exists():
+            out.parent.mkdir(parents=True, exist_ok=True)
+            tmp = out.with_name(f".{out.name}.{os.getpid()}.tmp")
+            tmp.write_bytes(zlib.compress(data, 6))
+            os.replace(tmp, out)
+        return digest
+
+    def blob(self, digest: str) -> bytes:
+        import zlib
+        return zlib.decompress(self._blob(digest).read_bytes())
+
+    # ----- log -----
+    def _load(self):
+        stamp = file_stamp(self.log)
+        if stamp == self._stamp:
+            return                      # otro proceso (CLI/daemon) no escribió nada nuevo
+        self._stamp = stamp
+        self.snapshots = []
+        for line in read_text(self.log).splitlines():
+            try:
+                snap = json.loads(line)
+            except ValueError:
+                continue                # línea cortada por un corte de luz
+            self.snapshots.append(snap)
+        self.by_id = {snap["id"]: snap for snap in self.snapshots}
+
+    def timeline(self) -> list[dict]:
+        """Snapshots, newest first."""
+        self._load()
+        return self.snapshots[::-1]
+
+    def first(self):
+        self._load()
+        return self.snapshots[0] if self.snapshots else None
+
+    def get(self, snap_id):
+        self._load()
+        return self.by_id.get(snap_id)
+
+    # ----- record / restore -----
+    def _capture(self, files) -> dict:
+        out = {}
+        for path, arc in files:
+            digest = _disk_hash(Path(path))
+            if digest is None:
+                continue
+            if not self._blob(digest).exists():
+                digest = self._put(Path(path).read_bytes())
+            out[arc] = digest
+        return out
+
+    def record(self, label: str, files=None):
+        """Snapshot the current files; None when nothing changed since the last one."""
+        self._load()
+        captured = self._capture(theme_files() if files is None else files)
+        if not captured or (self.snapshots and self.snapshots[-1]["files"] == captured):
+            return None
+        now = time.time()
+        snap_id = max(int(now * 1000), (self.snapshots[-1]["id"] + 1) if self.snapshots else 0)
+        snap = {"id": snap_id, "ts": now, "label": label, "files": captured}
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.log, "a", encoding="utf-8") as f:
+            f.write(json.dumps(snap, ensure_ascii=False) + "\n")
+        self.snapshots.append(snap)
+        self.by_id[snap_id] = snap
+        self._stamp = file_stamp(self.log)
+        if len(self.snapshots) > self.keep_last + self.keep_days + 20:
+            self.prune()                # amortizado: no en cada guardado
+        return snap
+
+    def ensure_original(self):
+        self._load()
+        if self.snapshots:
+            return
+        legacy = [(p, arc) for p, arc in ((BACKUP_CONFIG, "config.jsonc"), (BACKUP_CSS, "style.css")) if p.exists()]
+        if legacy:
+            self.record("original (.backup)", legacy)
+        else:
+            self.record("original")
+
+    def restore(self, snap_id) -> list[Path]:
+        """Write back every file of a snapshot (the current state is recorded first)."""
+        snap = self.get(snap_id)
+        if snap is None:
+            raise KeyError(snap_id)
+        self.record("before restore")
+        changed = []
+        for arc, digest in snap["files"].items():
+            target = WAYBAR_DIR / arc
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if write_text(target, self.blob(digest).decode("utf-8")):
+                changed.append(target)
+        self.record(f"restore: {snap['label']}")
+        return changed
+
+    # ----- retention -----
+    def prune(self) -> int:
+        """Apply keep_last/keep_days (the first snapshot is always kept) and
+        delete blobs nobody references. Returns how many snapshots were dropped."""
+        self._load()
+        if not self.snapshots:
+            return 0
+        keep = {self.snapshots[0]["id"]} | {s["id"] for s in self.snapshots[-self.keep_last:]}
+        horizon = time.time() - self.keep_days * 86400
+        per_day = {}
+        for snap in self.snapshots:
+            if snap["ts"] >= horizon:
+                per_day[datetime.fromtimestamp(snap["ts"]).date()] = snap["id"]
+        keep |= set(per_day.values())
+        kept = [s for s in self.snapshots if s["id"] in keep]
+        dropped = len(self.snapshots) - len(kept)
+        if dropped:
+            write_text(self.log, "".join(json.dumps(s, ensure_ascii=False) + "\n" for s in kept))
+            self._stamp = False
+            self._load()
+        used = {d for s in kept for d in s["files"].values()}
+        objects = self.root / "objects"
+        for sub in (objects.iterdir() if objects.is_dir() else ()):
+            for blob in sub.iterdir():
+                if sub.name + blob.name not in used and not blob.name.startswith("."):
+                    blob.unlink(missing_ok=True)
+        return dropped
+
+    def disk_usage(self) -> int:
+        return sum(f.stat().st_size for f in self.root.rglob("*") if f.is_file())
+
+HISTORY = History()
+
+# ===== Undo/redo journal =====
+def _flatten(state, prefix=()):
+    """{'active': {'alpha': .9}} -> {('active', 'alpha'): .9} (one level of nesting is enough)."""
+    if not isinstance(state, dict):
+        return {prefix: state}
+    out = {}
+    for k, v in state.items():
+        out.update(_flatten(v, prefix + (k,)))
+    return out
+
+class EditJournal:
+    """Undo/redo of in-memory edits as compact deltas.
+
+    Each step is a list of (key, {path: (old, new)}) with only the fields that
+    changed. Consecutive edits of the same key within `merge_s` seconds (a
+    spin-button drag, typing a color) merge into one step; `group()` turns
+    several keys into one step (apply-to-all).
+    """
+    def __init__(self, limit: int = 200, merge_s: float = 0.8, clock=time.monotonic):
+        self.limit = limit
+        self.merge_s = merge_s
+        self.clock = clock
+        self.undo_stack = []    # [(timestamp, [(key, delta)])]
+        self.redo_stack = []
+        self._group = None
+        self._sealed = True
+
+    def record(self, key, before, after):
+        b, a = _flatten(before), _flatten(after)
+        delta = {p: (b.get(p), a.get(p)) for p in set(b) | set(a) if b.get(p) != a.get(p)}
+        if not delta:
+            return
+        self.redo_stack.clear()
+        if self._group is not None:
+            self._group.append((key, delta))
+            return
+        now = self.clock()
+        last = self.undo_stack[-1] if self.undo_stack else None
+        if (not self._sealed and last and len(last[1]) == 1 and last[1][0][0] == key
+                and now - last[0] < self.merge_s):
+            merged = last[1][0][1]
+            for p, (old, new) in delta.items():
+                merged[p] = (merged[p][0] if p in merged else old, new)
+            for p in [p for p, (old, new) in merged.items() if old == new]:
+                del merged[p]
+            if merged:
+                self.undo_stack[-1] = (now, last[1])
+            else:
+                self.undo_stack.pop()   # volvió al valor de antes: el paso no hace falta
+            return
+        self._push([(key, delta)], now)
+
+    def _push(self, entries, now):
+        self.undo_stack.append((now, entries))
+        del self.undo_stack[:-self.limit]
+        self._sealed = False
+
+    @contextmanager
+    def group(self):
+        outer = self._group is None
+        if outer:
+            self._group = []
+        try:
+            yield
+        finally:
+            if outer:
+                entries, self._group = self._group, None
+                if entries:
+                    self._push(entries, self.clock())
+                    self._sealed = True
+
+    def seal(self):
+        """The next edit starts a new step even if it touches the same key."""
+        self._sealed = True
+
+    def _replay(self, src, dst, side):
+        if not src:
+            return None
+        ts, entries = src.pop()
+        dst.append((ts, entries))
+        self._sealed = True
+        # key -> {path: value}; al deshacer se recorre al revés
+        order = entries if side else entries[::-1]
+        return [(key, {p: vals[side] for p, vals in delta.items()}) for key, delta in order]
+
+    def undo(self):
+        return self._replay(self.undo_stack, self.redo_stack, 0)
+
+    def redo(self):
+        return self._replay(self.redo_stack, self.undo_stack, 1)
+
+    def clear(self):
+        self.undo_stack.clear(); self.redo_stack.clear()
+        self._sealed = True
+
+def apply_delta(state: dict, values: dict):
+    """Write journal values ({path: value}) back into a (nested) state dict."""
+    for path, value in values.items():
+        d = state
+        for k in path[:-1]:
+            d = d.setdefault(k, {})
+        d[path[-1]] = value
+
+# ===== Theme thumbnails =====
+# Miniatura de la barra (PNG chico) dibujada sin GTK para poder generarla en un
+# hilo: fondo, #waybar, workspaces (uno activo), reloj al centro y tres módulos a
+# la derecha; el texto se dibuja como una línea del color del texto.
+THUMB_W, THUMB_H = 240, 36
+THUMB_VERSION = "1"     # subir si cambia el dibujo (invalida la caché)
+_THUMB_BACKDROP = (59, 66, 82)
+
+def css_hash(css: str) -> str:
+    return hashlib.sha256(css.encode("utf-8")).hexdigest()
+
+def thumbnail_for_hash(digest: str) -> Path:
+    return THUMBS_DIR / f"{digest[:24]}-v{THUMB_VERSION}.png"
+
+def thumbnail_path(css: str) -> Path:
+    return thumbnail_for_hash(css_hash(css))
+
+def _fill_round_rect(px: bytearray, w: int, x0, y0, x1, y1, radius, rgba):
+    """Alpha-blend a rounded rectangle into an RGB buffer (row spans, soft edges)."""
+    r, g, b, a = rgba
+    if a <= 0 or x1 <= x0 or y1 <= y0:
+        return
+    rad = max(0.0, min(radius, (x1 - x0) / 2, (y1 - y0) / 2))
+    for y in range(int(y0), int(-(-y1 // 1))):
+        cy = y + 0.5
+        inset = 0.0
+        if rad and cy < y0 + rad:
+            dy = y0 + rad - cy
+            inset = rad - (max(0.0, rad * rad - dy * dy)) ** 0.5
+        elif rad and cy > y1 - rad:
+            dy = cy - (y1 - rad)
+            inset = rad - (max(0.0, rad * rad - dy * dy)) ** 0.5
+        lx, rx = x0 + inset, x1 - inset
+        for x in range(max(0, int(lx)), min(w, int(-(-rx // 1)))):
+            cover = min(x + 1, rx) - max(x, lx)     # cobertura horizontal (antialias)
+            if cover <= 0:
+                continue
+            k = a * min(1.0, cover)
+            i = (y * w + x) * 3
+            px[i]     = round(px[i]     + (r - px[i])     * k)
+            px[i + 1] = round(px[i + 1] + (g - px[i + 1]) * k)
+            px[i + 2] = round(px[i + 2] + (b - px[i + 2]) * k)
+
+def _png(w: int, h: int, px: bytearray) -> bytes:
+    import struct, zlib
+    raw = b"".join(b"\0" + bytes(px[y * w * 3:(y + 1) * w * 3]) for y in range(h))
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 9)) + chunk(b"IEND", b""))
+
+def render_thumbnail(css: str) -> bytes:
+    """PNG bytes of a small mock bar styled by `css`."""
+    sheet = Stylesheet(css)
+    def color(sel, prop, fallback=None):
+        for s in (sel, "#waybar", "window#waybar") if prop == "color" else (sel,):
+            c = resolve_color(sheet, sheet.get(s, prop) or (sheet.get(s, "background") if prop == "background-color" else None))
+            if c:
+                return c
+        return fallback
+    def radius(sel):
+        m = re.match(r"\s*([\d.]+)px", sheet.get(sel, "border-radius") or "")
+        return float(m.group(1)) * 0.75 if m else 0.0
+
+    w, h = THUMB_W, THUMB_H
+    px = bytearray(_THUMB_BACKDROP * (w * h))
+    bar = color("#waybar", "background-color") or color("window#waybar", "background-color")
+    if bar:
+        _fill_round_rect(px, w, 0, 0, w, h, radius("#waybar"), bar)
+    white = (255, 255, 255, 1.0)
+    def pill(x0, x1, sel, text=True, y0=6, y1=h - 6):
+        _fill_round_rect(px, w, x0, y0, x1, y1, radius(sel), color(sel, "background-color", (0, 0, 0, 0.0)))
+        if text:
+            tc = color(sel, "color", white)
+            mid = (y0 + y1) / 2
+            _fill_round_rect(px, w, x0 + 6, mid - 1.5, x1 - 6, mid + 1.5, 1.5, tc)
+
+    # izquierda: workspaces (contenedor + 3 botones, el segundo activo)
+    pill(4, 74, "#workspaces", text=False)
+    for i, x in enumerate((7, 29, 51)):
+        sel = "#workspaces button.active" if i == 1 else "#workspaces button"
+        pill(x, x + 20, sel, y0=8, y1=h - 8)
+    # centro y derecha
+    pill(w / 2 - 30, w / 2 + 26, "#clock")
+    pill(w - 84, w - 60, "#cpu")
+    pill(w - 56, w - 32, "#memory")
+    pill(w - 28, w - 4, "#battery")
+    return _png(w, h, px)
+
+def theme_thumbnail(css: str) -> Path:
+    """Cached thumbnail for `css` (rendered only when its hash is new)."""
+    out = thumbnail_path(css)
+    if out.exists():
+        return out
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(f".{out.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(render_thumbnail(css))
+    os.replace(tmp, out)
+    return out
+
+# ===== User theme index =====
+# Índice persistente de USER_THEMES_DIR: solo se vuelve a leer/parsear un .css
+# cuando cambia su (mtime, size), así miles de temas abren al instante.
+_TAGS_COMMENT_RE = re.compile(r"/\*\s*tags\s*:\s*([^*]*)\*/", re.I)
+_COLOR_PROPS = ("background-color", "background", "color", "border-color")
+
+def _luma(rgb) -> float:
+    r, g, b = rgb[:3]
+    return (0.2126 * r + 0.7152 * g + 0.0722 * b) / 255
+
+def theme_metadata(css: str) -> dict:
+    """Dominant colors (by how many rules use them) and tags of a theme.
+
+    Tags come from a `/* tags: a, b */` comment plus automatic ones:
+    dark/light (module backgrounds) and transparent (#waybar background).
+    """
+    sheet = Stylesheet(css)
+    weights = {}
+    backgrounds = []
+    for sel in sheet.selectors():
+        for prop in _COLOR_PROPS:
+            c = resolve_color(sheet, sheet.get(sel, prop))
+            if not c or c[3] < 0.05:
+                continue
+            hx = color_hex(c)
+            weights[hx] = weights.get(hx, 0) + 1
+            if prop != "color" and sel not in ("#waybar", "window#waybar"):
+                backgrounds.append(c)
+    colors = sorted(weights, key=lambda hx: -weights[hx])[:4]
+    tags = []
+    for m in _TAGS_COMMENT_RE.finditer(css):
+        tags += [t.strip().lower() for t in m.group(1).split(",") if t.strip()]
+    if backgrounds:
+        tags.append("dark" if sum(_luma(c) for c in backgrounds) / len(backgrounds) < 0.5 else "light")
+    bar = resolve_color(sheet, sheet.get("#waybar", "background-color") or sheet.get("window#waybar", "background-color"))
+    if bar is None or bar[3] < 0.1:
+        tags.append("transparent")
+    return {"colors": colors, "tags": list(dict.fromkeys(tags))}
+
+class ThemeIndex:
+    """name -> {file, hash, mtime_ns, size, colors, tags} for the user themes."""
+    VERSION = 1
+
+    def __init__(self, folder: Path = USER_THEMES_DIR, path: Path = THEME_INDEX_FILE):
+        self.folder = Path(folder)
+        self.path = Path(path)
+        self.entries = {}
+        self._loaded = False
+
+    def _load(self):
+        self._loaded = True
+        try:
+            data = json.loads(read_text(self.path) or "{}")
+        except ValueError:
+            data = {}
+        if data.get("version") == self.VERSION:
+            self.entries = data.get("themes", {})
+
+    def update(self) -> bool:
+        """Re-scan the folder; only new or modified files are read. True if anything changed."""
+        if not self._loaded:
+            self._load()
+        entries = dict(self.entries)   # se reemplaza al final: lectores en otro hilo ven uno u otro
+        seen, changed = set(), False
+        try:
+            files = [e for e in os.scandir(self.folder) if e.name.endswith(".css") and e.is_file()]
+        except OSError:
+            files = []
+        for e in files:
+            name = e.name[:-4]
+            seen.add(name)
+            st = e.stat()
+            cur = entries.get(name)
+            if cur and cur["mtime_ns"] == st.st_mtime_ns and cur["size"] == st.st_size:
+                continue
+            try:
+                css = read_text(Path(e.path))
+                meta = theme_metadata(css)
+            except Exception:
+                css, meta = "", {"colors": [], "tags": ["broken"]}
+            entries[name] = {"file": e.name, "hash": css_hash(css), "mtime_ns": st.st_mtime_ns,
+                                  "size": st.st_size, **meta}
+            changed = True
+        for name in set(entries) - seen:
+            del entries[name]
+            changed = True
+        self.entries = entries
+        if changed:
+            write_text(self.path, json.dumps({"version": self.VERSION, "themes": entries},
+                                             ensure_ascii=False, separators=(",", ":")))
+        return changed
+
+    def load(self):
+        """Entries from the persisted index only (no folder scan)."""
+        if not self._loaded:
+            self._load()
+        return self.entries
+
+    def tags(self) -> list[str]:
+        return sorted({t for e in self.entries.values() for t in e["tags"]})
+
+    def search(self, query: str = "", tag: str = None) -> list[str]:
+        """Theme names matching `query` (name or tag substring) and `tag`, sorted."""
+        q = query.strip().casefold()
+        out = []
+        for name, e in self.entries.items():     # (entries se reemplaza entero, nunca se muta)
+            if tag and tag not in e["tags"]:
+                continue
+            if q and q not in name.casefold() and not any(q in t for t in e["tags"]):
+                continue
+            out.append(name)
+        return sorted(out, key=str.casefold)
+
+    def file(self, name: str) -> Path:
+        return self.folder / self.entries[name]["file"]
+
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# Waybar Configurator – resident daemon + tiny client
+# Author: veitorman
+# `serve` keeps the parsed config.jsonc (CONFIG_LOADER), style.css
+# (STYLESHEETS) and the themes in memory and answers CLI commands over a Unix
+# socket, so theme switches from timers/workspace hooks take a few ms instead
+# of a process start + full re-parse. Everything else is the client: it only
+# imports the stdlib, sends argv to the daemon and prints the answer; with no
+# daemon running it falls back to the normal CLI in-process. Both sides parse
+# argv with waybar_cli.build_parser(), so --reload/--bar go anywhere.
+#
+#   waybar_daemon.py serve &
+#   waybar_daemon.py theme apply "Sakura Light" --reload
+#   waybar_daemon.py style clock --alpha 0.6 --bar 1 --reload
+#   waybar_daemon.py ping | stop
+
+import json
+import os
+import socket
+import sys
+
+def socket_path() -> str:
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        return os.path.join(runtime, "waybar-configurator.sock")
+    return f"/tmp/waybar-configurator-{os.getuid()}.sock"
+
+# ===== Client =====
+def request(argv: list, path: str = None, timeout: float = 5.0):
+    """Send one command to the daemon; None if no daemon is listening."""
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.settimeout(timeout)
+    try:
+        s.connect(path or socket_path())
+    except OSError:
+        s.close()
+        return None
+    with s:
+        s.sendall(json.dumps({"argv": argv, "cwd": os.getcwd()}).encode() + b"\n")
+        data = b""
+        while not data.endswith(b"\n"):
+            chunk = s.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    return json.loads(data or b'{"rc": 1, "err": "daemon closed the connection\\n"}')
+
+def client(argv: list) -> int:
+    reply = request(argv)
+    if reply is None:
+        if argv[:1] in (["ping"], ["stop"]):
+            print("waybar-configurator: daemon not running", file=sys.stderr)
+            return 1
+        import waybar_cli
+        return waybar_cli.main(argv)
+    sys.stdout.write(reply.get("out", ""))
+    sys.stderr.write(reply.get("err", ""))
+    return reply.get("rc", 1)
+
+# ===== Server =====
+def serve(path: str = None) -> int:
+    import contextlib
+    import io
+    import signal
+    import socketserver
+    import time
+    import waybar_cli
+    core = waybar_cli.core
+
+    path = path or socket_path()
+    if request(["ping"], path, timeout=0.5) is not None:
+        print(f"waybar-configurator: daemon already running on {path}", file=sys.stderr)
+        return 1
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)     # socket viejo de un daemon que murió
+
+    # Precalentar: todo lo que un comando va a necesitar queda parseado
+    core.ensure_storage_dirs()
+    core.CONFIG_LOADER.load(core.CONFIG_JSONC)
+    core.STYLESHEETS.load(core.STYLE_CSS)
+    for name, kind in core.list_themes():
+        core.find_theme(name)
+    parser = waybar_cli.build_parser()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            t0 = time.perf_counter()
+            try:
+                req = json.loads(self.rfile.readline() or b"{}")
+                argv = [str(a) for a in req.get("argv", [])]
+            except ValueError:
+                argv = None
+            out, err = io.StringIO(), io.StringIO()
+            if argv is None:
+                rc = 2; err.write("waybar-configurator: bad request\n")
+            elif argv == ["ping"]:
+                rc = 0; out.write(f"pong {os.getpid()}\n")
+            elif argv == ["stop"]:
+                rc = 0; out.write("stopping\n")
+                self.server.stopping = True
+            else:
+                cwd = os.getcwd()
+                try:
+                    os.chdir(req.get("cwd") or cwd)
+                    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+                        rc = waybar_cli.main(argv, parser)
+                except SystemExit as e:      # argparse: --help / usage errors
+                    rc = e.code if isinstance(e.code, int) else 2
+                except Exception as e:
+                    rc = 1; err.write(f"waybar-configurator: {e}\n")
+                finally:
+                    os.chdir(cwd)
+            if core.PROFILER.enabled:
+                core.PROFILER.record("daemon request", time.perf_counter() - t0)
+            self.wfile.write(json.dumps({"rc": rc, "out": out.getvalue(),
+                                         "err": err.getvalue()}).encode() + b"\n")
+
+    class Server(socketserver.UnixStreamServer):
+        stopping = False
+        timeout = 0.2       # handle_request() vuelve para mirar `stopping`
+
+    old_umask = os.umask(0o177)     # socket solo para el usuario
+    try:
+        server = Server(path, Handler)
+    finally:
+        os.umask(old_umask)
+    signal.signal(signal.SIGTERM, lambda *_: setattr(server, "stopping", True))
+    print(f"waybar-configurator daemon listening on {path}")
+    try:
+        while not server.stopping:
+            server.handle_request()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
+    return 0
+
+if __name__ == "__main__":
+    argv = sys.argv[1:]
+    sys.exit(serve() if argv[:1] == ["serve"] else client(argv))